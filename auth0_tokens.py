@@ -2,15 +2,23 @@
 """
 
 
+from collections import OrderedDict
 from functools import wraps
+import hashlib
 import json
+import logging
 from os import environ as env
+import re
+import threading
+import time
 from urllib.request import urlopen
 
 from dotenv import load_dotenv, find_dotenv
 from flask import request, _request_ctx_stack
 from jose import jwt
 
+from metrics import registry as metrics_registry
+
 ENV_FILE = find_dotenv()
 if ENV_FILE:
     load_dotenv(ENV_FILE)
@@ -18,6 +26,16 @@ AUTH0_DOMAIN = env.get("AUTH0_DOMAIN")
 API_IDENTIFIER = env.get("API_IDENTIFIER")
 ALGORITHMS = ["RS256"]
 
+# JWKS caching, all values in seconds.
+# The ttl is used only when the JWKS response has no Cache-Control max-age.
+JWKS_CACHE_TTL = int(env.get("JWKS_CACHE_TTL", 600))
+JWKS_REFRESH_AHEAD = int(env.get("JWKS_REFRESH_AHEAD", 60))
+JWKS_MIN_REFETCH_INTERVAL = int(env.get("JWKS_MIN_REFETCH_INTERVAL", 30))
+JWKS_FETCH_TIMEOUT = float(env.get("JWKS_FETCH_TIMEOUT", 5))
+
+# Max number of verified tokens to remember, 0 disables the cache.
+TOKEN_CACHE_SIZE = int(env.get("TOKEN_CACHE_SIZE", 1024))
+
 
 # Format error response and append status code.
 class AuthError(Exception):
@@ -26,10 +44,212 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+class JwksCache:
+    """Process-wide cache of the signing keys published at a JWKS url.
+
+    Keys are kept for the max-age given by the Cache-Control header of the
+    JWKS response and refreshed by a background thread shortly before they
+    expire. An unknown kid causes one refetch, since the keys may have been
+    rotated, but fetches are rate limited so that a burst of bad tokens
+    cannot stampede the identity provider. If a fetch fails the stale keys
+    continue to be served.
+    """
+
+    def __init__(self, url, default_ttl=JWKS_CACHE_TTL, refresh_ahead=JWKS_REFRESH_AHEAD,
+                 min_refetch_interval=JWKS_MIN_REFETCH_INTERVAL, fetch_timeout=JWKS_FETCH_TIMEOUT):
+        self.url = url
+        self.default_ttl = default_ttl
+        self.refresh_ahead = refresh_ahead
+        self.min_refetch_interval = min_refetch_interval
+        self.fetch_timeout = fetch_timeout
+
+        self._keys = {}  # kid -> rsa key
+        self._expires_at = 0.0
+        self._last_fetch_attempt = None
+        self._fetch_lock = threading.Lock()  # Only one fetch at a time
+        self._refresh_thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    def get_key(self, kid):
+        """Return the rsa key for the given kid, or None if there is none"""
+        now = time.monotonic()
+        key = self._keys.get(kid)
+        if key and now < self._expires_at:
+            self.hits += 1
+            if now >= self._expires_at - self.refresh_ahead:
+                self._refresh_in_background()
+            return key
+
+        # Either the keys have expired or the kid is unknown, which can
+        # mean that the keys were rotated. Refetch, subject to rate limiting.
+        self.misses += 1
+        self._fetch()
+        return self._keys.get(kid)
+
+    def stats(self):
+        """Return the cache counters as a dictionary"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'fetches': self.fetches, 'fetch_errors': self.fetch_errors,
+                'keys': len(self._keys)
+                }
+
+    def clear(self):
+        """Forget all keys and counters"""
+        with self._fetch_lock:
+            self._keys = {}
+            self._expires_at = 0.0
+            self._last_fetch_attempt = None
+            self.hits = self.misses = self.fetches = self.fetch_errors = 0
+
+    def _refresh_in_background(self):
+        thread = self._refresh_thread
+        if thread and thread.is_alive():
+            return
+        self._refresh_thread = threading.Thread(target=self._fetch, name='jwks-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def _fetch(self):
+        requested_at = time.monotonic()
+        with self._fetch_lock:
+            last = self._last_fetch_attempt
+            if last is not None:
+                if last >= requested_at:
+                    return  # Another thread fetched while we were waiting
+                if requested_at - last < self.min_refetch_interval:
+                    return  # Rate limited, keep serving what we have
+            self._last_fetch_attempt = time.monotonic()
+
+            fetch_start = time.perf_counter()
+            try:
+                jsonurl = urlopen(self.url, timeout=self.fetch_timeout)
+                jwks = json.loads(jsonurl.read())
+                max_age = self._max_age(jsonurl.headers.get('Cache-Control'))
+            except Exception as ex:
+                metrics_registry.observe('espresso_jwks_fetch_duration_seconds', time.perf_counter() - fetch_start)
+                self.fetch_errors += 1
+                logging.error(f'Failed to fetch JWKS from {self.url}, serving {len(self._keys)} cached keys')
+                logging.error(f'Exception was thrown: {str(ex)}')
+                return
+            metrics_registry.observe('espresso_jwks_fetch_duration_seconds', time.perf_counter() - fetch_start)
+
+            keys = {}
+            for key in jwks.get("keys", []):
+                if "kid" not in key:
+                    continue
+                keys[key["kid"]] = {
+                    "kty": key.get("kty"),
+                    "kid": key["kid"],
+                    "use": key.get("use"),
+                    "n": key.get("n"),
+                    "e": key.get("e")
+                }
+            if max_age is None:
+                max_age = self.default_ttl
+            # Never let a tiny max-age turn into a fetch on every request
+            max_age = max(max_age, self.min_refetch_interval, self.refresh_ahead)
+
+            self.fetches += 1
+            self._keys = keys
+            self._expires_at = time.monotonic() + max_age
+
+    @staticmethod
+    def _max_age(cache_control):
+        if not cache_control:
+            return None
+        match = re.search(r'max-age=(\d+)', cache_control)
+        if match:
+            return int(match.group(1))
+        return None
+
+
+jwks_cache = JwksCache(f"https://{AUTH0_DOMAIN}/.well-known/jwks.json")
+
+
+def scopes_from_claims(claims):
+    """Return the set of scopes granted by the claims of an access token"""
+    return frozenset((claims.get("scope") or "").split())
+
+
+class VerifiedTokenCache:
+    """Bounded LRU cache of the claims of access tokens whose signature
+    has already been verified.
+
+    Entries are keyed by a hash of the token, so the tokens themselves are
+    not kept in memory, and each entry expires at the token's exp claim.
+    Tokens without an exp claim are never cached.
+    """
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # token hash -> (exp, claims, scopes)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        """Return (claims, scopes) for a previously verified token, or None"""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            exp, claims, scopes = entry
+            if exp <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims, scopes
+
+    def put(self, token, claims):
+        """Remember the claims of a verified token and return its scopes"""
+        scopes = scopes_from_claims(claims)
+        exp = claims.get("exp")
+        if self.max_size <= 0 or not isinstance(exp, (int, float)):
+            return scopes
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (exp, claims, scopes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return scopes
+
+    def stats(self):
+        """Return the cache counters as a dictionary"""
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def clear(self):
+        """Forget all tokens and counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+verified_tokens = VerifiedTokenCache()
+
+
 def get_token_auth_header():
     """Obtains the access token from the Authorization Header
     """
-    auth = request.headers.get("Authorization", None)
+    return parse_auth_header(request.headers.get("Authorization", None))
+
+
+def parse_auth_header(auth):
+    """Obtains the access token from the value of an Authorization header
+    """
     if not auth:
         raise AuthError({"success": False,
                         "message":
@@ -62,72 +282,74 @@ def requires_scope(required_scope):
     Args:
         required_scope (str): The scope required to access the resource
     """
-    token = get_token_auth_header()
-    unverified_claims = jwt.get_unverified_claims(token)
-    if unverified_claims.get("scope"):
-        token_scopes = unverified_claims["scope"].split()
-        for token_scope in token_scopes:
-            if token_scope == required_scope:
-                return True
-    return False
+    # requires_auth has already stored the scopes of the verified token
+    token_scopes = getattr(_request_ctx_stack.top, 'current_scopes', None)
+    if token_scopes is None:
+        token = get_token_auth_header()
+        token_scopes = scopes_from_claims(jwt.get_unverified_claims(token))
+    return required_scope in token_scopes
 
 
-def requires_auth(f):
-    """Determines if the access token is valid
+def verify_token(token):
+    """Verifies the signature and claims of an access token that is not in
+    the verified token cache, and adds it. Returns (claims, scopes).
+    May fetch the JWKS, so it can block.
     """
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = get_token_auth_header()
-        jsonurl = urlopen("https://" + AUTH0_DOMAIN + "/.well-known/jwks.json")
-        jwks = json.loads(jsonurl.read())
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({"success": False,
+                        "message":
+                            "Invalid header: "
+                            "Use an RS256 signed JWT Access Token"}, 401)
+    if unverified_header["alg"] == "HS256":
+        raise AuthError({"success": False,
+                        "message":
+                            "Invalid header: "
+                            "Use an RS256 signed JWT Access Token"}, 401)
+    rsa_key = jwks_cache.get_key(unverified_header.get("kid"))
+    if rsa_key:
         try:
-            unverified_header = jwt.get_unverified_header(token)
-        except jwt.JWTError:
+            payload = jwt.decode(
+                token,
+                rsa_key,
+                algorithms=ALGORITHMS,
+                audience=API_IDENTIFIER,
+                issuer="https://" + AUTH0_DOMAIN + "/"
+            )
+        except jwt.ExpiredSignatureError:
+            raise AuthError({"success": False,
+                            "message": "Token is expired"}, 401)
+        except jwt.JWTClaimsError:
             raise AuthError({"success": False,
                             "message":
-                                "Invalid header: "
-                                "Use an RS256 signed JWT Access Token"}, 401)
-        if unverified_header["alg"] == "HS256":
+                                "Invalid claims,"
+                                " please check the audience and issuer"}, 401)
+        except Exception:
             raise AuthError({"success": False,
                             "message":
                                 "Invalid header: "
-                                "Use an RS256 signed JWT Access Token"}, 401)
-        rsa_key = {}
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
-        if rsa_key:
-            try:
-                payload = jwt.decode(
-                    token,
-                    rsa_key,
-                    algorithms=ALGORITHMS,
-                    audience=API_IDENTIFIER,
-                    issuer="https://" + AUTH0_DOMAIN + "/"
-                )
-            except jwt.ExpiredSignatureError:
-                raise AuthError({"success": False,
-                                "message": "Token is expired"}, 401)
-            except jwt.JWTClaimsError:
-                raise AuthError({"success": False,
-                                "message":
-                                    "Invalid claims,"
-                                    " please check the audience and issuer"}, 401)
-            except Exception:
-                raise AuthError({"success": False,
-                                "message":
-                                    "Invalid header: "
-                                     "Unable to parse authentication"
-                                    " token."}, 401)
-
-            _request_ctx_stack.top.current_user = payload
+                                 "Unable to parse authentication"
+                                " token."}, 401)
+
+        return payload, verified_tokens.put(token, payload)
+    raise AuthError({"success": False,
+                    "message": "Invalid header: Unable to find appropriate key"}, 401)
+
+
+def requires_auth(f):
+    """Determines if the access token is valid
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = get_token_auth_header()
+
+        # A token that has been verified before skips signature verification
+        cached = verified_tokens.get(token)
+        if cached:
+            _request_ctx_stack.top.current_user, _request_ctx_stack.top.current_scopes = cached
             return f(*args, **kwargs)
-        raise AuthError({"success": False,
-                        "message": "Invalid header: Unable to find appropriate key"}, 401)
+
+        _request_ctx_stack.top.current_user, _request_ctx_stack.top.current_scopes = verify_token(token)
+        return f(*args, **kwargs)
     return decorated
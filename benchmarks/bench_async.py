@@ -0,0 +1,248 @@
+"""Benchmark of the requests in flight that the WSGI app, served by
+gunicorn, and its ASGI variant, served by uvicorn, handle at equal memory.
+
+    $ ESPRESSO_LOADTEST_TOKEN=<access token> python3 -m benchmarks.bench_async [seconds per level]
+
+Each server is started in turn on a local port, with the database set by
+the usual ESPRESSO_DB_ variables, so point them at a database that already
+has restaurants in it. For each level of concurrency, that many requests
+are kept in flight, each client over its own keep-alive connection, and
+the requests per second, the 50th and 99th percentile latencies, the errors,
+the peak memory of all the processes of the server and the requests per
+second per MB of it are reported.
+
+uvicorn runs first. gunicorn is then given as many workers, of
+ESPRESSO_GUNICORN_THREADS threads, as fit in the peak memory uvicorn used,
+going by the memory of a single warmed up worker. Memory is the
+proportional set size of the processes, so the pages that gunicorn's
+workers share with the master, which preloads the app, are counted once.
+
+The response cache of the Flask app is disabled, since the async views do
+not use it.
+
+The token needs the read:restaurants scope, get_auth0_token.py gets one.
+"""
+
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.loadtest import PATHS, percentile
+
+CONCURRENCY_LEVELS = (10, 100, 1000, 2000)
+DURATION = 20  # Seconds per level of concurrency
+REQUEST_TIMEOUT = 30  # Seconds
+HOST = '127.0.0.1'
+PORT = 5099
+
+WARMUP_CONCURRENCY = 10
+WARMUP_DURATION = 5  # Seconds
+
+ASGI_COMMAND = ['uvicorn', 'espresso_async:app', '--host', HOST, '--port', str(PORT)]
+WSGI_COMMAND = ['gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'{HOST}:{PORT}', 'espresso:app']
+
+
+def process_memory(pid):
+    """The proportional set size of a process in bytes, its resident memory
+    with the pages it shares divided among the processes sharing them, or
+    its resident memory if the kernel does not report that
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as smaps_file:
+            for line in smaps_file:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        with open(f'/proc/{pid}/statm') as statm_file:
+            return int(statm_file.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def process_tree(pid):
+    """The pids of a process and all its descendants"""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as stat_file:
+                    # The command may contain spaces, the fields after it do not
+                    parents[int(entry)] = int(stat_file.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    tree = {pid}
+    added = True
+    while added:
+        children = {child for child, parent in parents.items() if parent in tree} - tree
+        tree |= children
+        added = bool(children)
+    return tree
+
+
+def process_tree_memory(pid):
+    """The memory in bytes of a process and all its descendants, see process_memory()"""
+    return sum(process_memory(member) for member in process_tree(pid))
+
+
+async def send_request(reader, writer, path, token):
+    """Send a GET request over a keep-alive connection and read the response.
+    Returns the status and whether the server closes the connection.
+    """
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {HOST}:{PORT}\r\nAuthorization: Bearer {token}\r\n\r\n'.encode())
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(line.lower().split(': ', 1) for line in lines[1:] if ': ' in line)
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection') == 'close'
+
+
+async def client(token, deadline, latencies, errors):
+    """Send requests until the deadline, recording the latency of each"""
+    connection = None
+    reused = False  # Whether the connection has served a request already
+    i = 0
+    while time.monotonic() < deadline:
+        path = PATHS[i % len(PATHS)]
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.wait_for(asyncio.open_connection(HOST, PORT), REQUEST_TIMEOUT)
+                reused = False
+            status, closing = await asyncio.wait_for(send_request(*connection, path, token), REQUEST_TIMEOUT)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError):
+            if connection is not None:
+                connection[1].close()
+                connection = None
+            # A keep-alive connection that the server closed is retried, as clients do
+            if not reused:
+                errors.append(path)
+                i += 1
+            continue
+        i += 1
+        reused = True
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(path)
+        if closing:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def sample_memory(pid, peak):
+    while True:
+        peak[0] = max(peak[0], process_tree_memory(pid))
+        await asyncio.sleep(0.5)
+
+
+async def run_level(pid, token, concurrency, duration, quiet=False):
+    """Keep concurrency requests in flight for duration seconds. Returns the
+    peak memory of the server.
+    """
+    latencies = []
+    errors = []
+    peak = [0]
+    sampler = asyncio.ensure_future(sample_memory(pid, peak))
+    deadline = time.monotonic() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(client(token, deadline, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+
+    if not quiet:
+        latencies.sort()
+        rate = len(latencies) / elapsed
+        peak_mb = peak[0] / 2 ** 20
+        print(f'{concurrency:>11} {rate:8.1f} {percentile(latencies, 0.50) * 1e3:8.1f} '
+              f'{percentile(latencies, 0.99) * 1e3:8.1f} {len(errors):7} {peak_mb:8.1f} {rate / peak_mb:9.2f}')
+    return peak[0]
+
+
+def wait_for_port(server, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'Server exited with status {server.returncode}')
+        try:
+            socket.create_connection((HOST, PORT), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server did not listen on port {PORT} within {timeout} s')
+
+
+def start_server(command, **env):
+    server = subprocess.Popen(command, env=dict(os.environ, ESPRESSO_RESPONSE_CACHE_ENABLED='false', **env),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(server)
+    except RuntimeError:
+        stop_server(server)
+        raise
+    return server
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait()
+
+
+def run_levels(name, command, token, duration, **env):
+    """Run every level of concurrency against a server. Returns its peak memory."""
+    print(f'{name}: {" ".join(command)}, {duration:.0f} s per level of concurrency')
+    print(f'{"concurrency":>11} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7} {"peak MB":>8} {"req/s/MB":>9}')
+    server = start_server(command, **env)
+    try:
+        loop = asyncio.get_event_loop()
+        peak = max(loop.run_until_complete(run_level(server.pid, token, concurrency, duration))
+                   for concurrency in CONCURRENCY_LEVELS)
+    finally:
+        stop_server(server)
+    print()
+    return peak
+
+
+def gunicorn_workers_within(memory, token):
+    """The number of gunicorn workers that fit in memory, going by the
+    memory of the master and of one worker warmed up by a short load
+    """
+    server = start_server(WSGI_COMMAND, ESPRESSO_GUNICORN_WORKERS='1')
+    try:
+        asyncio.get_event_loop().run_until_complete(
+            run_level(server.pid, token, WARMUP_CONCURRENCY, WARMUP_DURATION, quiet=True))
+        master = process_memory(server.pid)
+        worker = process_tree_memory(server.pid) - master
+    finally:
+        stop_server(server)
+    workers = max(1, int((memory - master) // worker))
+    print(f'gunicorn master {master / 2 ** 20:.1f} MB, worker {worker / 2 ** 20:.1f} MB: '
+          f'{workers} workers fit in the {memory / 2 ** 20:.1f} MB of uvicorn')
+    return workers
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else DURATION
+    token = os.environ.get('ESPRESSO_LOADTEST_TOKEN')
+    if not token:
+        sys.exit('Set ESPRESSO_LOADTEST_TOKEN to an access token with the read:restaurants scope')
+
+    # Each client has a connection of its own
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    asgi_peak = run_levels('asgi', ASGI_COMMAND, token, duration)
+    workers = gunicorn_workers_within(asgi_peak, token)
+    run_levels('wsgi', WSGI_COMMAND, token, duration, ESPRESSO_GUNICORN_WORKERS=str(workers))
+
+
+if __name__ == '__main__':
+    main()
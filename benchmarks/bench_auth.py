@@ -0,0 +1,48 @@
+"""Microbenchmark of the per-request overhead of requires_auth plus
+requires_scope, with and without the verified-token cache.
+
+    $ python3 -m benchmarks.bench_auth
+"""
+
+from flask import Flask
+
+import auth0_tokens
+from auth0_tokens import requires_auth, requires_scope
+from benchmarks.bench_util import LocalSigner, timed
+
+ITERATIONS = 2000
+
+
+def main():
+    app = Flask(__name__)
+    signer = LocalSigner()
+    headers = signer.auth_header('read:restaurants read:reviews')
+
+    @requires_auth
+    def view():
+        return requires_scope('read:restaurants')
+
+    def one_request():
+        with app.test_request_context('/', headers=headers):
+            assert view()
+
+    def bare_request():
+        with app.test_request_context('/', headers=headers):
+            pass
+
+    # The cost of the request context itself is subtracted out below
+    baseline = timed(bare_request, ITERATIONS)
+
+    results = {}
+    for label, cache_size in (('no token cache', 0), ('token cache', auth0_tokens.TOKEN_CACHE_SIZE)):
+        auth0_tokens.verified_tokens.clear()
+        auth0_tokens.verified_tokens.max_size = cache_size
+        one_request()  # Warm up
+        results[label] = timed(one_request, ITERATIONS) - baseline
+        print(f'{label:>16}: {results[label] * 1e6:9.1f} us of auth overhead per request')
+
+    print(f'{"speedup":>16}: {results["no token cache"] / results["token cache"]:9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Benchmark of the compression of list responses: the size and the time to
+compress a page of restaurants, serialized as jsonify serializes it, with
+gzip at each level and brotli at a range of qualities. No database is needed.
+
+    $ python3 -m benchmarks.bench_compression [number of rows]
+"""
+
+import sys
+
+from flask import Flask
+
+from benchmarks.bench_json import restaurant_rows
+from benchmarks.bench_util import bench_app, timed
+from compression import Compression, brotli
+
+ITERATIONS = 20
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    espresso = bench_app()
+    with espresso.app.app_context():
+        data = espresso.jsonify(success=True, restaurants=restaurant_rows(espresso, count), next_cursor=None,
+                                message=None, api_version=espresso.API_VERSION).get_data()
+    print(f'{count} restaurants: {len(data)} bytes uncompressed')
+
+    settings = [('gzip', 'COMPRESSION_GZIP_LEVEL', level) for level in (1, 4, 6, 9)]
+    if brotli is not None:
+        settings += [('br', 'COMPRESSION_BROTLI_QUALITY', quality) for quality in (1, 4, 6, 11)]
+    for encoding, setting, value in settings:
+        app = Flask(__name__)
+        app.config[setting] = value
+        compression = Compression(app)
+        compressed = compression.compress(data, encoding)
+        seconds = timed(lambda: compression.compress(data, encoding), ITERATIONS)
+        print(f'{encoding:>4} {value:2d}: {len(compressed):8d} bytes, {len(data) / len(compressed):5.1f}x smaller, '
+              f'{seconds * 1e3:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark of the serialization of list responses: Flask's JSON encoder,
+which uses the standard library, compared with json_backend.OrjsonEncoder.
+Each serializes the page of a list endpoint, as jsonify does, with every
+field of the given number of restaurants, and a list of as many reviews,
+whose dates take the encoders' fallback path. No database is needed.
+
+    $ python3 -m benchmarks.bench_json [number of rows]
+"""
+
+import datetime
+import sys
+
+from flask.json import JSONEncoder
+
+from benchmarks.bench_util import bench_app, timed
+from json_backend import OrjsonEncoder, orjson
+
+ITERATIONS = 5
+
+
+def restaurant_rows(espresso, count):
+    """Dictionaries like those row_to_dict makes of restaurants with every column filled in"""
+    rows = []
+    for i in range(count):
+        row = {'id': i + 1, 'name': f'Restaurant {i}', 'street': f'{i} Main St', 'suite': str(i % 100),
+               'city': 'Springfield', 'state': 'IL', 'zip_code': '62701', 'phone_num': '217-555-0100',
+               'website': f'www.restaurant{i}.com', 'email': f'info@restaurant{i}.com',
+               'date_established': '2014', 'creator': 'bench-user@example.com',
+               'rating_count': i % 50, 'avg_rating': (i % 50) / 12.5, 'version': 1 + i % 3}
+        row.update({field: i % 10 for field in espresso.RATING_HISTOGRAM_FIELDS})
+        rows.append({field: row[field] for field in espresso.RESTAURANT_FIELDS})
+    return rows
+
+
+def review_rows(count):
+    """Dictionaries like those row_to_dict makes of reviews"""
+    epoch = datetime.date(2015, 1, 1)
+    return [{'id': i + 1, 'author': f'Author {i % 5000}', 'date': epoch + datetime.timedelta(days=i % 2000),
+             'rating': 1 + i % 5, 'comment': 'Bench review comment', 'restaurant_id': 1 + i % 1000, 'version': 1}
+            for i in range(count)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    espresso = bench_app()
+    if orjson is None:
+        sys.exit('orjson is not installed, there is nothing to compare with')
+
+    payloads = {'restaurants': {'success': True, 'restaurants': restaurant_rows(espresso, count),
+                                'next_cursor': None, 'message': None, 'api_version': espresso.API_VERSION},
+                'reviews': {'success': True, 'reviews': review_rows(count),
+                            'next_cursor': None, 'message': None, 'api_version': espresso.API_VERSION}}
+
+    for name, payload in payloads.items():
+        results = {}
+        outputs = {}
+        for label, encoder in (('json', JSONEncoder), ('orjson', OrjsonEncoder)):
+            # The arguments jsonify passes, outside of debug mode
+            def encode():
+                outputs[label] = encoder(sort_keys=True, separators=(',', ':')).encode(payload)
+            encode()  # Warm up
+            results[label] = timed(encode, ITERATIONS)
+            print(f'{name} {label:>7}: {results[label] * 1e3:8.1f} ms for {count} rows, '
+                  f'{len(outputs[label]) / results[label] / 2 ** 20:6.1f} MB/s')
+        assert espresso.json.loads(outputs['json']) == espresso.json.loads(outputs['orjson'])
+        print(f'{name} speedup: {results["json"] / results["orjson"]:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
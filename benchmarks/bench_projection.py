@@ -0,0 +1,55 @@
+"""Benchmark of the restaurant list read path: hydrating Restaurant ORM
+objects and converting them with restaurant_to_dict, compared with a column
+select whose lightweight rows are mapped straight to dictionaries.
+
+    $ python3 -m benchmarks.bench_projection [number of restaurants]
+"""
+
+import sys
+import time
+
+from benchmarks.bench_util import bench_app, insert_restaurants, reset_db
+
+REPEAT = 5
+
+
+def orm_path(espresso):
+    Restaurant = espresso.Restaurant
+    return [espresso.restaurant_to_dict(rest) for rest in Restaurant.query.order_by(Restaurant.id)]
+
+
+def projection_path(espresso):
+    query = espresso.column_select(espresso.Restaurant, espresso.RESTAURANT_FIELDS).order_by(espresso.Restaurant.id)
+    return [espresso.row_to_dict(row, espresso.RESTAURANT_FIELDS) for row in espresso.db.session.execute(query)]
+
+
+def best_time(espresso, path):
+    best = None
+    for _ in range(REPEAT):
+        with espresso.app.app_context():
+            start = time.perf_counter()
+            items = path(espresso)
+            elapsed = time.perf_counter() - start
+            espresso.db.session.remove()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(items)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    espresso = bench_app()
+    reset_db(espresso)
+    insert_restaurants(espresso, count)
+
+    results = {}
+    for label, path in (('ORM objects', orm_path), ('column select', projection_path)):
+        elapsed, rows = best_time(espresso, path)
+        assert rows == count
+        results[label] = rows / elapsed
+        print(f'{label:>14}: {results[label]:12,.0f} rows/s')
+
+    print(f'{"speedup":>14}: {results["column select"] / results["ORM objects"]:12.1f}x')
+
+
+if __name__ == '__main__':
+    main()
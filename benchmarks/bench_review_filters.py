@@ -0,0 +1,79 @@
+"""Benchmark of fetching the first page of one restaurant's reviews, and of
+the review filters, with and without the review indexes.
+
+    $ python3 -m benchmarks.bench_review_filters [number of reviews]
+
+The default of 10 million reviews is meant for a scratch Postgres database
+given by ESPRESSO_BENCH_DB_URI; pass a smaller count for the SQLite default.
+"""
+
+import sys
+import time
+
+import sqlalchemy as sa
+
+from benchmarks.bench_util import bench_app, insert_restaurants, insert_reviews, reset_db
+
+RESTAURANT_COUNT = 10000
+REPEAT = 20
+
+
+def best_time(espresso, query_func):
+    best = None
+    with espresso.app.app_context():
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            query_func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        espresso.db.session.remove()
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    espresso = bench_app()
+    Review = espresso.Review
+    reset_db(espresso)
+    insert_restaurants(espresso, RESTAURANT_COUNT)
+    print(f'Inserting {count:,} reviews...')
+    insert_reviews(espresso, count, RESTAURANT_COUNT)
+
+    def page_query(*filters):
+        def run():
+            page = {'limit': espresso.DEFAULT_PAGE_SIZE, 'after': None}
+            return espresso.paginate(espresso.reviews_select(espresso.REVIEW_FIELDS, filters), Review.id, page)
+        return run
+
+    queries = {
+        'restaurant reviews': page_query(Review.restaurant_id == RESTAURANT_COUNT // 2),
+        'author reviews': page_query(Review.author == 'Author 1234'),
+        'restaurant + min rating': page_query(Review.restaurant_id == RESTAURANT_COUNT // 2, Review.rating >= 4),
+    }
+
+    with espresso.app.app_context():
+        engine = espresso.db.engine
+    indexes = list(Review.__table__.indexes)
+
+    results = {}
+    for label in ('with indexes', 'without indexes'):
+        if label == 'without indexes':
+            for index in indexes:
+                index.drop(engine)
+        with engine.connect() as conn:
+            conn.execute(sa.text('ANALYZE'))
+        for name, query_func in queries.items():
+            results[(label, name)] = best_time(espresso, query_func)
+
+    for index in indexes:
+        index.create(engine)
+
+    print(f'{"":>24} {"with indexes":>14} {"without":>14}')
+    for name in queries:
+        with_ms = results[('with indexes', name)] * 1000
+        without_ms = results[('without indexes', name)] * 1000
+        print(f'{name:>24} {with_ms:11.2f} ms {without_ms:11.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
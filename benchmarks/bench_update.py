@@ -0,0 +1,103 @@
+"""Benchmark of PUT /api/v2/restaurants/<id>: the previous update path,
+which retrieved the restaurant as an ORM object, changed it attribute by
+attribute, committed and retrieved it again for the response, compared with
+the current path, a single partial UPDATE ... RETURNING. Both the latency
+and the number of database round trips per request are reported.
+
+    $ python3 -m benchmarks.bench_update [number of restaurants]
+
+RETURNING is only used on Postgres, so point ESPRESSO_BENCH_DB_URI at a
+scratch Postgres database for representative numbers.
+"""
+
+import json
+import random
+import sys
+
+from flask import jsonify, request
+from sqlalchemy import event
+
+from auth0_tokens import requires_auth
+from benchmarks.bench_util import LocalSigner, bench_app, insert_restaurants, reset_db, timed
+
+ITERATIONS = 1000
+
+
+def add_legacy_route(espresso):
+    """Register the previous implementation of the update endpoint"""
+    @espresso.app.route('/bench/legacy/<rest_id>', methods=['PUT'])
+    @requires_auth
+    def legacy_update(rest_id):
+        rest, ret_val, http_status = espresso.retrieve_restaurant(rest_id)
+        if ret_val:
+            return jsonify(ret_val), http_status
+        json_dict = request.json
+        for field in espresso.RESTAURANT_INPUT_FIELDS:
+            if field != 'creator':
+                setattr(rest, field, espresso.get_dict_value_trunc(json_dict, field, getattr(rest, field)))
+        espresso.db.session.add(rest)
+        espresso.db.session.commit()
+        rest, ret_val, http_status = espresso.retrieve_restaurant(rest_id)
+        return jsonify({'success': True, 'id': rest.id, 'restaurant': espresso.restaurant_to_dict(rest),
+                        'api_version': espresso.API_VERSION}), 200
+
+    # The legacy path's writes go through the ORM, the cache is not being measured
+    espresso.response_cache.enabled = False
+
+
+class RoundTripCounter:
+    """Counts the statements executed, and the transactions committed, by an engine"""
+
+    def __init__(self, engine):
+        self.statements = 0
+        self.commits = 0
+        event.listen(engine, 'before_cursor_execute', self.on_execute)
+        event.listen(engine, 'commit', self.on_commit)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+
+    def on_commit(self, conn):
+        self.commits += 1
+
+    def reset(self):
+        self.statements = self.commits = 0
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    espresso = bench_app()
+    reset_db(espresso)
+    insert_restaurants(espresso, count)
+    add_legacy_route(espresso)
+
+    signer = LocalSigner()
+    headers = {'Content-Type': 'application/json'}
+    headers.update(signer.auth_header('update:restaurants'))
+    client = espresso.app.test_client()
+    with espresso.app.app_context():
+        counter = RoundTripCounter(espresso.db.engine)
+
+    rng = random.Random(42)
+
+    def put(url_base):
+        rest_id = rng.randint(1, count)
+        body = json.dumps({'website': f'www.updated{rng.randint(0, 10 ** 6)}.com', 'email': 'new@example.com'})
+        resp = client.put(f'{url_base}/{rest_id}', headers=headers, data=body)
+        assert resp.status_code == 200, resp.data
+
+    results = {}
+    for label, url_base in (('before', '/bench/legacy'), ('after', espresso.RESTAURANTS_API_BASE)):
+        put(url_base)  # Warm up
+        counter.reset()
+        elapsed = timed(lambda: put(url_base), ITERATIONS)
+        results[label] = elapsed
+        print(f'{label:>7}: {elapsed * 1e3:7.3f} ms per PUT, '
+              f'{counter.statements / ITERATIONS:.1f} statements and {counter.commits / ITERATIONS:.1f} '
+              f'commits per PUT')
+
+    print(f'{"speedup":>7}: {results["before"] / results["after"]:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
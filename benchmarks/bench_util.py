@@ -0,0 +1,137 @@
+"""Shared helpers for the benchmarks in this directory.
+
+Run the benchmarks from the top level of the project, e.g.
+
+    $ python3 -m benchmarks.bench_auth
+"""
+
+import base64
+import datetime
+import os
+import tempfile
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+import auth0_tokens
+
+BENCH_KID = 'espresso-bench-key'
+BENCH_DOMAIN = 'espresso-bench.example.com'
+BENCH_AUDIENCE = 'api.espresso-bench.example.com'
+
+# The benchmarks use their own database, a local SQLite file unless
+# ESPRESSO_BENCH_DB_URI points them at e.g. a scratch Postgres database.
+BENCH_DB_URI = os.environ.get('ESPRESSO_BENCH_DB_URI',
+                              'sqlite:///' + os.path.join(tempfile.gettempdir(), 'espresso_bench.db'))
+
+
+def bench_app():
+    """Import the espresso app configured to use the benchmark database.
+    Returns the espresso module.
+    """
+    # config.py insists on the database env variables, though they go unused here
+    for var in ('ESPRESSO_DB_USER', 'ESPRESSO_DB_PASSWORD', 'ESPRESSO_DB_HOST', 'ESPRESSO_DB_DATABASE_NAME'):
+        os.environ.setdefault(var, 'unused')
+
+    import espresso
+    espresso.app.config['SQLALCHEMY_DATABASE_URI'] = BENCH_DB_URI
+    if BENCH_DB_URI.startswith('sqlite'):
+        # The pool settings in config.py are for Postgres, SQLite gets Flask-SQLAlchemy's defaults
+        espresso.app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    return espresso
+
+
+def reset_db(espresso):
+    """Drop and recreate all the tables of the benchmark database"""
+    with espresso.app.app_context(), espresso.without_statement_timeout():
+        espresso.db.drop_all()
+        espresso.db.create_all()
+
+
+def insert_restaurants(espresso, count, batch_size=10000):
+    """Bulk insert count restaurants with every column filled in"""
+    table = espresso.Restaurant.__table__
+    with espresso.app.app_context():
+        for start in range(0, count, batch_size):
+            rows = [{'name': f'Restaurant {i}', 'street': f'{i} Main St', 'suite': str(i % 100),
+                     'city': 'Springfield', 'state': 'IL', 'zip_code': '62701',
+                     'phone_num': '217-555-0100', 'website': f'www.restaurant{i}.com',
+                     'email': f'info@restaurant{i}.com', 'date_established': '2014',
+                     'creator': 'bench-user@example.com'}
+                    for i in range(start, min(start + batch_size, count))]
+            espresso.db.session.execute(table.insert(), rows)
+        espresso.db.session.commit()
+
+
+def b64url_uint(value):
+    """Encode an unsigned integer the way JWKS expects"""
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+class LocalSigner:
+    """Signs access tokens with a locally generated RSA key that has been
+    installed into the auth0_tokens JWKS cache, so that requires_auth can
+    verify them without talking to Auth0.
+    """
+
+    def __init__(self, kid=BENCH_KID):
+        self.kid = kid
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048,
+                                               backend=default_backend())
+        self.private_pem = private_key.private_bytes(serialization.Encoding.PEM,
+                                                     serialization.PrivateFormat.PKCS8,
+                                                     serialization.NoEncryption())
+        numbers = private_key.public_key().public_numbers()
+        self.jwk = {'kty': 'RSA', 'kid': kid, 'use': 'sig',
+                    'n': b64url_uint(numbers.n), 'e': b64url_uint(numbers.e)}
+
+        auth0_tokens.AUTH0_DOMAIN = BENCH_DOMAIN
+        auth0_tokens.API_IDENTIFIER = BENCH_AUDIENCE
+        auth0_tokens.jwks_cache._keys = {kid: self.jwk}
+        auth0_tokens.jwks_cache._expires_at = time.monotonic() + 24 * 3600
+
+    def token(self, scope, subject='bench-user', lifetime=3600):
+        now = int(time.time())
+        claims = {'iss': f'https://{BENCH_DOMAIN}/', 'aud': BENCH_AUDIENCE, 'sub': subject,
+                  'iat': now, 'exp': now + lifetime, 'scope': scope}
+        return jwt.encode(claims, self.private_pem, algorithm='RS256', headers={'kid': self.kid})
+
+    def auth_header(self, scope, **kwargs):
+        return {'Authorization': 'Bearer ' + self.token(scope, **kwargs)}
+
+
+def timed(func, iterations):
+    """Call func the given number of times, return seconds per call"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def insert_reviews(espresso, count, restaurant_count, batch_size=10000):
+    """Bulk insert count reviews spread evenly over the first restaurant_count
+    restaurants. On Postgres the rows are generated by the database itself.
+    """
+    db = espresso.db
+    with espresso.app.app_context():
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(
+                "INSERT INTO review (author, date, rating, comment, restaurant_id) "
+                "SELECT 'Author ' || (i % 5000), DATE '2015-01-01' + (i % 2000), 1 + i % 5, "
+                "'Bench review comment', 1 + i % :restaurant_count "
+                "FROM generate_series(0, :count - 1) AS i",
+                {'count': count, 'restaurant_count': restaurant_count})
+        else:
+            epoch = datetime.date(2015, 1, 1)
+            table = espresso.Review.__table__
+            for start in range(0, count, batch_size):
+                rows = [{'author': f'Author {i % 5000}', 'date': epoch + datetime.timedelta(days=i % 2000),
+                         'rating': 1 + i % 5, 'comment': 'Bench review comment',
+                         'restaurant_id': 1 + i % restaurant_count}
+                        for i in range(start, min(start + batch_size, count))]
+                db.session.execute(table.insert(), rows)
+        db.session.commit()
@@ -0,0 +1,105 @@
+"""Load test of a running server, to compare ways of serving the app, e.g.
+the espresso-run image started with flask run against the same image
+started with gunicorn, each at the limits of docker-run-example.sh:
+
+    $ docker run ... --memory=1g --memory-swap=1g --cpus=1 -p 5055:5000 espresso-run
+    $ ESPRESSO_LOADTEST_TOKEN=<access token> python3 -m benchmarks.loadtest http://localhost:5055
+
+For each level of concurrency, that many client threads send GET requests,
+each over its own keep-alive connection, for a fixed time. The requests per
+second and the 50th, 95th and 99th percentile latencies are reported.
+
+The token needs the read:restaurants scope, get_auth0_token.py gets one.
+Point the server at a database that already has restaurants in it, the
+load test only reads.
+"""
+
+import http.client
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+CONCURRENCY_LEVELS = (1, 4, 16, 64)
+DURATION = 20  # Seconds per level of concurrency
+PATHS = ('/api/v2/restaurants?limit=100', '/api/v2/restaurants/1')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def client_thread(url, headers, deadline, latencies, errors):
+    """Send requests until the deadline, recording the latency of each"""
+    parts = urlsplit(url)
+    conn = None
+    reused = False  # Whether conn has served a request already
+    i = 0
+    while time.monotonic() < deadline:
+        if conn is None:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            reused = False
+        path = PATHS[i % len(PATHS)]
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = None
+            # The server may close an idle keep-alive connection, e.g. when a worker is recycled,
+            # clients then retry on a new connection as this does
+            if not reused:
+                errors.append(path)
+                i += 1
+            continue
+        i += 1
+        reused = True
+        latencies.append(time.perf_counter() - start)
+        if resp.status != 200:
+            errors.append(path)
+        if resp.getheader('Connection', '').lower() == 'close':
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+def run_level(url, headers, concurrency, duration):
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client_thread, args=(url, headers, deadline, latencies, errors))
+               for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f'{concurrency:>11} {len(latencies) / elapsed:8.1f} {percentile(latencies, 0.50) * 1e3:8.1f} '
+          f'{percentile(latencies, 0.95) * 1e3:8.1f} {percentile(latencies, 0.99) * 1e3:8.1f} {len(errors):7}')
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else 'http://localhost:5055'
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else DURATION
+    token = os.environ.get('ESPRESSO_LOADTEST_TOKEN')
+    if not token:
+        sys.exit('Set ESPRESSO_LOADTEST_TOKEN to an access token with the read:restaurants scope')
+    headers = {'authorization': 'Bearer ' + token}
+
+    print(f'{url}, {duration:.0f} s per level of concurrency')
+    print(f'{"concurrency":>11} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for concurrency in CONCURRENCY_LEVELS:
+        run_level(url, headers, concurrency, duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Compression of responses with gzip, or brotli if it is installed,
+whichever the Accept-Encoding of the request prefers.
+
+JSON and text responses of at least COMPRESSION_MIN_SIZE bytes are
+compressed, at COMPRESSION_GZIP_LEVEL or COMPRESSION_BROTLI_QUALITY.
+Streamed responses are compressed a chunk at a time as they are sent, and
+each chunk is flushed so that the client gets it without waiting for the
+rest, so a streamed response is never held in memory whole.
+
+A compressed response is a different representation of the resource, so
+its ETag is the ETag of the uncompressed response with the encoding
+appended, e.g. "v3-1a2b3c4d5e6f-gzip". The suffix is removed from the
+ETags of conditional requests before the views see them, so that they
+match the ETags the views make.
+"""
+
+import re
+import zlib
+
+from flask import g, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = frozenset(('application/json', 'application/x-ndjson', 'text/plain', 'text/html'))
+
+# The encoding suffixes of ETags in request headers, e.g. -gzip in "v3-1a2b3c4d5e6f-gzip"
+ETAG_ENCODING_SUFFIXES = {encoding: re.compile(f'-{encoding}(?=")') for encoding in ('br', 'gzip')}
+
+
+class Compression:
+    """Compresses the responses of the app, see the module docstring"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.min_size = 0  # Bytes
+        self.gzip_level = 6
+        self.brotli_quality = 4
+        self.encodings = ()  # Those the server can use, the preferred first
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESSION_ENABLED', True)
+        self.min_size = app.config.get('COMPRESSION_MIN_SIZE', 1024)
+        self.gzip_level = app.config.get('COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = app.config.get('COMPRESSION_BROTLI_QUALITY', 4)
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+        app.before_request(self.strip_etag_encodings)
+        app.after_request(self.compress_response)
+
+    def strip_etag_encodings(self):
+        # Only the suffix of the encoding this response would have, an ETag
+        # with another is of a representation the client would not get
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if not self.enabled or encoding is None:
+            return
+        for header in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH'):
+            value = request.environ.get(header)
+            if value:
+                value, count = ETAG_ENCODING_SUFFIXES[encoding].subn('', value)
+                if count:
+                    g.compression_etag_stripped = True
+                    request.environ[header] = value
+
+    def compress_response(self, response):
+        if not self.enabled or response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if response.status_code == 304:
+            # The client has the compressed representation, with the ETag it sent
+            etag, weak = response.get_etag()
+            if etag and g.get('compression_etag_stripped'):
+                response.set_etag(f'{etag}-{encoding}', weak)
+            return response
+        if response.status_code < 200 or response.status_code == 204 or \
+                response.mimetype not in COMPRESSIBLE_MIMETYPES or response.cache_control.no_transform:
+            return response
+
+        # Whether or not this response is compressed, another to the same url may be
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compress_stream(response.response, response.iter_encoded(), encoding)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(self.compress(data, encoding))
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        return response
+
+    def compress(self, data, encoding):
+        """data compressed whole with the encoding"""
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        # With wbits over 16 zlib writes the gzip format
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_stream(self, body, chunks, encoding):
+        """Compress the chunks of the streamed body as they are produced"""
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            compress, finish = compressor.compress, compressor.flush
+            flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        try:
+            for chunk in chunks:
+                compressed = compress(chunk) + flush()
+                if compressed:
+                    yield compressed
+            yield finish()
+        finally:
+            # The body is closed with the response, which now closes this instead
+            if hasattr(body, 'close'):
+                body.close()
@@ -28,3 +28,61 @@ except KeyError as ex:
 db_url = f"postgres+psycopg2://{db_user}:{db_password}@{db_host}/{db_database_name}"
 SQLALCHEMY_DATABASE_URI = db_url
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Cache of the responses of the read endpoints
+RESPONSE_CACHE_ENABLED = os.environ.get('ESPRESSO_RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_BACKEND = os.environ.get('ESPRESSO_RESPONSE_CACHE_BACKEND', 'response_cache.LRUCacheBackend')
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('ESPRESSO_RESPONSE_CACHE_MAX_ENTRIES', 10000))
+RESPONSE_CACHE_TTL = int(os.environ.get('ESPRESSO_RESPONSE_CACHE_TTL', 60))  # Seconds
+
+# Restaurants with more reviews than this are deleted asynchronously, see purge-deleted-restaurants
+ASYNC_DELETE_MIN_REVIEWS = int(os.environ.get('ESPRESSO_ASYNC_DELETE_MIN_REVIEWS', 10000))
+
+# Per-request SQL statistics in Server-Timing headers, and the slow query log
+QUERY_STATS_HEADERS = os.environ.get('ESPRESSO_QUERY_STATS_HEADERS', 'true').lower() == 'true'
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('ESPRESSO_SLOW_QUERY_THRESHOLD_MS', 500))  # 0 disables the log
+SLOW_QUERY_LOG_PARAMETERS = os.environ.get('ESPRESSO_SLOW_QUERY_LOG_PARAMETERS', 'false').lower() == 'true'
+
+# Metrics served at /metrics. With several worker processes, a directory
+# shared by them, emptied whenever the server starts.
+METRICS_MULTIPROC_DIR = os.environ.get('ESPRESSO_METRICS_MULTIPROC_DIR')
+METRICS_WRITE_INTERVAL = float(os.environ.get('ESPRESSO_METRICS_WRITE_INTERVAL', 1.0))  # Seconds
+
+# The pool of database connections of each worker process. Connections
+# are tested before use (pre-ping) and replaced once older than the recycle
+# time. A request waits at most the pool timeout for a connection.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': int(os.environ.get('ESPRESSO_DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.environ.get('ESPRESSO_DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': float(os.environ.get('ESPRESSO_DB_POOL_TIMEOUT', 10)),  # Seconds
+    'pool_recycle': int(os.environ.get('ESPRESSO_DB_POOL_RECYCLE', 1800)),  # Seconds
+    'pool_pre_ping': os.environ.get('ESPRESSO_DB_POOL_PRE_PING', 'true').lower() == 'true',
+}
+
+# Postgres cancels any statement that runs longer than this, 0 disables the limit
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('ESPRESSO_DB_STATEMENT_TIMEOUT_MS', 5000))
+
+# Read replicas of the database, a comma separated list of urls. The reads
+# of read-only endpoints are spread over them, see db_routing.py.
+DB_REPLICA_URIS = [uri.strip() for uri in os.environ.get('ESPRESSO_DB_REPLICA_URIS', '').split(',') if uri.strip()]
+SQLALCHEMY_BINDS = {f'replica_{i}': uri for i, uri in enumerate(DB_REPLICA_URIS)}
+# A client reads from the primary for this long after it writes, the replica lag it tolerates
+REPLICA_STICKY_SECONDS = int(os.environ.get('ESPRESSO_REPLICA_STICKY_SECONDS', 5))
+# An unhealthy replica is left out for this long before it is tried again
+REPLICA_RETRY_INTERVAL = int(os.environ.get('ESPRESSO_REPLICA_RETRY_INTERVAL', 30))
+
+# The ASGI variant of the app, espresso_async.py, reads through asyncpg with a
+# pool of connections per process. Requests wait for a connection in the
+# pool, however many of them are in flight.
+ASYNC_DATABASE_URI = f"postgresql://{db_user}:{db_password}@{db_host}/{db_database_name}"
+ASYNC_DB_POOL_MIN_SIZE = int(os.environ.get('ESPRESSO_ASYNC_DB_POOL_MIN_SIZE', 5))
+ASYNC_DB_POOL_MAX_SIZE = int(os.environ.get('ESPRESSO_ASYNC_DB_POOL_MAX_SIZE', 20))
+
+# The JSON encoder of responses, orjson if it is installed, or json for the standard library's
+JSON_BACKEND = os.environ.get('ESPRESSO_JSON_BACKEND', 'orjson')
+
+# Compression of JSON and text responses with gzip or brotli, as the client accepts, at least this many bytes
+COMPRESSION_ENABLED = os.environ.get('ESPRESSO_COMPRESSION_ENABLED', 'true').lower() == 'true'
+COMPRESSION_MIN_SIZE = int(os.environ.get('ESPRESSO_COMPRESSION_MIN_SIZE', 1024))  # Bytes
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('ESPRESSO_COMPRESSION_GZIP_LEVEL', 6))  # 1 to 9
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('ESPRESSO_COMPRESSION_BROTLI_QUALITY', 4))  # 0 to 11
@@ -0,0 +1,144 @@
+"""Routing of the reads of read-only endpoints to database read replicas.
+
+The replicas are Flask-SQLAlchemy binds named replica_0, replica_1 and so
+on. A view decorated with ReplicaRouter.read_only has its statements sent
+to the replicas, round robin, and every other view uses the primary.
+
+A client that has just written, to the primary, might not see its write on
+a replica that lags behind. So a successful write sets a cookie that sends
+the client's reads to the primary for the next REPLICA_STICKY_SECONDS.
+
+A replica that fails to connect, or loses its connection, is left out for
+REPLICA_RETRY_INTERVAL seconds, and the read that found it failing is
+retried on the primary. If no replica is healthy, reads go to the primary.
+Other errors of a replica, such as a statement that ran past its timeout,
+are raised like those of the primary.
+"""
+
+from functools import wraps
+import itertools
+import logging
+import threading
+import time
+import weakref
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy import exc as sqlalchemy_exc
+from sqlalchemy import orm
+
+REPLICA_BIND_PREFIX = 'replica'
+STICKY_COOKIE = 'espresso_read_primary_until'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class RoutingSession(SignallingSession):
+    """A session that sends the statements of read-only views to the replica
+    the ReplicaRouter chose for the request, and all others to the primary
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context() and not self._flushing:
+            engine = g.get('db_replica_engine')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with sessions that route reads to replicas, see RoutingSession"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    """Chooses the replica, if any, that serves the reads of each read-only request"""
+
+    def __init__(self, app=None, db=None):
+        self.db = None
+        self.bind_keys = []
+        self.sticky_seconds = 0
+        self.retry_interval = 0
+        self._next_replica = itertools.count()
+        self._unhealthy_until = {}  # bind key -> time.monotonic() until which it is left out
+        self._instrumented = weakref.WeakSet()  # Engines with a handle_error listener
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        self.bind_keys = sorted(key for key in (app.config.get('SQLALCHEMY_BINDS') or {})
+                                if key.startswith(REPLICA_BIND_PREFIX))
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+        self.retry_interval = app.config.get('REPLICA_RETRY_INTERVAL', 30)
+        app.after_request(self.set_sticky_cookie)
+
+    def read_only(self, f):
+        """Decorator for a view that only reads, so it may read from a replica"""
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if self.bind_keys:
+                if self.reads_own_writes():
+                    # Neither a replica nor a cached response may predate the client's write
+                    g.response_cache_bypass = True
+                else:
+                    g.db_replica_engine = self.choose_replica()
+                    if g.db_replica_engine is not None:
+                        # A response read from a replica may be as stale as the replica lag allows
+                        g.response_cache_ttl = self.sticky_seconds
+            try:
+                return f(*args, **kwargs)
+            except sqlalchemy_exc.OperationalError:
+                # Other errors, such as a canceled slow statement, would fail on the primary too
+                if g.get('db_replica_engine') is None or not g.pop('db_replica_failed', False):
+                    raise
+                # The replica failed, and is now left out, so read from the primary instead
+                self.db.session.rollback()
+                g.db_replica_engine = None
+                return f(*args, **kwargs)
+        return decorated
+
+    def reads_own_writes(self):
+        """Whether the client wrote recently enough that it must read from the primary"""
+        try:
+            return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def choose_replica(self):
+        """The engine of the next healthy replica, round robin, or None if there is none"""
+        for _ in range(len(self.bind_keys)):
+            bind_key = self.bind_keys[next(self._next_replica) % len(self.bind_keys)]
+            if self._unhealthy_until.get(bind_key, 0) <= time.monotonic():
+                return self.replica_engine(bind_key)
+        return None
+
+    def replica_engine(self, bind_key):
+        engine = self.db.get_engine(bind=bind_key)
+        with self._lock:
+            # By engine, since Flask-SQLAlchemy makes a new one if the url of the bind changes
+            if engine not in self._instrumented:
+                self._instrumented.add(engine)
+
+                @event.listens_for(engine, 'handle_error')
+                def replica_error(context):
+                    # Without a connection the replica failed to connect, otherwise it lost the connection
+                    if context.connection is None or context.is_disconnect:
+                        self.mark_unhealthy(bind_key, context.original_exception)
+                        if has_request_context():
+                            g.db_replica_failed = True
+        return engine
+
+    def mark_unhealthy(self, bind_key, reason):
+        self._unhealthy_until[bind_key] = time.monotonic() + self.retry_interval
+        logging.error(f'Database replica {bind_key} is unhealthy, leaving it out for {self.retry_interval} s')
+        logging.error(f'Exception was thrown: {str(reason)}')
+
+    def set_sticky_cookie(self, response):
+        if self.bind_keys and request.method in WRITE_METHODS and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, str(int(time.time()) + self.sticky_seconds),
+                                max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+        return response
@@ -2,28 +2,139 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import base64
+import binascii
+import contextlib
+import datetime
+import hashlib
 import json
 import logging
+import re
 
-from flask import Flask, request, send_from_directory
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Response, request, send_from_directory, stream_with_context
 from flask_migrate import Migrate
 from flask import jsonify
+from flask.json import dumps as json_dumps
 from flask_cors import CORS, cross_origin
 
+import click
+from sqlalchemy import DDL, and_, bindparam, case, event, exists, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy import exc as sqlalchemy_exc
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.pool import Pool
 from werkzeug import exceptions as werkzeug_exc
 
-from auth0_tokens import AuthError, requires_auth, requires_scope
+from auth0_tokens import AuthError, jwks_cache, requires_auth, requires_scope, verified_tokens
+from compression import Compression
+from db_routing import ReplicaRouter, RoutingSQLAlchemy
+from json_backend import JSONBackend
+from metrics import InstrumentedQueuePool, Metrics, registry as metrics_registry
+from query_stats import QueryStats
+from response_cache import ResponseCache
 
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
+# The options of SQLALCHEMY_ENGINE_OPTIONS that only a QueuePool takes
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+class InstrumentedSQLAlchemy(RoutingSQLAlchemy):
+    """Unless a pool class is configured, engines get a connection pool that
+    records how long checkouts wait, see metrics.InstrumentedQueuePool.
+    SQLite keeps the pool Flask-SQLAlchemy picks for it. Postgres
+    connections get the configured statement timeout. Sessions route the
+    reads of read-only views to replicas, see db_routing.
+    """
+
+    def create_engine(self, sa_url, engine_opts):
+        if sa_url.drivername.startswith('sqlite'):
+            # A NullPool, or a StaticPool for a database in memory, which take no pool sizes
+            engine_opts = {name: value for name, value in engine_opts.items() if name not in QUEUE_POOL_OPTIONS}
+        elif 'poolclass' not in engine_opts:
+            engine_opts = dict(engine_opts, poolclass=InstrumentedQueuePool)
+        engine = super().create_engine(sa_url, engine_opts)
+
+        timeout_ms = self.get_app().config.get('DB_STATEMENT_TIMEOUT_MS', 0)
+        if engine.dialect.name == 'postgresql' and timeout_ms > 0:
+            # Set once per connection rather than per transaction, which would cost a round trip each time
+            @event.listens_for(engine, 'connect')
+            def set_connection_timeout(dbapi_connection, connection_record):
+                set_statement_timeout(dbapi_connection, timeout_ms)
+                connection_record.info['statement_timeout_ms'] = timeout_ms
+
+            @event.listens_for(engine, 'checkin')
+            def restore_statement_timeout(dbapi_connection, connection_record):
+                # Lifted while the connection was checked out, see without_statement_timeout()
+                if connection_record.info.pop('statement_timeout_lifted', False) and dbapi_connection is not None:
+                    set_statement_timeout(dbapi_connection, timeout_ms)
+        return engine
+
+
+def set_statement_timeout(dbapi_connection, timeout_ms):
+    """Set the statement timeout of a Postgres connection, 0 for none"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'SET statement_timeout = {int(timeout_ms)}')
+    cursor.close()
+    dbapi_connection.commit()
+
+
+@contextlib.contextmanager
+def without_statement_timeout():
+    """Lift the statement timeout of the connections checked out of the
+    pools within, for maintenance commands and DDL such as drop_all(),
+    whose statements may run longer than any request. Each connection gets
+    its timeout back when it is returned to its pool. Also a decorator.
+    """
+    def lift_timeout(dbapi_connection, connection_record, connection_proxy):
+        if 'statement_timeout_ms' in connection_record.info:
+            set_statement_timeout(dbapi_connection, 0)
+            connection_record.info['statement_timeout_lifted'] = True
+
+    event.listen(Pool, 'checkout', lift_timeout)
+    try:
+        yield
+    finally:
+        event.remove(Pool, 'checkout', lift_timeout)
+
+
 app = Flask(__name__)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+db = InstrumentedSQLAlchemy(app)
 migrate = Migrate(app, db)
+replica_router = ReplicaRouter(app, db)
+response_cache = ResponseCache(app)
+query_stats = QueryStats(app)
+metrics = Metrics(app)
+json_backend = JSONBackend(app)
+compression = Compression(app)
+
+
+def cache_metrics():
+    """The hits and misses of the caches, collected by /metrics"""
+    samples = []
+    for cache, stats in (('response', response_cache.stats()), ('verified_tokens', verified_tokens.stats()),
+                         ('jwks', jwks_cache.stats())):
+        samples.append(('espresso_cache_hits_total', {'cache': cache}, stats.get('hits', 0)))
+        samples.append(('espresso_cache_misses_total', {'cache': cache}, stats.get('misses', 0)))
+    return samples
+
+
+metrics_registry.add_collector(cache_metrics)
+
+
+def pool_metrics():
+    """The use of the database connection pool, collected by /metrics"""
+    pool = db.get_engine(app).pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return []
+    return [('espresso_db_pool_checked_out', {}, pool.checkedout()),
+            ('espresso_db_pool_capacity', {}, pool.capacity())]
+
+
+metrics_registry.add_collector(pool_metrics)
 
 # These values for the origins argument to CORS are just examples
 # of what might be allowed as far as the origins of requestors.
@@ -32,6 +143,16 @@ CORS(app, supports_credentials=True, origins=['http://127.0.0.1:*', 'http://loca
 DEF_MAX_STR_LEN = 255 # The default max string length
 MAX_COMMENT_LEN = 1000 # Max length of comments in reviews
 
+DEFAULT_PAGE_SIZE = 100 # Number of items in a page of a list endpoint
+MAX_PAGE_SIZE = 1000 # Largest page size a client may ask for
+STREAM_BATCH_SIZE = 1000 # Rows fetched from the database at a time when streaming
+BULK_CHUNK_SIZE = 500 # Restaurants written by one statement of a bulk create
+BULK_MAX_ITEMS = 10000 # Most restaurants accepted by one bulk create request
+MAX_BATCH_IDS = 100 # Most restaurants a client may look up at once by id
+DEFAULT_EMBED_REVIEWS = 10 # Number of reviews embedded in each restaurant by default
+MAX_SEARCH_LEN = 200 # Longest search query a client may send
+MAX_SEARCH_WORDS = 10 # Most words of a search query
+
 class Restaurant(db.Model):
     __tablename__ = 'restaurant'
 
@@ -48,7 +169,69 @@ class Restaurant(db.Model):
     date_established = db.Column(db.String(DEF_MAX_STR_LEN))
     creator = db.Column(db.String(DEF_MAX_STR_LEN), nullable=False)
 
-    reviews = db.relationship('Review', backref='rest_reviewed', lazy=True, uselist=True)
+    # Aggregates of the ratings of the restaurant's reviews, maintained as
+    # reviews are written, see adjust_rating_stats()
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    avg_rating = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    rating_1_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Incremented by every update, it is the basis of the restaurant's ETag
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # Set when a restaurant is deleted asynchronously, until it is purged
+    # along with its reviews, see purge_deleted_restaurants()
+    deleted_at = db.Column(db.DateTime)
+
+    # The words of the name, city and street, for search. On Postgres a
+    # trigger maintains it, see RESTAURANT_SEARCH_TRIGGER
+    search_vector = db.deferred(db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite')))
+
+    # Restaurants are listed by top rating in (avg_rating, id) order, and
+    # searched by their words and by the trigrams of the name, street and city
+    __table_args__ = (db.Index('ix_restaurant_avg_rating_id', 'avg_rating', 'id'),
+                      db.Index('ix_restaurant_deleted_at', 'deleted_at',
+                               postgresql_where=db.text('deleted_at IS NOT NULL')),
+                      db.Index('ix_restaurant_search_vector', 'search_vector', postgresql_using='gin'),
+                      ) + tuple(db.Index(f'ix_restaurant_{column}_trgm', column, postgresql_using='gin',
+                                         postgresql_ops={column: 'gin_trgm_ops'})
+                                for column in ('name', 'street', 'city'))
+    __mapper_args__ = {'version_id_col': version}
+
+    # Reviews are deleted with their restaurant by the database, not loaded to be deleted one by one
+    reviews = db.relationship('Review', backref='rest_reviewed', lazy=True, uselist=True, passive_deletes=True)
+
+
+# The search vector weighs the words of the name most, then those of the
+# city, then the street. The 'simple' configuration neither stems words nor
+# drops stop words, since names are in many languages
+RESTAURANT_SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}city, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce({row}street, '')), 'C')"""
+
+RESTAURANT_SEARCH_TRIGGER = f"""
+CREATE OR REPLACE FUNCTION restaurant_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {RESTAURANT_SEARCH_VECTOR.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER restaurant_search_vector_update BEFORE INSERT OR UPDATE OF name, city, street ON restaurant
+    FOR EACH ROW EXECUTE PROCEDURE restaurant_search_vector_update();
+"""
+
+# db.create_all() makes the pg_trgm extension, which the trigram indexes
+# need, and the trigger, as the migration does. Neither is made on SQLite.
+event.listen(Restaurant.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+event.listen(Restaurant.__table__, 'after_create',
+             DDL(RESTAURANT_SEARCH_TRIGGER).execute_if(dialect='postgresql'))
 
 
 class Review(db.Model):
@@ -59,7 +242,271 @@ class Review(db.Model):
     date = db.Column(db.Date)
     rating = db.Column(db.SmallInteger)
     comment = db.Column(db.String(MAX_COMMENT_LEN))
-    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False)
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id', ondelete='CASCADE'), nullable=False)
+
+    # Incremented by every update, it is the basis of ETags of review lists
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # The reviews of a restaurant, or by an author, are paged in id order
+    __table_args__ = (db.Index('ix_review_restaurant_id_id', 'restaurant_id', 'id'),
+                      db.Index('ix_review_author_id', 'author', 'id'),
+                      db.Index('ix_review_date', 'date'),
+                      )
+    __mapper_args__ = {'version_id_col': version}
+
+
+# Restaurants that have not been deleted, the only ones the endpoints see
+RESTAURANT_NOT_DELETED = Restaurant.__table__.c.deleted_at.is_(None)
+# Reviews of restaurants that are deleted but not yet purged are hidden
+# too. The few such restaurants are found by the partial index of deleted_at.
+REVIEW_RESTAURANT_NOT_DELETED = ~exists().where(and_(Restaurant.__table__.c.id == Review.__table__.c.restaurant_id,
+                                                     Restaurant.__table__.c.deleted_at.isnot(None)))
+
+MIN_RATING = 1
+MAX_RATING = 5
+RATING_HISTOGRAM_FIELDS = tuple(f'rating_{rating}_count' for rating in range(MIN_RATING, MAX_RATING + 1))
+
+
+def rating_stats_values(table, count_delta, sum_delta, histogram_deltas):
+    """Values for an UPDATE of the restaurant table that adjusts its rating
+    aggregates in place, so concurrent review writes do not lose updates
+    """
+    new_count = table.c.rating_count + count_delta
+    new_sum = table.c.rating_sum + sum_delta
+    values = {'rating_count': new_count, 'rating_sum': new_sum,
+              'avg_rating': case([(new_count > 0, new_sum * 1.0 / new_count)], else_=0),
+              'version': table.c.version + 1
+              }
+    for field, delta in histogram_deltas.items():
+        values[field] = table.c[field] + delta
+    return values
+
+
+def adjust_rating_stats(connection, restaurant_id, rating, sign):
+    """Add (sign 1) or remove (sign -1) one rating to a restaurant's aggregates"""
+    if rating is None or restaurant_id is None:
+        return
+    table = Restaurant.__table__
+    histogram_deltas = {}
+    if MIN_RATING <= rating <= MAX_RATING:
+        histogram_deltas[f'rating_{rating}_count'] = sign
+    connection.execute(table.update()
+                       .where(table.c.id == restaurant_id)
+                       .values(rating_stats_values(table, sign, sign * rating, histogram_deltas)))
+
+
+def restaurant_cache_tags(restaurant_id):
+    """The response cache tags affected by a write of a restaurant"""
+    return {'restaurants', f'restaurant:{restaurant_id}'}
+
+
+def review_cache_tags(restaurant_id):
+    """The response cache tags affected by a write of one of a restaurant's reviews,
+    which includes the restaurant since its rating aggregates change too
+    """
+    return {'reviews', f'restaurant_reviews:{restaurant_id}'} | restaurant_cache_tags(restaurant_id)
+
+
+def invalidate_on_commit(target, tags):
+    """Invalidate the response cache tags once the session of target commits"""
+    object_session(target).info.setdefault('cache_tags', set()).update(tags)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        response_cache.invalidate(*tags)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_cache_tags(session):
+    session.info.pop('cache_tags', None)
+
+
+@event.listens_for(Restaurant, 'after_insert')
+@event.listens_for(Restaurant, 'after_update')
+@event.listens_for(Restaurant, 'after_delete')
+def restaurant_written(mapper, connection, rest):
+    invalidate_on_commit(rest, restaurant_cache_tags(rest.id))
+
+
+# The rating aggregates are updated by the same flush, hence the same
+# transaction, as every review insert, update and delete.
+@event.listens_for(Review, 'after_insert')
+def review_inserted(mapper, connection, rev):
+    adjust_rating_stats(connection, rev.restaurant_id, rev.rating, 1)
+    invalidate_on_commit(rev, review_cache_tags(rev.restaurant_id))
+
+
+@event.listens_for(Review, 'after_delete')
+def review_deleted(mapper, connection, rev):
+    adjust_rating_stats(connection, rev.restaurant_id, rev.rating, -1)
+    invalidate_on_commit(rev, review_cache_tags(rev.restaurant_id))
+
+
+@event.listens_for(Review, 'after_update')
+def review_updated(mapper, connection, rev):
+    restaurant_hist = db.inspect(rev).attrs.restaurant_id.history
+    old_restaurant_id = restaurant_hist.deleted[0] if restaurant_hist.deleted else rev.restaurant_id
+    invalidate_on_commit(rev, review_cache_tags(old_restaurant_id) | review_cache_tags(rev.restaurant_id))
+
+    rating_hist = db.inspect(rev).attrs.rating.history
+    if not rating_hist.has_changes() and not restaurant_hist.has_changes():
+        return
+    old_rating = rating_hist.deleted[0] if rating_hist.deleted else rev.rating
+    adjust_rating_stats(connection, old_restaurant_id, old_rating, -1)
+    adjust_rating_stats(connection, rev.restaurant_id, rev.rating, 1)
+
+
+def rebuild_rating_stats(batch_size=1000):
+    """Recompute the rating aggregates of every restaurant from its reviews"""
+    table = Restaurant.__table__
+    zeros = {field: 0 for field in ('rating_count', 'rating_sum', 'avg_rating') + RATING_HISTOGRAM_FIELDS}
+    db.session.execute(table.update().where(table.c.rating_count != 0)
+                       .values(version=table.c.version + 1, **zeros))
+
+    columns = [Review.restaurant_id, func.count(Review.rating), func.coalesce(func.sum(Review.rating), 0)]
+    for rating in range(MIN_RATING, MAX_RATING + 1):
+        columns.append(func.sum(case([(Review.rating == rating, 1)], else_=0)))
+    aggregates = db.session.execute(select(columns).where(Review.rating.isnot(None))
+                                    .group_by(Review.restaurant_id)).fetchall()
+
+    update = table.update().where(table.c.id == bindparam('rest_id')).values(version=table.c.version + 1)
+    for start in range(0, len(aggregates), batch_size):
+        params = []
+        for restaurant_id, count, total, *histogram in aggregates[start:start + batch_size]:
+            item = {'rest_id': restaurant_id, 'rating_count': count, 'rating_sum': total,
+                    'avg_rating': total / count if count else 0}
+            item.update(zip(RATING_HISTOGRAM_FIELDS, histogram))
+            params.append(item)
+        db.session.execute(update, params)
+    db.session.commit()
+    response_cache.clear()
+    return len(aggregates)
+
+
+@app.cli.command('rebuild-rating-stats')
+@without_statement_timeout()
+def rebuild_rating_stats_command():
+    """Backfill the rating aggregates of all restaurants from their reviews."""
+    count = rebuild_rating_stats()
+    click.echo(f'Rebuilt rating aggregates of {count} reviewed restaurants')
+
+
+def delete_restaurant_rows(rest_id):
+    """Delete a restaurant and its reviews with one set-based statement each,
+    whether or not the database cascades the delete itself. Returns the
+    number of restaurants deleted. The caller commits.
+    """
+    db.session.execute(Review.__table__.delete().where(Review.__table__.c.restaurant_id == rest_id))
+    table = Restaurant.__table__
+    return db.session.execute(table.delete().where(table.c.id == rest_id)).rowcount
+
+
+def purge_deleted_restaurants(batch_size=10000):
+    """Permanently delete the restaurants that were deleted asynchronously.
+    Their reviews are deleted batch_size at a time, each batch in its own
+    short transaction. Returns the number of restaurants purged.
+    """
+    table = Restaurant.__table__
+    review_table = Review.__table__
+    rest_ids = [row.id for row in db.session.execute(select([table.c.id]).where(table.c.deleted_at.isnot(None)))]
+    for rest_id in rest_ids:
+        while True:
+            batch = select([review_table.c.id]).where(review_table.c.restaurant_id == rest_id).limit(batch_size)
+            deleted = db.session.execute(review_table.delete().where(review_table.c.id.in_(batch))).rowcount
+            db.session.commit()
+            if deleted < batch_size:
+                break
+        delete_restaurant_rows(rest_id)
+        db.session.commit()
+    return len(rest_ids)
+
+
+@app.cli.command('purge-deleted-restaurants')
+@without_statement_timeout()
+def purge_deleted_restaurants_command():
+    """Permanently delete restaurants that were deleted asynchronously, and their reviews."""
+    count = purge_deleted_restaurants()
+    click.echo(f'Purged {count} deleted restaurants')
+
+
+# The columns returned by the read endpoints, in response order
+RESTAURANT_FIELDS = ('id', 'name', 'street', 'suite', 'city', 'state', 'zip_code', 'phone_num',
+                     'website', 'email', 'date_established', 'creator',
+                     'rating_count', 'avg_rating') + RATING_HISTOGRAM_FIELDS + ('version',)
+REVIEW_FIELDS = ('id', 'author', 'date', 'rating', 'comment', 'restaurant_id', 'version')
+
+
+def column_select(model, fields, *filters):
+    """Select just the given columns of the rows of a model matching the
+    filters. The results are lightweight rows rather than ORM objects, so
+    reads skip object hydration and the identity map. The selects of the
+    read endpoints are built by functions like this one, which both this
+    app and the async one in espresso_async.py execute.
+    """
+    table = model.__table__
+    return select([table.c[field] for field in fields]).where(and_(*filters))
+
+
+def restaurants_select(fields, *filters):
+    """Select the given columns of the restaurants, which are not deleted, matching the filters"""
+    return column_select(Restaurant, fields, RESTAURANT_NOT_DELETED, *filters)
+
+
+def reviews_select(fields, filters):
+    """Select the given columns of the reviews, of restaurants that are not deleted, matching the filters"""
+    return column_select(Review, fields, REVIEW_RESTAURANT_NOT_DELETED, *filters)
+
+
+def row_to_dict(row, fields):
+    """Convert a row of a column select to a dictionary of the given fields"""
+    return {field: row[field] for field in fields}
+
+
+def with_id(fields):
+    """The fields plus id, which is needed for paging even if it is not requested"""
+    return fields if 'id' in fields else ('id',) + fields
+
+
+def with_id_and_version(fields):
+    """The fields plus id and version, which the ETag of a list is derived from, see page_version()"""
+    fields = with_id(fields)
+    return fields if 'version' in fields else fields + ('version',)
+
+
+def make_etag(version_token, full_path=None):
+    """A strong ETag for the representation at the current url, or at
+    full_path, of data whose version is version_token. It begins with the
+    version token.
+    """
+    if full_path is None:
+        full_path = request.full_path
+    digest = hashlib.sha1(full_path.encode()).hexdigest()[:12]
+    return f'{version_token}-{digest}'
+
+
+def page_version(rows, next_cursor=None):
+    """A version token for a page of rows, each with an id and a version,
+    and the cursor of the page after it. Writing one of the rows, or adding
+    or removing a row of the page, changes it, while writes to rows of
+    other pages do not. It is found from the rows the page is read from,
+    without querying the rest of the table.
+    """
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(f'{row["id"]}.{row["version"]};'.encode())
+    if next_cursor is not None:
+        digest.update(next_cursor.encode())
+    return f'p{digest.hexdigest()[:12]}'
+
+
+def not_modified(etag):
+    """A 304 Not Modified response"""
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -82,19 +529,21 @@ def favicon():
 
 def restaurant_to_dict(rest):
     """Convert a Restaurant object to a dictionary"""
-    rest_item = {'id': rest.id, 'name': rest.name, 'street': rest.street, 'suite': rest.suite,
-                 'city': rest.city, 'state': rest.state, 'zip_code': rest.zip_code,
-                 'phone_num': rest.phone_num, 'website': rest.website, 'email': rest.email,
-                 'date_established': rest.date_established, 'creator': rest.creator
-                 }
+    rest_item = {field: getattr(rest, field) for field in RESTAURANT_FIELDS}
     return rest_item
 
 
-def retrieve_restaurant(rest_id):
-    """Given a restaurant id, retrieve it from the model/database"""
+def retrieve_restaurant(rest_id, fields=None):
+    """Given a restaurant id, retrieve it from the model/database.
+    If fields are given, just those columns are retrieved as a row
+    instead of as a Restaurant object.
+    """
     rest = ret_val = http_status = None
     try:
-        rest = Restaurant.query.get(rest_id)
+        if fields:
+            rest = db.session.execute(restaurants_select(fields, Restaurant.id == rest_id)).first()
+        else:
+            rest = Restaurant.query.filter(Restaurant.id == rest_id, RESTAURANT_NOT_DELETED).first()
     except (sqlalchemy_exc.ProgrammingError, sqlalchemy_exc.DataError) as ex:
         logging.error(f'Failed to retrieve restaurant for id {rest_id}')
         logging.error(f'Exception was thrown: {str(ex)}')
@@ -127,20 +576,486 @@ def get_dict_value_trunc(some_dict, which_prop, default=None, max_length=DEF_MAX
         return prop_value
 
 
+# The fields of a restaurant that clients provide
+RESTAURANT_INPUT_FIELDS = ('name', 'street', 'suite', 'city', 'state', 'zip_code', 'phone_num',
+                           'website', 'email', 'date_established', 'creator')
+
+
+def restaurant_values_from_dict(json_dict):
+    """Validate a new restaurant given as a dict. Returns the column values
+    of the fields supplied and None, or None and a message saying what is
+    wrong.
+    """
+    if not isinstance(json_dict, dict):
+        return None, 'Restaurant must be a JSON object'
+    values = {field: get_dict_value_trunc(json_dict, field) for field in RESTAURANT_INPUT_FIELDS if field in json_dict}
+    if not values.get('name'):  # name is required
+        return None, 'Name of restaurant is required'
+    if not values.get('creator'):  # creator is required
+        return None, 'Creator of restaurant is required'
+    return values, None
+
+
+def encode_cursor(last_id, last_key=None):
+    """Encode the id, and sort key if any, of the last item of a page as an opaque cursor"""
+    cursor = {'after': last_id}
+    if last_key is not None:
+        cursor['key'] = last_key
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor made by encode_cursor into (last id, last sort key),
+    raises ValueError if it is invalid
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_dict = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id = cursor_dict['after']
+        last_key = cursor_dict.get('key')
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError, AttributeError) as ex:
+        raise ValueError(f'Invalid cursor: {cursor}') from ex
+    if not isinstance(last_id, int) or not isinstance(last_key, (int, float, type(None))):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return last_id, last_key
+
+
+def get_page_params(list_name, args=None):
+    """Parse the paging query parameters of a list endpoint, from args or
+    else the current request.
+
+    By default a list is returned a page at a time: limit is the page size,
+    capped at MAX_PAGE_SIZE, and cursor is the next_cursor of the previous
+    page. The flag all=true returns the entire list in one response.
+    """
+    args = request.args if args is None else args
+    page = ret_val = http_status = None
+    try:
+        if args.get('all', 'false').lower() == 'true':
+            page = {'limit': None, 'after': None, 'after_key': None}
+        else:
+            limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+            if limit < 1:
+                raise ValueError(f'Invalid limit: {limit}')
+            cursor = args.get('cursor')
+            after, after_key = decode_cursor(cursor) if cursor else (None, None)
+            page = {'limit': min(limit, MAX_PAGE_SIZE), 'after': after, 'after_key': after_key}
+    except ValueError as ex:
+        ret_val = {'success': False, list_name: None, 'message': str(ex), 'api_version': API_VERSION}
+        http_status = 400
+
+    return (page, ret_val, http_status)
+
+
+def get_fields_param(result_name, all_fields, args=None):
+    """Parse the fields query parameter, a comma separated list of the
+    fields to be returned and therefore the only columns selected.
+    Returns all fields if the parameter is absent.
+    """
+    args = request.args if args is None else args
+    fields = ret_val = http_status = None
+    fields_arg = args.get('fields')
+    if not fields_arg:
+        fields = all_fields
+    else:
+        fields = tuple(dict.fromkeys(field.strip() for field in fields_arg.split(',') if field.strip()))
+        invalid = [field for field in fields if field not in all_fields]
+        if invalid or not fields:
+            ret_val = {'success': False, result_name: None,
+                       'message': f'Invalid fields: {", ".join(invalid) or fields_arg}, '
+                                  f'valid fields are: {", ".join(all_fields)}',
+                       'api_version': API_VERSION
+                       }
+            http_status = 400
+            fields = None
+
+    return (fields, ret_val, http_status)
+
+
+def page_select(query, id_column, page, sort_column=None):
+    """Apply keyset pagination to a select, ordered by its id column, or by
+    sort_column then id, both descending, if a sort column is given. One
+    item more than the page size is selected, see page_items().
+    """
+    if sort_column is None:
+        if page['after'] is not None:
+            query = query.where(id_column > page['after'])
+        query = query.order_by(id_column)
+    else:
+        if page['after'] is not None:
+            query = query.where(or_(sort_column < page['after_key'],
+                                    and_(sort_column == page['after_key'], id_column < page['after'])))
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    if page['limit'] is None:
+        return query
+    # Fetch one extra item to find out whether there is a next page
+    return query.limit(page['limit'] + 1)
+
+
+def page_items(rows, page, sort_column=None):
+    """Given the rows of a page_select(), returns the items of the page and
+    the cursor of the next page, if any
+    """
+    if page['limit'] is None or len(rows) <= page['limit']:
+        return rows, None
+    items = rows[:page['limit']]
+    last_key = items[-1][sort_column.name] if sort_column is not None else None
+    return items, encode_cursor(items[-1]['id'], last_key)
+
+
+def paginate(query, id_column, page, sort_column=None):
+    """Execute a page_select() of a select. Returns the items of the page
+    and the cursor of the next page, if any.
+    """
+    rows = db.session.execute(page_select(query, id_column, page, sort_column)).fetchall()
+    return page_items(rows, page, sort_column)
+
+
+def get_sort_param(args=None):
+    """Parse the sort query parameter of the list of restaurants, which are
+    listed in id order, or top rated first with sort=top_rated. Returns the
+    column sorted by ahead of id, or None for id order.
+    """
+    args = request.args if args is None else args
+    sort_column = ret_val = http_status = None
+    sort = args.get('sort', 'id')
+    if sort not in ('id', 'top_rated'):
+        ret_val = {'success': False, 'restaurants': None,
+                   'message': f'Invalid sort: {sort}, use one of: id, top_rated',
+                   'api_version': API_VERSION
+                   }
+        http_status = 400
+    elif sort == 'top_rated':
+        sort_column = Restaurant.__table__.c.avg_rating
+
+    return (sort_column, ret_val, http_status)
+
+
+def restaurant_list_select(fields, sort_column=None):
+    """Select the given columns of the list of restaurants, and those its
+    pages are keyed by, see page_select(), and versioned by, see page_version()
+    """
+    select_fields = with_id_and_version(fields)
+    if sort_column is not None and sort_column.name not in select_fields:
+        select_fields += (sort_column.name,)
+    return restaurants_select(select_fields)
+
+
+SEARCH_WORD = re.compile(r'\w+')
+
+
+def get_search_param(args=None):
+    """Parse q, the query of the restaurant search. Returns the query and
+    its words, lowercased.
+    """
+    args = request.args if args is None else args
+    ret_val = http_status = None
+    query = args.get('q', '').strip()
+    words = SEARCH_WORD.findall(query.lower())
+    if not words or len(query) > MAX_SEARCH_LEN or len(words) > MAX_SEARCH_WORDS:
+        ret_val = {'success': False, 'restaurants': None,
+                   'message': f'Invalid q: {query[:MAX_SEARCH_LEN]}, give 1 to {MAX_SEARCH_WORDS} words '
+                              f'in at most {MAX_SEARCH_LEN} characters',
+                   'api_version': API_VERSION
+                   }
+        http_status = 400
+        query = words = None
+
+    return (query, words, ret_val, http_status)
+
+
+def restaurant_search(query, words):
+    """The filter of the restaurants matching a search query and their rank,
+    as an integer so that it can be a key of cursors.
+
+    On Postgres a restaurant matches if its search vector has every word,
+    each as a prefix, so that a query matches as it is typed, or if the
+    query is similar to a part of its name, street or city, by the
+    trigrams they share, so that misspellings match too. The rank adds
+    both, weighing the name most, then the city, then the street. Both
+    conditions are served by the GIN indexes of the table.
+
+    Elsewhere a restaurant matches if its name, street or city has every
+    word, and all matches rank the same.
+    """
+    table = Restaurant.__table__
+    columns = (table.c.name, table.c.street, table.c.city)
+    if db.engine.dialect.name != 'postgresql':
+        return and_(*[or_(*[func.lower(column).contains(word, autoescape=True) for column in columns])
+                      for word in words]), \
+            literal(0).label('search_rank')
+
+    ts_query = func.to_tsquery('simple', ' & '.join(f'{word}:*' for word in words))
+    # Word similarity, from 0 to 1, of the query and the most similar part
+    # of the column, above pg_trgm.word_similarity_threshold for <%, whose
+    # % is doubled since psycopg2 takes a lone % for a parameter
+    trigram_match = or_(*[literal(query).op('<%%')(column) for column in columns])
+    trigram_rank = func.greatest(func.word_similarity(query, table.c.name),
+                                 0.4 * func.word_similarity(query, table.c.city),
+                                 0.2 * func.word_similarity(query, table.c.street))
+    rank = func.ts_rank(table.c.search_vector, ts_query) + trigram_rank
+    return or_(table.c.search_vector.op('@@')(ts_query), trigram_match), \
+        db.cast(func.round(rank * 1000000), db.Integer).label('search_rank')
+
+
+def get_embed_params(result_name, args=None):
+    """Parse the embed query parameter, embed=reviews embeds the reviews of
+    each restaurant in it, and reviews_limit, the most reviews embedded in
+    each, capped at MAX_PAGE_SIZE. Returns the limit, or None if reviews are
+    not to be embedded.
+    """
+    args = request.args if args is None else args
+    reviews_limit = ret_val = http_status = None
+    embed = args.get('embed')
+    try:
+        if embed is not None:
+            if embed != 'reviews':
+                raise ValueError(f'Invalid embed: {embed}, use: reviews')
+            reviews_limit = int(args.get('reviews_limit', DEFAULT_EMBED_REVIEWS))
+            if reviews_limit < 0:
+                raise ValueError(f'Invalid reviews_limit: {reviews_limit}')
+            reviews_limit = min(reviews_limit, MAX_PAGE_SIZE)
+    except ValueError as ex:
+        ret_val = {'success': False, result_name: None, 'message': str(ex), 'api_version': API_VERSION}
+        http_status = 400
+        reviews_limit = None
+
+    return (reviews_limit, ret_val, http_status)
+
+
+def embed_reviews(rest_items, reviews_limit):
+    """Embed the first reviews_limit reviews, in id order, of each restaurant
+    in its item. rest_items maps restaurant ids to items. The reviews of all
+    the restaurants are retrieved with one query, which ranks the reviews of
+    each restaurant with a window function to keep the first few. Returns a
+    version token of the embedded reviews.
+    """
+    rows = []
+    if rest_items and reviews_limit > 0:
+        rows = db.session.execute(embedded_reviews_query(list(rest_items), reviews_limit))
+    return add_embedded_reviews(rest_items, rows)
+
+
+def embedded_reviews_query(rest_ids, reviews_limit):
+    """The query of the first reviews_limit reviews of each of the restaurants, see embed_reviews()"""
+    table = Review.__table__
+    row_num = func.row_number().over(partition_by=table.c.restaurant_id, order_by=table.c.id).label('row_num')
+    ranked = select([table.c[field] for field in REVIEW_FIELDS] + [row_num]) \
+        .where(table.c.restaurant_id.in_(rest_ids)).alias('ranked')
+    return select([ranked.c[field] for field in REVIEW_FIELDS]) \
+        .where(ranked.c.row_num <= reviews_limit).order_by(ranked.c.restaurant_id, ranked.c.id)
+
+
+def add_embedded_reviews(rest_items, rows):
+    """Add the review rows of embedded_reviews_query() to the items of their
+    restaurants. Returns a version token of the reviews.
+    """
+    for rest_item in rest_items.values():
+        rest_item['reviews'] = []
+    digest = hashlib.sha1()
+    for row in rows:
+        rest_items[row['restaurant_id']]['reviews'].append({field: row[field] for field in REVIEW_FIELDS})
+        digest.update(f'{row["id"]}.{row["version"]};'.encode())
+    return f'r{digest.hexdigest()[:12]}'
+
+
+STREAM_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+
+def get_stream_param(list_name, args=None, embed=False):
+    """Parse the stream query parameter, the format in which the whole list
+    is streamed, one of STREAM_FORMATS. Returns None if the list is not
+    to be streamed. A streamed list cannot have reviews embedded, embed
+    says whether the request asks for them.
+    """
+    args = request.args if args is None else args
+    ret_val = http_status = None
+    stream_format = args.get('stream') or None
+    message = None
+    if stream_format is not None and stream_format not in STREAM_FORMATS:
+        message = f'Invalid stream format: {stream_format}, use one of: {", ".join(STREAM_FORMATS)}'
+    elif stream_format is not None and embed:
+        message = 'Reviews cannot be embedded in a streamed list, page through the list instead'
+    if message:
+        ret_val = {'success': False, list_name: None, 'message': message, 'api_version': API_VERSION}
+        http_status = 400
+        stream_format = None
+
+    return (stream_format, ret_val, http_status)
+
+
+def stream_start(list_name):
+    """The start of a list streamed in the json format, the envelope of the items, see stream_list()"""
+    return (f'{{"success": true, "message": null, "next_cursor": null, '
+            f'"api_version": {json_dumps(API_VERSION)}, "{list_name}": [')
+
+
+def stream_chunk(items, first, stream_format):
+    """A chunk of the items of a streamed list, each already serialized"""
+    if stream_format == 'ndjson':
+        return '\n'.join(items) + '\n'
+    return ('' if first else ',') + ','.join(items)
+
+
+def stream_list(list_name, query, fields, stream_format):
+    """Return a response that streams the given fields of every row of the
+    select as it is read from a server-side cursor, so memory use stays flat
+    however many rows there are. The json format has the same envelope as
+    the list endpoints, the ndjson format has one item per line and no
+    envelope.
+    """
+    def generate():
+        if stream_format == 'json':
+            yield stream_start(list_name)
+        try:
+            result = db.session.execute(query.execution_options(stream_results=True))
+            first = True
+            for rows in iter(lambda: result.fetchmany(STREAM_BATCH_SIZE), []):
+                yield stream_chunk([json_dumps(row_to_dict(row, fields)) for row in rows], first, stream_format)
+                first = False
+        except Exception as ex:
+            # The status has already been sent, all we can do is cut the response short
+            logging.error(f'Failed while streaming list of {list_name}')
+            logging.error(f'Exception was thrown: {str(ex)}')
+            raise
+        if stream_format == 'json':
+            yield ']}'
+
+    return Response(stream_with_context(generate()), status=200, mimetype=STREAM_FORMATS[stream_format])
+
+
+def get_ids_param(args=None):
+    """Parse the ids query parameter, a comma separated list of at most
+    MAX_BATCH_IDS restaurant ids. Returns the distinct ids in order.
+    """
+    args = request.args if args is None else args
+    ids = ret_val = http_status = None
+    try:
+        ids = list(dict.fromkeys(int(rest_id) for rest_id in args['ids'].split(',') if rest_id.strip()))
+        if not ids:
+            raise ValueError('No ids given')
+        if len(ids) > MAX_BATCH_IDS:
+            raise ValueError(f'At most {MAX_BATCH_IDS} ids may be given')
+    except ValueError as ex:
+        ret_val = {'success': False, 'restaurants': None, 'message': f'Invalid ids: {str(ex)}',
+                   'api_version': API_VERSION
+                   }
+        http_status = 400
+        ids = None
+
+    return (ids, ret_val, http_status)
+
+
+def restaurants_by_ids_select(ids, fields):
+    """Select the given columns, and id and version, of the restaurants with the ids"""
+    return restaurants_select(with_id_and_version(fields), Restaurant.id.in_(ids)).order_by(Restaurant.id)
+
+
+def restaurants_by_ids_result(ids, found):
+    """The response content of a batch lookup of restaurants, given the
+    items of those found keyed by id
+    """
+    return {'success': True,
+            'restaurants': {str(rest_id): found[rest_id] for rest_id in ids if rest_id in found},
+            'not_found': [rest_id for rest_id in ids if rest_id not in found],
+            'message': None,
+            'api_version': API_VERSION
+            }
+
+
+def restaurants_by_ids(ids, fields, reviews_limit=None):
+    """Return the response for a batch lookup of restaurants by id, made with
+    one query, whose rows also give the ETag, and one more if reviews are
+    embedded. The restaurants are keyed by id and the ids of restaurants
+    that do not exist are listed as not_found.
+    """
+    try:
+        rows = db.session.execute(restaurants_by_ids_select(ids, fields)).fetchall()
+        version_token = page_version(rows)
+        # With embedded reviews the ETag depends on them too, so it is only known below
+        if reviews_limit is None and make_etag(version_token) in request.if_none_match:
+            return not_modified(make_etag(version_token))
+        found = {rest['id']: row_to_dict(rest, fields) for rest in rows}
+        if reviews_limit is not None:
+            version_token += '.' + embed_reviews(found, reviews_limit)
+        etag = make_etag(version_token)
+        if etag in request.if_none_match:
+            return not_modified(etag)
+    except sqlalchemy_exc.OperationalError:
+        raise  # Handled by ReplicaRouter.read_only() and database_unavailable()
+    except Exception as ex:
+        logging.error('Failed to retrieve restaurants by ids for "/restaurants" endpoint')
+        logging.error(f'Exception was thrown: {str(ex)}')
+        ret_val = {'success': False,
+            'restaurants': None,
+            'message': 'Server failure: restaurants could not be retrieved',
+            'api_version': API_VERSION
+            }
+        return jsonify(ret_val), 500
+
+    response = jsonify(restaurants_by_ids_result(ids, found))
+    response.set_etag(etag)
+    return response, 200
+
+
 @app.route(RESTAURANTS_API_BASE, methods=['GET'])
 @cross_origin()
 @requires_auth
+@replica_router.read_only
+@response_cache.cached('restaurants')
 def restaurants():
     if not requires_scope('read:restaurants'):
         raise AuthError({"success": False,
                          "message": "No access to this resource"}, 403)
 
+    fields, ret_val, http_status = get_fields_param('restaurants', RESTAURANT_FIELDS)
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
+    reviews_limit, ret_val, http_status = get_embed_params('restaurants')
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+    if reviews_limit is not None and not requires_scope('read:reviews'):
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
+    # A batch of restaurants looked up by id, e.g. ids=1,2,3
+    if 'ids' in request.args:
+        ids, ret_val, http_status = get_ids_param()
+        if ret_val:  # Something went awry
+            return jsonify(ret_val), http_status
+        return restaurants_by_ids(ids, fields, reviews_limit)
+
+    stream_format, ret_val, http_status = get_stream_param('restaurants', embed=reviews_limit is not None)
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+    if stream_format:
+        return stream_list('restaurants', restaurants_select(fields).order_by(Restaurant.id), fields, stream_format)
+
+    page, ret_val, http_status = get_page_params('restaurants')
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
+    sort_column, ret_val, http_status = get_sort_param()
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
     try:
-        restaurants = Restaurant.query.filter_by().order_by(Restaurant.id)
-        rest_list = []
-        for rest in restaurants:
-            rest_item = restaurant_to_dict(rest)
-            rest_list.append(rest_item)
+        restaurants, next_cursor = paginate(restaurant_list_select(fields, sort_column), Restaurant.id, page,
+                                            sort_column)
+        version_token = page_version(restaurants, next_cursor)
+        # With embedded reviews the ETag depends on them too, so it is only known below
+        if reviews_limit is None and make_etag(version_token) in request.if_none_match:
+            return not_modified(make_etag(version_token))
+        rest_list = [row_to_dict(rest, fields) for rest in restaurants]
+        if reviews_limit is not None:
+            rest_items = {rest['id']: rest_item for rest, rest_item in zip(restaurants, rest_list)}
+            version_token += '.' + embed_reviews(rest_items, reviews_limit)
+        etag = make_etag(version_token)
+        if etag in request.if_none_match:
+            return not_modified(etag)
+    except sqlalchemy_exc.OperationalError:
+        raise  # Handled by ReplicaRouter.read_only() and database_unavailable()
     except Exception as ex:
         logging.error('Failed to retrieve list of restaurants for "/restaurants" endpoint')
         logging.error(f'Exception was thrown: {str(ex)}')
@@ -151,27 +1066,128 @@ def restaurants():
             }
         return jsonify(ret_val), 500
 
-    ret_val = {'success': True, 'restaurants': rest_list, 'message': None, 'api_version': API_VERSION}
+    ret_val = {'success': True, 'restaurants': rest_list, 'next_cursor': next_cursor, 'message': None,
+               'api_version': API_VERSION
+               }
+    response = jsonify(ret_val)
+    response.set_etag(etag)
+    return response, 200
+
+
+@app.route(RESTAURANTS_API_BASE + '/search', methods=['GET'])
+@cross_origin()
+@requires_auth
+@replica_router.read_only
+@response_cache.cached('restaurants')
+def search_restaurants():
+    """Search restaurants by the words of their name, street and city, the
+    best matches first, see restaurant_search(). The results are paged like
+    the list of restaurants.
+    """
+    if not requires_scope('read:restaurants'):
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
+    query, words, ret_val, http_status = get_search_param()
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
+    fields, ret_val, http_status = get_fields_param('restaurants', RESTAURANT_FIELDS)
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
+    page, ret_val, http_status = get_page_params('restaurants')
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+    if page['limit'] is None:
+        ret_val = {'success': False, 'restaurants': None,
+                   'message': 'Search results are paged, all=true is not supported',
+                   'api_version': API_VERSION
+                   }
+        return jsonify(ret_val), 400
+
+    try:
+        search_filter, rank = restaurant_search(query, words)
+        restaurants, next_cursor = paginate(restaurants_select(with_id(fields), search_filter).column(rank),
+                                            Restaurant.id, page, rank)
+        rest_list = [row_to_dict(rest, fields) for rest in restaurants]
+    except sqlalchemy_exc.OperationalError:
+        raise  # Handled by ReplicaRouter.read_only() and database_unavailable()
+    except Exception as ex:
+        logging.error('Failed to search restaurants for "/restaurants/search" endpoint')
+        logging.error(f'Exception was thrown: {str(ex)}')
+        ret_val = {'success': False,
+            'restaurants': None,
+            'message': 'Server failure: restaurants could not be searched',
+            'api_version': API_VERSION
+            }
+        return jsonify(ret_val), 500
+
+    ret_val = {'success': True, 'restaurants': rest_list, 'next_cursor': next_cursor, 'message': None,
+               'api_version': API_VERSION
+               }
     return jsonify(ret_val), 200
 
 
+def restaurant_select_fields(fields, reviews_limit):
+    """The fields of a restaurant retrieved by id: those requested, its
+    version, for the ETag, and its id if its reviews are embedded
+    """
+    select_fields = fields if 'version' in fields else fields + ('version',)
+    return select_fields if reviews_limit is None else with_id(select_fields)
+
+
 @app.route(RESTAURANTS_API_BASE + '/<rest_id>', methods=['GET'])
 @cross_origin()
 @requires_auth
+@replica_router.read_only
+@response_cache.cached('restaurant:{rest_id}')
 def restaurant_by_id(rest_id):
     if not requires_scope('read:restaurants'):
         raise AuthError({"success": False,
                          "message": "No access to this resource"}, 403)
 
-    rest, ret_val, http_status = retrieve_restaurant(rest_id)
+    fields, ret_val, http_status = get_fields_param('restaurant', RESTAURANT_FIELDS)
     if ret_val:  # Something went awry
+        ret_val['id'] = rest_id
         return jsonify(ret_val), http_status
 
-    rest_item = restaurant_to_dict(rest)
+    reviews_limit, ret_val, http_status = get_embed_params('restaurant')
+    if ret_val:  # Something went awry
+        ret_val['id'] = rest_id
+        return jsonify(ret_val), http_status
+    if reviews_limit is not None and not requires_scope('read:reviews'):
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
+    # A conditional request first checks just the version, so that an
+    # unchanged restaurant is neither fully retrieved nor serialized
+    if request.if_none_match and reviews_limit is None:
+        rest, ret_val, http_status = retrieve_restaurant(rest_id, ('version',))
+        if ret_val:  # Something went awry
+            return jsonify(ret_val), http_status
+        etag = make_etag(f'v{rest.version}')
+        if etag in request.if_none_match:
+            return not_modified(etag)
+
+    rest, ret_val, http_status = retrieve_restaurant(rest_id, restaurant_select_fields(fields, reviews_limit))
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
+    rest_item = row_to_dict(rest, fields)
+    version_token = f'v{rest.version}'
+    if reviews_limit is not None:
+        version_token += '.' + embed_reviews({rest.id: rest_item}, reviews_limit)
+        etag = make_etag(version_token)
+        if etag in request.if_none_match:
+            return not_modified(etag)
+
     ret_val = {'success': True, 'id': rest_id, 'restaurant': rest_item, 'message': None,
                'api_version': API_VERSION
               }
-    return jsonify(ret_val), 200
+    response = jsonify(ret_val)
+    response.set_etag(make_etag(version_token))
+    return response, 200
 
 
 @app.route(RESTAURANTS_API_BASE + '/create', methods=['POST'])
@@ -191,31 +1207,12 @@ def restaurant_create():
         ret_val = {'success': False, 'id': None, 'message': str(ex), 'api_version': API_VERSION}
         return jsonify(ret_val), 400
 
-    name = get_dict_value_trunc(json_dict, 'name')  # name is required, validate this
-    if not name:
-        ret_val = {'success': False, 'id': None, 'message': f'Name of restaurant is required',
-                   'api_version': API_VERSION
-                  }
+    values, message = restaurant_values_from_dict(json_dict)
+    if message:
+        ret_val = {'success': False, 'id': None, 'message': message, 'api_version': API_VERSION}
         return jsonify(ret_val), 400
 
-    creator = get_dict_value_trunc(json_dict, 'creator')  # creator is required, validate this
-    if not creator:
-        ret_val = {'success': False, 'id': None, 'message': f'Creator of restaurant is required',
-                   'api_version': API_VERSION
-                  }
-        return jsonify(ret_val), 400
-
-    rest = Restaurant(name=name, creator=creator)
-
-    rest.street = get_dict_value_trunc(json_dict, 'street')
-    rest.suite = get_dict_value_trunc(json_dict, 'suite')
-    rest.city = get_dict_value_trunc(json_dict, 'city')
-    rest.state = get_dict_value_trunc(json_dict, 'state')
-    rest.zip_code = get_dict_value_trunc(json_dict, 'zip_code')
-    rest.phone_num = get_dict_value_trunc(json_dict, 'phone_num')
-    rest.website = get_dict_value_trunc(json_dict, 'website')
-    rest.email = get_dict_value_trunc(json_dict, 'email')
-    rest.date_established = get_dict_value_trunc(json_dict, 'date_established')
+    rest = Restaurant(**values)
 
     db.session.add(rest)
     db.session.commit()
@@ -230,6 +1227,231 @@ def restaurant_create():
     return jsonify(ret_val), 200
 
 
+def read_bulk_items():
+    """Yield (index, item) for each restaurant in the body of a bulk request,
+    which is either a JSON array or NDJSON, one restaurant per line. NDJSON
+    is read a line at a time. An item that cannot be decoded is yielded as
+    a string describing the problem.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        index = 0
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError as ex:
+                yield index, f'Could not decode the json content: {str(ex)}'
+            index += 1
+    else:
+        items = request.get_json()
+        if not isinstance(items, list):
+            raise werkzeug_exc.BadRequest('Expected a JSON array of restaurants')
+        # The array is read whole, so one that is too long is rejected before anything is written
+        if len(items) > BULK_MAX_ITEMS:
+            raise werkzeug_exc.BadRequest(f'A bulk request may have at most {BULK_MAX_ITEMS} restaurants')
+        yield from enumerate(items)
+
+
+def natural_key(values):
+    """The natural key of a restaurant, used to match restaurants when upserting"""
+    return (values['name'], values.get('street'), values.get('city'))
+
+
+def bulk_write_restaurants(chunk, upsert):
+    """Insert, or with upsert also update, a chunk of validated restaurants,
+    given as (index, values) pairs, in one transaction. Returns a result
+    for each item of the chunk.
+    """
+    table = Restaurant.__table__
+    results = {}
+    to_update = []  # (index, id, values)
+
+    if upsert:
+        existing = {}
+        names = {values['name'] for index, values in chunk}
+        for row in db.session.execute(select([table.c.id, table.c.name, table.c.street, table.c.city])
+                                      .where(and_(table.c.name.in_(names), RESTAURANT_NOT_DELETED))):
+            existing.setdefault((row.name, row.street, row.city), row.id)
+        to_insert = []
+        seen = set()
+        for index, values in chunk:
+            key = natural_key(values)
+            if key in seen:
+                results[index] = {'index': index, 'success': False, 'id': None,
+                                  'message': 'Duplicate of an earlier restaurant in the request'}
+            elif key in existing:
+                to_update.append((index, existing[key], values))
+            else:
+                to_insert.append((index, values))
+            seen.add(key)
+    else:
+        to_insert = chunk
+
+    if to_update:
+        # Just the fields supplied are updated, and the creator of an existing
+        # restaurant does not change. Items that supply the same fields are
+        # updated by one executemany.
+        params_by_fields = {}
+        for index, rest_id, values in to_update:
+            params = {field: value for field, value in values.items() if field != 'creator'}
+            params_by_fields.setdefault(tuple(sorted(params)), []).append(dict(params, rest_id=rest_id))
+        update = table.update().where(table.c.id == bindparam('rest_id')).values(version=table.c.version + 1)
+        for params in params_by_fields.values():
+            db.session.execute(update, params)
+        for index, rest_id, values in to_update:
+            results[index] = {'index': index, 'success': True, 'id': rest_id, 'message': 'Restaurant updated'}
+
+    if to_insert:
+        # Every row of a multi-row INSERT has the same columns, those not supplied are null
+        rows = [dict(dict.fromkeys(RESTAURANT_INPUT_FIELDS), **values) for index, values in to_insert]
+        if db.engine.dialect.name == 'postgresql':
+            # One multi-row INSERT, RETURNING the new ids in row order
+            ids = [row.id for row in db.session.execute(table.insert().values(rows).returning(table.c.id))]
+        else:
+            ids = [db.session.execute(table.insert().values(row)).inserted_primary_key[0] for row in rows]
+        for (index, values), rest_id in zip(to_insert, ids):
+            results[index] = {'index': index, 'success': True, 'id': rest_id, 'message': 'Restaurant created'}
+
+    db.session.commit()
+    # Core statements bypass the mapper events that invalidate the response cache
+    response_cache.invalidate('restaurants', *[f'restaurant:{rest_id}' for index, rest_id, values in to_update])
+    return list(results.values())
+
+
+@app.route(RESTAURANTS_API_BASE + '/bulk', methods=['POST'])
+@cross_origin()
+@requires_auth
+def restaurant_bulk_create():
+    if not requires_scope('create:restaurants'):
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
+    upsert = request.args.get('upsert', 'false').lower() == 'true'
+    if upsert and not requires_scope('update:restaurants'):
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
+    results = []
+    chunk = []
+    truncated = False
+
+    def write_chunk():
+        try:
+            results.extend(bulk_write_restaurants(chunk, upsert))
+        except (sqlalchemy_exc.IntegrityError, sqlalchemy_exc.DataError) as ex:
+            db.session.rollback()
+            logging.error(f'Failed to write a chunk of {len(chunk)} restaurants')
+            logging.error(f'Exception was thrown: {str(ex)}')
+            results.extend({'index': index, 'success': False, 'id': None,
+                            'message': f'Restaurant could not be written: {str(ex.orig)}'}
+                           for index, values in chunk)
+        chunk.clear()
+
+    try:
+        for index, item in read_bulk_items():
+            if index >= BULK_MAX_ITEMS:
+                # NDJSON is written as it is read, so the restaurants before this one stay written
+                truncated = True
+                break
+            values, message = (None, item) if isinstance(item, str) else restaurant_values_from_dict(item)
+            if message:
+                results.append({'index': index, 'success': False, 'id': None, 'message': message})
+                continue
+            chunk.append((index, values))
+            if len(chunk) == BULK_CHUNK_SIZE:
+                write_chunk()
+        if chunk:
+            write_chunk()
+    except werkzeug_exc.BadRequest as ex:
+        # Chunks before the problem have already been committed, report them too
+        logging.error('Could not process the bulk request content')
+        logging.error(str(ex))
+        results.sort(key=lambda result: result['index'])
+        ret_val = {'success': False, 'results': results, 'message': ex.description,
+                   'api_version': API_VERSION}
+        return jsonify(ret_val), 400
+
+    results.sort(key=lambda result: result['index'])
+    failed = sum(1 for result in results if not result['success'])
+    ret_val = {'success': failed == 0 and not truncated,
+               'results': results,
+               'message': f'{len(results) - failed} restaurants written, {failed} failed',
+               'api_version': API_VERSION
+               }
+    if truncated:
+        ret_val['message'] += f', those after the first {BULK_MAX_ITEMS} were not read'
+        return jsonify(ret_val), 207
+    return jsonify(ret_val), 200
+
+
+def restaurant_update_values(json_dict):
+    """Validate the changes to a restaurant given as a dict. Returns the
+    column values to set, just those of the fields supplied, and None,
+    or None and a message saying what is wrong.
+    """
+    if not isinstance(json_dict, dict):
+        return None, 'Restaurant must be a JSON object'
+    # The creator of a restaurant does not change
+    values = {field: get_dict_value_trunc(json_dict, field)
+              for field in RESTAURANT_INPUT_FIELDS if field in json_dict and field != 'creator'}
+    if 'name' in values and not values['name']:  # Restaurant name may not be blank
+        return None, 'Name of restaurant may not be blank'
+    return values, None
+
+
+def update_restaurant(rest_id, values, *conditions):
+    """Set the given column values of a restaurant, and increment its version,
+    with one UPDATE that also returns the updated row where the database
+    supports RETURNING. Only a restaurant that also meets the conditions is
+    updated. Returns the restaurant as a dictionary on success. With no
+    values to set the restaurant is returned unchanged, version included.
+    """
+    rest = ret_val = http_status = None
+    table = Restaurant.__table__
+    update = table.update().where(and_(table.c.id == rest_id, RESTAURANT_NOT_DELETED, *conditions)) \
+        .values(version=table.c.version + 1, **values)
+    returning = db.engine.dialect.name == 'postgresql'
+    try:
+        if not values:
+            row = db.session.execute(restaurants_select(RESTAURANT_FIELDS, table.c.id == rest_id, *conditions)).first()
+        elif returning:
+            row = db.session.execute(update.returning(*[table.c[field] for field in RESTAURANT_FIELDS])).first()
+        else:
+            result = db.session.execute(update)
+            row = db.session.execute(column_select(Restaurant, RESTAURANT_FIELDS, Restaurant.id == rest_id)).first() \
+                if result.rowcount else None
+        if row is not None:
+            rest = dict(zip(RESTAURANT_FIELDS, row))
+        db.session.commit()
+    except (sqlalchemy_exc.ProgrammingError, sqlalchemy_exc.DataError) as ex:
+        db.session.rollback()
+        logging.error(f'Failed to update restaurant for id {rest_id}')
+        logging.error(f'Exception was thrown: {str(ex)}')
+        ret_val = {'success': False,
+                   'id': rest_id,
+                   'restaurant': None,
+                   'message': f'Server failure: restaurant with id number {rest_id} could not be updated',
+                   'api_version': API_VERSION
+                   }
+        if isinstance(ex, sqlalchemy_exc.ProgrammingError):
+            http_status = 500
+        elif isinstance(ex, sqlalchemy_exc.DataError):
+            http_status = 400
+    else:
+        if rest is None:
+            ret_val = {'success': False, 'id': rest_id, 'restaurant': None,
+                       'message': f'No restaurant with id {rest_id} found',
+                       'api_version': API_VERSION
+                      }
+            http_status = 404
+        elif values:
+            # A Core UPDATE bypasses the mapper events that invalidate the response cache
+            response_cache.invalidate(*restaurant_cache_tags(rest['id']))
+
+    return (rest, ret_val, http_status)
+
+
 @app.route(RESTAURANTS_API_BASE + '/<rest_id>', methods=['PUT'])
 @cross_origin()
 @requires_auth
@@ -238,54 +1460,124 @@ def restaurant_update(rest_id):
         raise AuthError({"success": False,
                          "message": "No access to this resource"}, 403)
 
-    rest, ret_val, http_status = retrieve_restaurant(rest_id)
+    json_dict = None
+    try:
+        json_dict = request.json
+    except werkzeug_exc.BadRequest as ex:
+        logging.error('Could not decode the json content')
+        logging.error(str(ex))
+        ret_val = {'success': False, 'id': rest_id, 'restaurant': None, 'message': str(ex),
+                   'api_version': API_VERSION
+                  }
+        return jsonify(ret_val), 400
+
+    values, message = restaurant_update_values(json_dict)
+    if message:
+        ret_val = {'success': False, 'id': rest_id, 'restaurant': None, 'message': message,
+                   'api_version': API_VERSION
+                  }
+        return jsonify(ret_val), 400
+
+    # The updated restaurant comes back from the UPDATE itself, rather than
+    # being retrieved before and again after the change
+    rest_item, ret_val, http_status = update_restaurant(rest_id, values)
     if ret_val:  # Something went awry
         return jsonify(ret_val), http_status
 
+    ret_val = {'success': True,
+               'id': rest_item['id'],
+               'message': f"Restaurant updated: {rest_item['name']}",
+               'restaurant': rest_item,
+               'api_version': API_VERSION
+               }
+    return jsonify(ret_val), 200
+
+
+def if_match_versions(full_path):
+    """The row versions whose ETags, as make_etag makes them from
+    'v{version}' for the url full_path, are in the If-Match header. An ETag
+    of another url, or with the tokens of embedded data, matches none.
+    """
+    versions = set()
+    for etag in request.if_match.as_set():
+        token = etag.split('-', 1)[0]
+        if token.startswith('v') and token[1:].isdigit() and make_etag(token, full_path) == etag:
+            versions.add(int(token[1:]))
+    return versions
+
+
+@app.route(RESTAURANTS_API_BASE + '/<rest_id>', methods=['PATCH'])
+@cross_origin()
+@requires_auth
+def restaurant_patch(rest_id):
+    """Update the fields of a restaurant given in a partial document. With
+    an If-Match header holding the ETag of the restaurant, as last read by
+    the client, the update only happens if the restaurant is unchanged since.
+    Otherwise it fails with 412, rather than overwriting someone else's
+    changes, and the client should read the restaurant again and retry.
+    """
+    if not requires_scope('update:restaurants'):
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
     json_dict = None
     try:
         json_dict = request.json
     except werkzeug_exc.BadRequest as ex:
         logging.error('Could not decode the json content')
         logging.error(str(ex))
-        ret_val = {'success': False, 'id': rest.id, 'restaurant': None, 'message': str(ex),
+        ret_val = {'success': False, 'id': rest_id, 'restaurant': None, 'message': str(ex),
                    'api_version': API_VERSION
                   }
         return jsonify(ret_val), 400
 
-    rest.name = get_dict_value_trunc(json_dict, 'name', rest.name)
-    rest.street = get_dict_value_trunc(json_dict, 'street', rest.street)
-    rest.suite = get_dict_value_trunc(json_dict, 'suite', rest.suite)
-    rest.city = get_dict_value_trunc(json_dict, 'city', rest.city)
-    rest.state = get_dict_value_trunc(json_dict, 'state', rest.state)
-    rest.zip_code = get_dict_value_trunc(json_dict, 'zip_code', rest.zip_code)
-    rest.phone_num = get_dict_value_trunc(json_dict, 'phone_num', rest.phone_num)
-    rest.website = get_dict_value_trunc(json_dict, 'website', rest.website)
-    rest.email = get_dict_value_trunc(json_dict, 'email', rest.email)
-    rest.date_established = get_dict_value_trunc(json_dict, 'date_established', rest.date_established)
-
-    # Restaurant name may not be blank
-    if not rest.name:
-        ret_val = {'success': False, 'id': rest.id, 'restaurant': None,
-                   'message': f'Name of restaurant may not be blank',
+    values, message = restaurant_update_values(json_dict)
+    if message:
+        ret_val = {'success': False, 'id': rest_id, 'restaurant': None, 'message': message,
                    'api_version': API_VERSION
                   }
         return jsonify(ret_val), 400
 
-    db.session.add(rest)
-    db.session.commit()
+    # The ETags are those of the restaurant itself, as a GET without parameters reads it
+    rest_path = request.path + '?'
+    # The version check is part of the UPDATE, so no row lock is held between reading and writing
+    conditions = []
+    if request.if_match and not request.if_match.star_tag:
+        conditions.append(Restaurant.__table__.c.version.in_(if_match_versions(rest_path)))
+
+    rest_item, ret_val, http_status = update_restaurant(rest_id, values, *conditions)
+    if http_status == 404 and conditions:
+        # Either there is no such restaurant or its version did not match
+        rest, ret_val, http_status = retrieve_restaurant(rest_id, ('version',))
+        if not ret_val:
+            ret_val = {'success': False, 'id': rest_id, 'restaurant': None,
+                       'message': f'Restaurant with id {rest_id} has been changed, '
+                                  f'retrieve it again before updating it',
+                       'api_version': API_VERSION
+                       }
+            response = jsonify(ret_val)
+            response.set_etag(make_etag(f'v{rest.version}', rest_path))
+            return response, 412
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
 
-    # Retrieve the entire restaurant from the database and return it
-    # in the response.
-    rest, ret_val, http_status = retrieve_restaurant(rest_id)
-    rest_item = restaurant_to_dict(rest)
     ret_val = {'success': True,
-               'id': rest.id,
-               'message': f"Restaurant updated: {rest.name}",
+               'id': rest_item['id'],
+               'message': f"Restaurant updated: {rest_item['name']}",
                'restaurant': rest_item,
                'api_version': API_VERSION
                }
-    return jsonify(ret_val), 200
+    response = jsonify(ret_val)
+    response.set_etag(make_etag(f"v{rest_item['version']}", rest_path))
+    return response, 200
+
+
+def has_more_reviews_than(rest_id, threshold):
+    """Whether a restaurant has more than threshold reviews, found without counting all of them"""
+    table = Review.__table__
+    beyond = select([table.c.id]).where(table.c.restaurant_id == rest_id) \
+        .order_by(table.c.id).offset(threshold).limit(1)
+    return db.session.execute(beyond).first() is not None
 
 
 @app.route(RESTAURANTS_API_BASE + '/<rest_id>', methods=['DELETE'])
@@ -296,12 +1588,34 @@ def restaurant_delete(rest_id):
         raise AuthError({"success": False,
                          "message": "No access to this resource"}, 403)
 
-    rest, ret_val, http_status = retrieve_restaurant(rest_id)
+    rest, ret_val, http_status = retrieve_restaurant(rest_id, ('id', 'name'))
     if ret_val:  # Something went awry
         return jsonify(ret_val), http_status
 
-    db.session.delete(rest)
+    # A restaurant with many reviews, or any restaurant if the client asks,
+    # is only marked as deleted here. It disappears from the endpoints at
+    # once and is purged along with its reviews later, by the
+    # purge-deleted-restaurants command.
+    delete_later = request.args.get('async', 'false').lower() == 'true' or \
+        has_more_reviews_than(rest.id, app.config.get('ASYNC_DELETE_MIN_REVIEWS', 10000))
+    if delete_later:
+        table = Restaurant.__table__
+        db.session.execute(table.update().where(and_(table.c.id == rest.id, RESTAURANT_NOT_DELETED))
+                           .values(deleted_at=datetime.datetime.utcnow(), version=table.c.version + 1))
+    else:
+        delete_restaurant_rows(rest.id)
     db.session.commit()
+    # Core statements bypass the mapper events that invalidate the response cache
+    response_cache.invalidate(*review_cache_tags(rest.id))
+
+    if delete_later:
+        ret_val = {'success': True,
+                   'id': rest_id,
+                   'restaurant': None,
+                   'message': f'Restaurant scheduled for deletion: {rest.name}',
+                   'api_version': API_VERSION
+                   }
+        return jsonify(ret_val), 202
 
     ret_val = {'success': True,
                'id': rest_id,
@@ -321,22 +1635,61 @@ def review_to_dict(rev):
     return review_item
 
 
-@app.route(REVIEWS_API_BASE, methods=['GET'])
-@cross_origin()
-@requires_auth
-def reviews():
-    if not requires_scope('read:reviews'):
-        raise AuthError({"success": False,
-                         "message": "No access to this resource"}, 403)
+def get_review_filters(args=None):
+    """Parse the query parameters that filter the list of reviews:
+    restaurant_id, author, date_from and date_to (YYYY-MM-DD, inclusive)
+    and min_rating. Returns a list of filter expressions.
+    """
+    args = request.args if args is None else args
+    filters = ret_val = http_status = None
+    try:
+        filters = []
+        if 'restaurant_id' in args:
+            filters.append(Review.restaurant_id == int(args['restaurant_id']))
+        if 'author' in args:
+            filters.append(Review.author == args['author'])
+        if 'date_from' in args:
+            filters.append(Review.date >= datetime.date.fromisoformat(args['date_from']))
+        if 'date_to' in args:
+            filters.append(Review.date <= datetime.date.fromisoformat(args['date_to']))
+        if 'min_rating' in args:
+            filters.append(Review.rating >= int(args['min_rating']))
+    except ValueError as ex:
+        ret_val = {'success': False, 'reviews': None, 'message': f'Invalid filter: {str(ex)}',
+                   'api_version': API_VERSION
+                   }
+        http_status = 400
+        filters = None
+
+    return (filters, ret_val, http_status)
+
+
+def list_reviews(filters, endpoint):
+    """Return the response for a list of reviews matching the filters"""
+    fields, ret_val, http_status = get_fields_param('reviews', REVIEW_FIELDS)
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
+    stream_format, ret_val, http_status = get_stream_param('reviews')
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+    if stream_format:
+        return stream_list('reviews', reviews_select(fields, filters).order_by(Review.id), fields, stream_format)
+
+    page, ret_val, http_status = get_page_params('reviews')
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
 
     try:
-        reviews = Review.query.filter_by().order_by(Review.id)
-        reviews_list = []
-        for rev in reviews:
-            review_item = review_to_dict(rev)
-            reviews_list.append(review_item)
+        reviews, next_cursor = paginate(reviews_select(with_id_and_version(fields), filters), Review.id, page)
+        etag = make_etag(page_version(reviews, next_cursor))
+        if etag in request.if_none_match:
+            return not_modified(etag)
+        reviews_list = [row_to_dict(rev, fields) for rev in reviews]
+    except sqlalchemy_exc.OperationalError:
+        raise  # Handled by ReplicaRouter.read_only() and database_unavailable()
     except Exception as ex:
-        logging.error('Failed to retrieve list of reviews for "/reviews" endpoint')
+        logging.error(f'Failed to retrieve list of reviews for "{endpoint}" endpoint')
         logging.error(f'Exception was thrown: {str(ex)}')
         ret_val = {'success': False,
             'reviews': None,
@@ -345,8 +1698,52 @@ def reviews():
             }
         return jsonify(ret_val), 500
 
-    ret_val = {'success': True, 'reviews': reviews_list, 'message': None, 'api_version': API_VERSION}
-    return jsonify(ret_val), 200
+    ret_val = {'success': True, 'reviews': reviews_list, 'next_cursor': next_cursor, 'message': None,
+               'api_version': API_VERSION
+               }
+    response = jsonify(ret_val)
+    response.set_etag(etag)
+    return response, 200
+
+
+@app.route(REVIEWS_API_BASE, methods=['GET'])
+@cross_origin()
+@requires_auth
+@replica_router.read_only
+@response_cache.cached('reviews')
+def reviews():
+    if not requires_scope('read:reviews'):
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
+    filters, ret_val, http_status = get_review_filters()
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
+    return list_reviews(filters, '/reviews')
+
+
+@app.route(RESTAURANTS_API_BASE + '/<rest_id>/reviews', methods=['GET'])
+@cross_origin()
+@requires_auth
+@replica_router.read_only
+@response_cache.cached('restaurant_reviews:{rest_id}', 'restaurant:{rest_id}')
+def restaurant_reviews(rest_id):
+    if not requires_scope('read:reviews'):
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
+    # Distinguish a restaurant without reviews from one that does not exist
+    rest, ret_val, http_status = retrieve_restaurant(rest_id, ('id',))
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
+    filters, ret_val, http_status = get_review_filters()
+    if ret_val:  # Something went awry
+        return jsonify(ret_val), http_status
+
+    filters.append(Review.restaurant_id == rest.id)
+    return list_reviews(filters, '/restaurants/<id>/reviews')
 
 
 @app.errorhandler(400)
@@ -376,6 +1773,31 @@ def method_not_allowed(error):
     return jsonify(ret_val), 405
 
 
+@app.errorhandler(sqlalchemy_exc.TimeoutError)
+def database_busy(error):
+    # No database connection became free within the pool timeout
+    logging.error(error)
+    ret_val = {'success': False,
+               'message': 'Server is busy, try again shortly',
+               }
+    response = jsonify(ret_val)
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+@app.errorhandler(sqlalchemy_exc.OperationalError)
+def database_unavailable(error):
+    # The database canceled a statement that ran past the statement timeout,
+    # or could not be reached, by the replica router's retry too if it applies
+    logging.error(error)
+    ret_val = {'success': False,
+               'message': 'Database is unavailable, try again shortly',
+               }
+    response = jsonify(ret_val)
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
 @app.errorhandler(AuthError)
 def handle_auth_error(ex):
     response = jsonify(ex.error)
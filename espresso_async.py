@@ -0,0 +1,421 @@
+"""An ASGI variant of the espresso app, for reads at high concurrency.
+
+    $ uvicorn espresso_async:app --host 0.0.0.0 --port 5000
+
+The read endpoints of restaurants and reviews are async views that query
+Postgres through the asyncpg driver, so a single process holds thousands
+of requests in flight while they wait for the database, instead of one per
+thread. They execute the same selects as the views of espresso.py, built by
+the functions there, parse the same query parameters and return the same
+responses and ETags. Every other
+request is passed on to the Flask app, which runs in a thread pool.
+
+Access tokens are verified as by requires_auth. A token that has been
+verified before is found in the verified token cache; verifying a new one,
+which may fetch the JWKS, is done in the thread pool so that it does not
+block the event loop.
+
+The response cache and the read replicas of the Flask app are not used by
+the async views, and /metrics counts just the requests the Flask app serves.
+"""
+
+import logging
+
+from databases import Database
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags, quote_etag
+
+from auth0_tokens import AuthError, parse_auth_header, verified_tokens, verify_token
+import espresso
+from espresso import (API_VERSION, RESTAURANT_FIELDS, RESTAURANTS_API_BASE, REVIEW_FIELDS, REVIEWS_API_BASE,
+                      STREAM_BATCH_SIZE, STREAM_FORMATS, Restaurant, Review, add_embedded_reviews,
+                      embedded_reviews_query, get_embed_params, get_fields_param, get_ids_param, get_page_params,
+                      get_review_filters, get_sort_param, get_stream_param, make_etag, page_items, page_select,
+                      page_version, restaurant_list_select, restaurant_select_fields, restaurants_by_ids_result,
+                      restaurants_by_ids_select, restaurants_select, reviews_select, row_to_dict, stream_chunk,
+                      stream_start, with_id_and_version)
+
+# The origins CORS allows, as in espresso.py
+CORS_ORIGIN_REGEX = r'http://(127\.0\.0\.1|localhost)(:\d+)?'
+
+
+def create_database(config):
+    """The async database of the app, with a connection pool sized by the config"""
+    url = config['ASYNC_DATABASE_URI']
+    options = {}
+    if url.startswith('postgresql'):
+        options = {'min_size': config.get('ASYNC_DB_POOL_MIN_SIZE', 5),
+                   'max_size': config.get('ASYNC_DB_POOL_MAX_SIZE', 20)}
+        timeout_ms = config.get('DB_STATEMENT_TIMEOUT_MS', 0)
+        if timeout_ms > 0:
+            options['server_settings'] = {'statement_timeout': str(int(timeout_ms))}
+    return Database(url, **options)
+
+
+database = create_database(espresso.app.config)
+
+
+def json_dumps(obj, **kwargs):
+    """Serialize obj as flask.json.dumps does in the Flask app, with its JSON encoder"""
+    kwargs.setdefault('sort_keys', espresso.app.config['JSON_SORT_KEYS'])
+    kwargs.setdefault('ensure_ascii', espresso.app.config['JSON_AS_ASCII'])
+    return espresso.app.json_encoder(**kwargs).encode(obj)
+
+
+class JSONResponse(Response):
+    """A JSON response serialized as by Flask's jsonify, so that the async
+    views return exactly what the Flask views do
+    """
+    media_type = 'application/json'
+
+    def render(self, content):
+        return (json_dumps(content, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def error_response(ret_val, http_status):
+    return JSONResponse(ret_val, status_code=http_status)
+
+
+def etag_response(ret_val, etag):
+    return JSONResponse(ret_val, status_code=200, headers={'ETag': quote_etag(etag)})
+
+
+def not_modified(etag):
+    """A 304 Not Modified response"""
+    return Response(status_code=304, headers={'ETag': quote_etag(etag)})
+
+
+def request_etag(request, version_token):
+    """The ETag the Flask app gives the representation at the url of request"""
+    return make_etag(version_token, f'{request.url.path}?{request.url.query}')
+
+
+def if_none_match(request):
+    return parse_etags(request.headers.get('If-None-Match'))
+
+
+async def authorize(request, required_scope):
+    """Verify the access token of a request, as requires_auth does, and
+    raise AuthError unless it grants required_scope. Returns the scopes of
+    the token.
+    """
+    token = parse_auth_header(request.headers.get('Authorization'))
+    cached = verified_tokens.get(token)
+    if cached:
+        claims, scopes = cached
+    else:
+        claims, scopes = await run_in_threadpool(verify_token, token)
+    if required_scope not in scopes:
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+    return scopes
+
+
+async def paginate(query, id_column, page, sort_column=None):
+    """Async counterpart of espresso.paginate()"""
+    rows = await database.fetch_all(page_select(query, id_column, page, sort_column))
+    return page_items(rows, page, sort_column)
+
+
+async def embed_reviews(rest_items, reviews_limit):
+    """Async counterpart of espresso.embed_reviews()"""
+    rows = []
+    if rest_items and reviews_limit > 0:
+        rows = await database.fetch_all(embedded_reviews_query(list(rest_items), reviews_limit))
+    return add_embedded_reviews(rest_items, rows)
+
+
+def stream_list(list_name, query, fields, stream_format):
+    """Async counterpart of espresso.stream_list(), the rows are read from a
+    server-side cursor as the response is sent
+    """
+    async def generate():
+        if stream_format == 'json':
+            yield stream_start(list_name)
+        try:
+            chunk = []
+            first = True
+            async for row in database.iterate(query):
+                chunk.append(json_dumps(row_to_dict(row, fields)))
+                if len(chunk) == STREAM_BATCH_SIZE:
+                    yield stream_chunk(chunk, first, stream_format)
+                    chunk = []
+                    first = False
+            if chunk:
+                yield stream_chunk(chunk, first, stream_format)
+        except Exception as ex:
+            # The status has already been sent, all we can do is cut the response short
+            logging.error(f'Failed while streaming list of {list_name}')
+            logging.error(f'Exception was thrown: {str(ex)}')
+            raise
+        if stream_format == 'json':
+            yield ']}'
+
+    return StreamingResponse(generate(), status_code=200, media_type=STREAM_FORMATS[stream_format])
+
+
+async def retrieve_restaurant(rest_id, fields):
+    """Async counterpart of espresso.retrieve_restaurant(), which retrieves
+    just the given fields as a row
+    """
+    rest = ret_val = http_status = None
+    try:
+        rest = await database.fetch_one(restaurants_select(fields, Restaurant.id == int(rest_id)))
+    except Exception as ex:
+        logging.error(f'Failed to retrieve restaurant for id {rest_id}')
+        logging.error(f'Exception was thrown: {str(ex)}')
+        ret_val = {'success': False,
+                   'id': rest_id,
+                   'restaurant': None,
+                   'message': f'Server failure: restaurant with id number {rest_id} could not be retrieved',
+                   'api_version': API_VERSION
+                   }
+        # An id that is not a number is the client's mistake
+        http_status = 400 if isinstance(ex, ValueError) else 500
+    else:
+        if not rest:
+            ret_val = {'success': False, 'id': rest_id, 'restaurant': None,
+                       'message': f'No restaurant with id {rest_id} found',
+                       'api_version': API_VERSION
+                      }
+            http_status = 404
+
+    return (rest, ret_val, http_status)
+
+
+async def restaurants_by_ids(request, ids, fields, reviews_limit=None):
+    """Async counterpart of espresso.restaurants_by_ids()"""
+    try:
+        rows = await database.fetch_all(restaurants_by_ids_select(ids, fields))
+        version_token = page_version(rows)
+        # With embedded reviews the ETag depends on them too, so it is only known below
+        if reviews_limit is None and request_etag(request, version_token) in if_none_match(request):
+            return not_modified(request_etag(request, version_token))
+        found = {rest['id']: row_to_dict(rest, fields) for rest in rows}
+        if reviews_limit is not None:
+            version_token += '.' + await embed_reviews(found, reviews_limit)
+        etag = request_etag(request, version_token)
+        if etag in if_none_match(request):
+            return not_modified(etag)
+    except Exception as ex:
+        logging.error('Failed to retrieve restaurants by ids for "/restaurants" endpoint')
+        logging.error(f'Exception was thrown: {str(ex)}')
+        ret_val = {'success': False,
+            'restaurants': None,
+            'message': 'Server failure: restaurants could not be retrieved',
+            'api_version': API_VERSION
+            }
+        return error_response(ret_val, 500)
+
+    return etag_response(restaurants_by_ids_result(ids, found), etag)
+
+
+async def restaurants(request):
+    scopes = await authorize(request, 'read:restaurants')
+    args = request.query_params
+
+    fields, ret_val, http_status = get_fields_param('restaurants', RESTAURANT_FIELDS, args)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+
+    reviews_limit, ret_val, http_status = get_embed_params('restaurants', args)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+    if reviews_limit is not None and 'read:reviews' not in scopes:
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
+    # A batch of restaurants looked up by id, e.g. ids=1,2,3
+    if 'ids' in args:
+        ids, ret_val, http_status = get_ids_param(args)
+        if ret_val:  # Something went awry
+            return error_response(ret_val, http_status)
+        return await restaurants_by_ids(request, ids, fields, reviews_limit)
+
+    stream_format, ret_val, http_status = get_stream_param('restaurants', args, embed=reviews_limit is not None)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+    if stream_format:
+        return stream_list('restaurants', restaurants_select(fields).order_by(Restaurant.id), fields, stream_format)
+
+    page, ret_val, http_status = get_page_params('restaurants', args)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+
+    sort_column, ret_val, http_status = get_sort_param(args)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+
+    try:
+        restaurants, next_cursor = await paginate(restaurant_list_select(fields, sort_column), Restaurant.id, page,
+                                                  sort_column)
+        version_token = page_version(restaurants, next_cursor)
+        # With embedded reviews the ETag depends on them too, so it is only known below
+        if reviews_limit is None and request_etag(request, version_token) in if_none_match(request):
+            return not_modified(request_etag(request, version_token))
+        rest_list = [row_to_dict(rest, fields) for rest in restaurants]
+        if reviews_limit is not None:
+            version_token += '.' + await embed_reviews({rest['id']: rest_item
+                                                        for rest, rest_item in zip(restaurants, rest_list)},
+                                                       reviews_limit)
+        etag = request_etag(request, version_token)
+        if etag in if_none_match(request):
+            return not_modified(etag)
+    except Exception as ex:
+        logging.error('Failed to retrieve list of restaurants for "/restaurants" endpoint')
+        logging.error(f'Exception was thrown: {str(ex)}')
+        ret_val = {'success': False,
+            'restaurants': None,
+            'message': 'Server failure: list of restaurants could not be retrieved',
+            'api_version': API_VERSION
+            }
+        return error_response(ret_val, 500)
+
+    ret_val = {'success': True, 'restaurants': rest_list, 'next_cursor': next_cursor, 'message': None,
+               'api_version': API_VERSION
+               }
+    return etag_response(ret_val, etag)
+
+
+async def restaurant_by_id(request):
+    scopes = await authorize(request, 'read:restaurants')
+    args = request.query_params
+    rest_id = request.path_params['rest_id']
+
+    fields, ret_val, http_status = get_fields_param('restaurant', RESTAURANT_FIELDS, args)
+    if ret_val:  # Something went awry
+        ret_val['id'] = rest_id
+        return error_response(ret_val, http_status)
+
+    reviews_limit, ret_val, http_status = get_embed_params('restaurant', args)
+    if ret_val:  # Something went awry
+        ret_val['id'] = rest_id
+        return error_response(ret_val, http_status)
+    if reviews_limit is not None and 'read:reviews' not in scopes:
+        raise AuthError({"success": False,
+                         "message": "No access to this resource"}, 403)
+
+    # A conditional request first checks just the version, see espresso.restaurant_by_id()
+    if 'If-None-Match' in request.headers and reviews_limit is None:
+        rest, ret_val, http_status = await retrieve_restaurant(rest_id, ('version',))
+        if ret_val:  # Something went awry
+            return error_response(ret_val, http_status)
+        etag = request_etag(request, f'v{rest["version"]}')
+        if etag in if_none_match(request):
+            return not_modified(etag)
+
+    rest, ret_val, http_status = await retrieve_restaurant(rest_id, restaurant_select_fields(fields, reviews_limit))
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+
+    rest_item = row_to_dict(rest, fields)
+    version_token = f'v{rest["version"]}'
+    if reviews_limit is not None:
+        version_token += '.' + await embed_reviews({rest['id']: rest_item}, reviews_limit)
+        etag = request_etag(request, version_token)
+        if etag in if_none_match(request):
+            return not_modified(etag)
+
+    ret_val = {'success': True, 'id': rest_id, 'restaurant': rest_item, 'message': None,
+               'api_version': API_VERSION
+              }
+    return etag_response(ret_val, request_etag(request, version_token))
+
+
+async def list_reviews(request, filters, endpoint):
+    """Async counterpart of espresso.list_reviews()"""
+    args = request.query_params
+    fields, ret_val, http_status = get_fields_param('reviews', REVIEW_FIELDS, args)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+
+    stream_format, ret_val, http_status = get_stream_param('reviews', args)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+    if stream_format:
+        return stream_list('reviews', reviews_select(fields, filters).order_by(Review.id), fields, stream_format)
+
+    page, ret_val, http_status = get_page_params('reviews', args)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+
+    try:
+        reviews, next_cursor = await paginate(reviews_select(with_id_and_version(fields), filters), Review.id, page)
+        etag = request_etag(request, page_version(reviews, next_cursor))
+        if etag in if_none_match(request):
+            return not_modified(etag)
+        reviews_list = [row_to_dict(rev, fields) for rev in reviews]
+    except Exception as ex:
+        logging.error(f'Failed to retrieve list of reviews for "{endpoint}" endpoint')
+        logging.error(f'Exception was thrown: {str(ex)}')
+        ret_val = {'success': False,
+            'reviews': None,
+            'message': 'Server failure: list of reviews could not be retrieved',
+            'api_version': API_VERSION
+            }
+        return error_response(ret_val, 500)
+
+    ret_val = {'success': True, 'reviews': reviews_list, 'next_cursor': next_cursor, 'message': None,
+               'api_version': API_VERSION
+               }
+    return etag_response(ret_val, etag)
+
+
+async def reviews(request):
+    await authorize(request, 'read:reviews')
+
+    filters, ret_val, http_status = get_review_filters(request.query_params)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+
+    return await list_reviews(request, filters, '/reviews')
+
+
+async def restaurant_reviews(request):
+    await authorize(request, 'read:reviews')
+    rest_id = request.path_params['rest_id']
+
+    # Distinguish a restaurant without reviews from one that does not exist
+    rest, ret_val, http_status = await retrieve_restaurant(rest_id, ('id',))
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+
+    filters, ret_val, http_status = get_review_filters(request.query_params)
+    if ret_val:  # Something went awry
+        return error_response(ret_val, http_status)
+
+    filters.append(Review.restaurant_id == rest['id'])
+    return await list_reviews(request, filters, '/restaurants/<id>/reviews')
+
+
+async def handle_auth_error(request, ex):
+    return JSONResponse(ex.error, status_code=ex.status_code)
+
+
+flask_app = WSGIMiddleware(espresso.app)
+
+routes = [
+    Route(RESTAURANTS_API_BASE, restaurants, methods=['GET']),
+    # The search is served by the Flask app, it is not a restaurant id
+    Route(RESTAURANTS_API_BASE + '/search', flask_app),
+    Route(RESTAURANTS_API_BASE + '/{rest_id}', restaurant_by_id, methods=['GET']),
+    Route(REVIEWS_API_BASE, reviews, methods=['GET']),
+    Route(RESTAURANTS_API_BASE + '/{rest_id}/reviews', restaurant_reviews, methods=['GET']),
+    # Everything else, including the other methods of the urls above, is served by the Flask app
+    Mount('', app=flask_app),
+]
+
+# The CORS headers of all responses, including those of the Flask app, which it replaces
+middleware = [
+    Middleware(CORSMiddleware, allow_origin_regex=CORS_ORIGIN_REGEX, allow_credentials=True,
+               allow_methods=['*'], allow_headers=['*']),
+]
+
+app = Starlette(routes=routes, middleware=middleware, exception_handlers={AuthError: handle_auth_error},
+                on_startup=[database.connect], on_shutdown=[database.disconnect])
@@ -0,0 +1,71 @@
+"""Configuration of gunicorn, the production server of the app.
+
+    $ gunicorn --config gunicorn.conf.py espresso:app
+
+Every setting can be overridden with an ESPRESSO_GUNICORN_ environment
+variable. The defaults suit one CPU and 1 GB of memory: 2 worker processes
+of 4 threads each. The requests of the app mostly wait for the database or
+Auth0, so threads serve them well.
+
+Each worker has its own database connection pool, so the workers open up to
+workers * (ESPRESSO_DB_POOL_SIZE + ESPRESSO_DB_MAX_OVERFLOW) connections,
+which must stay below max_connections of Postgres. A pool larger than the
+threads of a worker is never used in full.
+
+Send HUP to the master process to reload the configuration and replace the
+workers gracefully. With preload_app the code is loaded once, by the master,
+so new code needs USR2, which starts a new master, then WINCH and QUIT to the
+old one.
+"""
+
+import glob
+import os
+
+bind = os.environ.get('ESPRESSO_GUNICORN_BIND', '0.0.0.0:5000')
+
+worker_class = 'gthread'
+workers = int(os.environ.get('ESPRESSO_GUNICORN_WORKERS', 2))
+threads = int(os.environ.get('ESPRESSO_GUNICORN_THREADS', 4))
+
+# Load the app in the master before forking, so the workers share its memory and start quickly
+preload_app = os.environ.get('ESPRESSO_GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Replace each worker after this many requests, give or take the jitter, bounding any leak
+max_requests = int(os.environ.get('ESPRESSO_GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('ESPRESSO_GUNICORN_MAX_REQUESTS_JITTER', 500))
+
+timeout = int(os.environ.get('ESPRESSO_GUNICORN_TIMEOUT', 30))  # Seconds a worker may be silent before it is killed
+graceful_timeout = int(os.environ.get('ESPRESSO_GUNICORN_GRACEFUL_TIMEOUT', 30))  # Seconds to finish requests
+keepalive = int(os.environ.get('ESPRESSO_GUNICORN_KEEPALIVE', 5))  # Seconds an idle connection is kept open
+
+accesslog = os.environ.get('ESPRESSO_GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('ESPRESSO_GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # The snapshots of the workers of a previous run would otherwise be added to /metrics
+    multiproc_dir = os.environ.get('ESPRESSO_METRICS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, 'metrics_*.json*')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    # The counters of the worker would otherwise drop out of /metrics when it is replaced, and its snapshot be
+    # read forever, or taken over by a new worker that gets its pid
+    multiproc_dir = os.environ.get('ESPRESSO_METRICS_MULTIPROC_DIR')
+    if multiproc_dir:
+        from metrics import archive_snapshot
+        archive_snapshot(multiproc_dir, worker.pid)
+
+
+def post_fork(server, worker):
+    # Connections opened by the master while preloading must not be shared by the workers
+    if preload_app:
+        from espresso import app, db
+        with app.app_context():
+            db.get_engine().dispose()
+            for bind_key in app.config.get('SQLALCHEMY_BINDS') or {}:
+                db.get_engine(bind=bind_key).dispose()
@@ -0,0 +1,80 @@
+"""Serialization of the JSON of responses with orjson, a JSON library
+written in Rust that encodes several times faster than the standard library.
+
+JSONBackend installs OrjsonEncoder as the JSON encoder of the app, so
+jsonify and flask.json.dumps, and hence the list, streamed and cached
+responses, all use it. If orjson is not installed, or JSON_BACKEND is json,
+the app keeps Flask's encoder, which uses the standard library.
+
+The output is the same JSON as Flask's, keys sorted as JSON_SORT_KEYS says,
+dates and datetimes as HTTP dates, e.g. Wed, 16 Dec 2020 00:00:00 GMT, and
+anything else orjson does not know as Flask's encoder serializes it. It differs only in its bytes: it is always compact and
+UTF-8, non-ASCII characters are not escaped.
+"""
+
+import datetime
+from functools import lru_cache
+import logging
+
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+@lru_cache(maxsize=4096)
+def http_date(date):
+    """A date as an HTTP date, as werkzeug.http.http_date formats it, but
+    faster, and cached since the dates of a list tend to repeat
+    """
+    return f'{WEEKDAYS[date.weekday()]}, {date.day:02d} {MONTHS[date.month - 1]} {date.year:04d} 00:00:00 GMT'
+
+
+class OrjsonEncoder(JSONEncoder):
+    """Flask's JSON encoder, with encode() done by orjson where it can"""
+
+    def default(self, o):
+        if type(o) is datetime.date:  # Not a datetime, which Flask converts to UTC first
+            return http_date(o)
+        return super().default(o)
+
+    def encode(self, o):
+        # orjson indents by 2 spaces or not at all
+        if self.indent in (None, 2) and not self.skipkeys:
+            option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if self.indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                # Dates, and whatever else orjson cannot serialize, are passed to Flask's default()
+                return orjson.dumps(o, default=self.default, option=option).decode()
+            except orjson.JSONEncodeError:
+                pass  # E.g. an integer of more than 64 bits, which the standard library can serialize
+        return super().encode(o)
+
+
+class JSONBackend:
+    """Chooses the JSON encoder of the app, see the module docstring"""
+
+    def __init__(self, app=None):
+        self.name = 'json'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('JSON_BACKEND', 'orjson')
+        if backend == 'orjson':
+            if orjson is None:
+                logging.warning('JSON_BACKEND is orjson but orjson is not installed, using the standard library')
+            else:
+                app.json_encoder = OrjsonEncoder
+                self.name = 'orjson'
+        elif backend != 'json':
+            raise ValueError(f'Invalid JSON_BACKEND: {backend}, use one of: orjson, json')
@@ -0,0 +1,338 @@
+"""Metrics of the app in the Prometheus text exposition format, served at /metrics.
+
+Counters and histograms are kept by the module level registry, so that
+any module can record them, e.g. auth0_tokens records the latency of JWKS
+fetches. Each request is counted, by route, method and status, and its
+latency observed.
+
+With several worker processes, set METRICS_MULTIPROC_DIR to a directory
+shared by the workers and emptied when the server starts. Each worker
+then writes a snapshot of its metrics there, at most every
+METRICS_WRITE_INTERVAL seconds and when it exits, and /metrics, whichever
+worker serves it, adds up the snapshots of all of them. Gauges are not
+added up, each worker's is reported with a pid label. When a worker
+exits, the gunicorn master folds its snapshot into an archive, see
+archive_snapshot.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from flask import Response, g, request
+from sqlalchemy import exc as sqlalchemy_exc
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds in seconds of the buckets of latency histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# The counters and histograms of the workers that exited, see archive_snapshot
+ARCHIVE_FILE = 'metrics_archive.json'
+
+
+def format_labels(labels, extra=()):
+    """Format label pairs as {name="value",...}, escaped as the text format requires"""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for name, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def read_snapshot_file(path):
+    """The snapshot written at path, or None if there is none"""
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+    except FileNotFoundError:
+        return None  # Its worker exited and was archived since the directory was listed
+    except (OSError, ValueError) as ex:
+        logging.error(f'Failed to read metrics snapshot {path}: {str(ex)}')
+        return None
+
+
+def write_snapshot_file(path, snapshot):
+    try:
+        with open(path + '.tmp', 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(path + '.tmp', path)  # Readers never see a partly written snapshot
+    except OSError as ex:
+        logging.error(f'Failed to write metrics snapshot {path}')
+        logging.error(f'Exception was thrown: {str(ex)}')
+
+
+def add_up(snapshots):
+    """The counters and histograms of the snapshots added up, as (counters, histograms) dictionaries"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts in snapshot['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            totals = histograms.get(key)
+            histograms[key] = counts if totals is None else [a + b for a, b in zip(totals, counts)]
+    return counters, histograms
+
+
+def archive_snapshot(multiproc_dir, pid):
+    """Fold the counters and histograms of the snapshot of a worker that
+    exited into the archive of the multiprocess directory, and delete the
+    snapshot, so that the totals of /metrics do not drop when workers are
+    replaced, nor are the snapshots of dead workers read forever. Gauges
+    are dropped with the worker. Called by the gunicorn master.
+    """
+    path = os.path.join(multiproc_dir, f'metrics_{pid}.json')
+    snapshot = read_snapshot_file(path)
+    if snapshot is not None:
+        archive_path = os.path.join(multiproc_dir, ARCHIVE_FILE)
+        archive = read_snapshot_file(archive_path) or {'folded': [], 'counters': [], 'histograms': []}
+        counters, histograms = add_up([archive, snapshot])
+        # The ids of the folded snapshots let readers that still see one skip it. A worker that
+        # later gets the same pid has another id.
+        write_snapshot_file(archive_path, {
+            'folded': archive['folded'] + [snapshot['id']],
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), counts] for (name, labels), counts in histograms.items()],
+        })
+    for leftover in (path, path + '.tmp'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+
+class MetricsRegistry:
+    """Counters and histograms, each identified by a metric name and a set of labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metadata = {}  # name -> (type, help, buckets)
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._collectors = []
+
+        self.multiproc_dir = None
+        self.write_interval = 1.0
+        self._last_write = 0.0
+        self._snapshot_pid = None
+        self._snapshot_id = None
+
+    def describe(self, name, metric_type, help_text, buckets=DEFAULT_BUCKETS):
+        """Declare a metric, metric_type is counter, gauge or histogram"""
+        self._metadata[name] = (metric_type, help_text, tuple(buckets))
+
+    def inc(self, name, labels=None, amount=1):
+        """Add amount to a counter"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        """Record an observation, e.g. a latency in seconds, in a histogram"""
+        buckets = self._metadata[name][2]
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            counts = self._histograms.get(key)
+            if counts is None:
+                counts = self._histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def add_collector(self, collector):
+        """Register a function called whenever the metrics are collected.
+        It returns (name, labels, value) samples of counters that another
+        object keeps, such as the hits of a cache.
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        """The current metrics of this process, in a form that can be written as JSON"""
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(counts)] for (name, labels), counts in self._histograms.items()]
+        gauges = []
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                samples = gauges if self._metadata.get(name, ('counter',))[0] == 'gauge' else counters
+                samples.append([name, sorted(labels.items()), value])
+        pid = os.getpid()
+        if pid != self._snapshot_pid:  # A new process, e.g. a worker forked from the gunicorn master
+            self._snapshot_pid, self._snapshot_id = pid, uuid.uuid4().hex
+        return {'id': self._snapshot_id, 'pid': pid,
+                'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def write_snapshot(self, force=False):
+        """Write the snapshot of this process into the multiprocess directory,
+        if there is one and the last write is older than the write interval
+        """
+        now = time.monotonic()
+        if not self.multiproc_dir or (not force and now - self._last_write < self.write_interval):
+            return
+        self._last_write = now
+        write_snapshot_file(os.path.join(self.multiproc_dir, f'metrics_{os.getpid()}.json'), self.snapshot())
+
+    def collect(self):
+        """The metrics of this process, plus those of the other worker
+        processes if there is a multiprocess directory, added up. Gauges,
+        such as the connections checked out of a pool, are not added up
+        but kept apart by a pid label. Returns (counters, histograms)
+        dictionaries, the gauges among the counters.
+        """
+        snapshots = [self.snapshot()]
+        if self.multiproc_dir:
+            own_path = os.path.join(self.multiproc_dir, f'metrics_{os.getpid()}.json')
+            archive_path = os.path.join(self.multiproc_dir, ARCHIVE_FILE)
+            for path in glob.glob(os.path.join(self.multiproc_dir, 'metrics_*.json')):
+                snapshot = read_snapshot_file(path) if path not in (own_path, archive_path) else None
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+            # Read last, so that a worker that exits meanwhile is counted by its snapshot or the archive,
+            # and skipped if counted by both
+            archive = read_snapshot_file(archive_path)
+            if archive is not None:
+                folded = set(archive['folded'])
+                snapshots = [snapshot for snapshot in snapshots if snapshot.get('id') not in folded]
+                snapshots.append(archive)
+
+        counters, histograms = add_up(snapshots)
+        for snapshot in snapshots:
+            for name, labels, value in snapshot.get('gauges', ()):
+                key = (name, tuple(sorted([tuple(pair) for pair in labels] + [('pid', str(snapshot['pid']))])))
+                counters[key] = value
+        return counters, histograms
+
+    def render(self):
+        """All the metrics in the Prometheus text exposition format"""
+        counters, histograms = self.collect()
+
+        # Ratios are computed from the added up hits and misses, not averaged over processes
+        for (name, labels), hits in list(counters.items()):
+            if name == 'espresso_cache_hits_total':
+                lookups = hits + counters.get(('espresso_cache_misses_total', labels), 0)
+                counters[('espresso_cache_hit_ratio', labels)] = hits / lookups if lookups else 0.0
+
+        samples = {}
+        for (name, labels), value in sorted(counters.items()):
+            samples.setdefault(name, []).append(f'{name}{format_labels(labels)} {format_value(value)}')
+        for (name, labels), counts in sorted(histograms.items()):
+            buckets = self._metadata[name][2]
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(buckets, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {counts[-1]}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(counts[-2])}')
+            lines.append(f'{name}_count{format_labels(labels)} {counts[-1]}')
+
+        output = []
+        for name in sorted(samples):
+            metric_type, help_text, buckets = self._metadata.get(name, ('untyped', '', ()))
+            output.append(f'# HELP {name} {help_text}')
+            output.append(f'# TYPE {name} {metric_type}')
+            output.extend(samples[name])
+        return '\n'.join(output) + '\n'
+
+
+registry = MetricsRegistry()
+
+registry.describe('espresso_http_requests_total', 'counter', 'Requests handled, by route, method and status')
+registry.describe('espresso_http_request_duration_seconds', 'histogram', 'Latency of requests, by route and method')
+registry.describe('espresso_jwks_fetch_duration_seconds', 'histogram', 'Latency of fetches of the Auth0 JWKS')
+registry.describe('espresso_db_pool_checkout_wait_seconds', 'histogram',
+                  'Time spent waiting for a database connection from the pool')
+registry.describe('espresso_db_pool_checked_out', 'gauge', 'Database connections checked out of the pool')
+registry.describe('espresso_db_pool_capacity', 'gauge', 'Most connections the pool hands out, size plus overflow')
+registry.describe('espresso_db_pool_saturated_total', 'counter',
+                  'Checkouts that left no connection in the pool, not even overflow')
+registry.describe('espresso_db_pool_timeouts_total', 'counter', 'Checkouts that timed out waiting for a connection')
+registry.describe('espresso_cache_hits_total', 'counter', 'Cache hits, by cache')
+registry.describe('espresso_cache_misses_total', 'counter', 'Cache misses, by cache')
+registry.describe('espresso_cache_hit_ratio', 'gauge', 'Hits divided by lookups, by cache')
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that records how long each checkout waits for a connection,
+    and logs and counts checkouts that saturate the pool or time out
+    """
+
+    SATURATION_LOG_INTERVAL = 60  # Seconds between warnings that the pool is saturated
+
+    _last_saturation_log = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except sqlalchemy_exc.TimeoutError:
+            registry.inc('espresso_db_pool_timeouts_total')
+            logging.error(f'Timed out after {time.perf_counter() - start:.1f} s waiting for a database connection, '
+                          f'{self.checkedout()} of {self.capacity()} are in use')
+            raise
+        finally:
+            registry.observe('espresso_db_pool_checkout_wait_seconds', time.perf_counter() - start)
+
+        if self._max_overflow >= 0 and self.checkedout() >= self.capacity():
+            registry.inc('espresso_db_pool_saturated_total')
+            now = time.monotonic()
+            if now - self._last_saturation_log >= self.SATURATION_LOG_INTERVAL:
+                self._last_saturation_log = now
+                logging.warning(f'Database connection pool is saturated, all {self.capacity()} connections '
+                                f'are in use, further requests wait up to {self._timeout} s for one')
+        return conn
+
+    def capacity(self):
+        """The most connections the pool hands out at once"""
+        return self.size() + max(self._max_overflow, 0)
+
+
+class Metrics:
+    """Records the count and latency of each request and serves /metrics"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        registry.multiproc_dir = app.config.get('METRICS_MULTIPROC_DIR')
+        registry.write_interval = app.config.get('METRICS_WRITE_INTERVAL', 1.0)
+        if registry.multiproc_dir:
+            atexit.register(registry.write_snapshot, force=True)
+
+        app.before_request(self.start_request)
+        app.after_request(self.record_request)
+        # Unauthenticated, like the metrics endpoints Prometheus usually scrapes
+        app.add_url_rule('/metrics', 'metrics', self.metrics_endpoint, methods=['GET'])
+
+    def start_request(self):
+        g.metrics_start = time.perf_counter()
+
+    def record_request(self, response):
+        start = g.get('metrics_start')
+        if start is not None:
+            # Routes rather than urls, e.g. /api/v2/restaurants/<rest_id>, keep the number of label values bounded
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            registry.inc('espresso_http_requests_total',
+                         {'route': route, 'method': request.method, 'status': str(response.status_code)})
+            registry.observe('espresso_http_request_duration_seconds', time.perf_counter() - start,
+                             {'route': route, 'method': request.method})
+        registry.write_snapshot()
+        return response
+
+    def metrics_endpoint(self):
+        return Response(registry.render(), status=200, mimetype=None, content_type=CONTENT_TYPE)
@@ -0,0 +1,57 @@
+"""Add full text and trigram search of restaurants
+
+Revision ID: 37d64836c208
+Revises: f3c9a2b61d05
+Create Date: 2026-10-18 16:47:03.284117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '37d64836c208'
+down_revision = 'f3c9a2b61d05'
+branch_labels = None
+depends_on = None
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}city, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce({row}street, '')), 'C')"""
+
+
+def upgrade():
+    # Creating the extension needs a superuser before Postgres 13
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    op.add_column('restaurant', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute(f'UPDATE restaurant SET search_vector = {SEARCH_VECTOR.format(row="")}')
+    op.execute(f"""
+CREATE OR REPLACE FUNCTION restaurant_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""")
+    op.execute('CREATE TRIGGER restaurant_search_vector_update BEFORE INSERT OR UPDATE OF name, city, street '
+               'ON restaurant FOR EACH ROW EXECUTE PROCEDURE restaurant_search_vector_update()')
+
+    op.create_index('ix_restaurant_search_vector', 'restaurant', ['search_vector'], unique=False,
+                    postgresql_using='gin')
+    for column in ('name', 'street', 'city'):
+        op.create_index(f'ix_restaurant_{column}_trgm', 'restaurant', [column], unique=False,
+                        postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    for column in ('name', 'street', 'city'):
+        op.drop_index(f'ix_restaurant_{column}_trgm', table_name='restaurant')
+    op.drop_index('ix_restaurant_search_vector', table_name='restaurant')
+
+    op.execute('DROP TRIGGER restaurant_search_vector_update ON restaurant')
+    op.execute('DROP FUNCTION restaurant_search_vector_update()')
+    op.drop_column('restaurant', 'search_vector')
+    # pg_trgm is left installed, other database objects may use it
@@ -0,0 +1,27 @@
+"""Add indexes for filtering and paging reviews
+
+Revision ID: c4e1d2a7f3b8
+Revises: b9b0342a5406
+Create Date: 2026-10-18 09:12:40.514219
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e1d2a7f3b8'
+down_revision = 'b9b0342a5406'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_review_restaurant_id_id', 'review', ['restaurant_id', 'id'], unique=False)
+    op.create_index('ix_review_author_id', 'review', ['author', 'id'], unique=False)
+    op.create_index('ix_review_date', 'review', ['date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_review_date', table_name='review')
+    op.drop_index('ix_review_author_id', table_name='review')
+    op.drop_index('ix_review_restaurant_id_id', table_name='review')
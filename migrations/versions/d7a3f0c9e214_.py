@@ -0,0 +1,36 @@
+"""Add rating aggregates to restaurant
+
+After upgrading, backfill the aggregates of existing reviews with
+    $ flask rebuild-rating-stats
+
+Revision ID: d7a3f0c9e214
+Revises: c4e1d2a7f3b8
+Create Date: 2026-10-18 10:03:17.208836
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3f0c9e214'
+down_revision = 'c4e1d2a7f3b8'
+branch_labels = None
+depends_on = None
+
+COUNT_COLUMNS = ['rating_count', 'rating_sum', 'rating_1_count', 'rating_2_count', 'rating_3_count',
+                 'rating_4_count', 'rating_5_count']
+
+
+def upgrade():
+    for column in COUNT_COLUMNS:
+        op.add_column('restaurant', sa.Column(column, sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('restaurant', sa.Column('avg_rating', sa.Float(), nullable=False, server_default='0'))
+    op.create_index('ix_restaurant_avg_rating_id', 'restaurant', ['avg_rating', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_restaurant_avg_rating_id', table_name='restaurant')
+    op.drop_column('restaurant', 'avg_rating')
+    for column in reversed(COUNT_COLUMNS):
+        op.drop_column('restaurant', column)
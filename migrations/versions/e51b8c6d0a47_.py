@@ -0,0 +1,26 @@
+"""Add row versions to restaurant and review for ETags
+
+Revision ID: e51b8c6d0a47
+Revises: d7a3f0c9e214
+Create Date: 2026-10-18 11:26:52.730194
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e51b8c6d0a47'
+down_revision = 'd7a3f0c9e214'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('restaurant', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('review', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('review', 'version')
+    op.drop_column('restaurant', 'version')
@@ -0,0 +1,35 @@
+"""Cascade deletes of restaurants to their reviews, add soft deletes of restaurants
+
+Revision ID: f3c9a2b61d05
+Revises: e51b8c6d0a47
+Create Date: 2026-10-18 14:02:41.519360
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c9a2b61d05'
+down_revision = 'e51b8c6d0a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The foreign key was created unnamed, this is the name Postgres gave it
+    op.drop_constraint('review_restaurant_id_fkey', 'review', type_='foreignkey')
+    op.create_foreign_key('review_restaurant_id_fkey', 'review', 'restaurant', ['restaurant_id'], ['id'],
+                          ondelete='CASCADE')
+
+    op.add_column('restaurant', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_restaurant_deleted_at', 'restaurant', ['deleted_at'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_restaurant_deleted_at', table_name='restaurant')
+    op.drop_column('restaurant', 'deleted_at')
+
+    op.drop_constraint('review_restaurant_id_fkey', 'review', type_='foreignkey')
+    op.create_foreign_key('review_restaurant_id_fkey', 'review', 'restaurant', ['restaurant_id'], ['id'])
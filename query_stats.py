@@ -0,0 +1,136 @@
+"""Statistics of the SQL statements executed while handling each request.
+
+Engine events time every statement. The number of statements, the total
+time spent in the database and the slowest statement of a request are
+returned in its Server-Timing response header, and statements slower than
+a threshold are logged with their bound parameters redacted.
+
+Tests can hold an endpoint to a budget of statements with max_queries().
+"""
+
+from contextlib import contextmanager
+import logging
+import time
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def redact_value(value):
+    """Stand in for a bound parameter value in logs, by its type name"""
+    return None if value is None else f'<{type(value).__name__}>'
+
+
+def redact_parameters(parameters):
+    """The bound parameters of a statement, or of an executemany, with the
+    values replaced by their type names so that logs do not leak data
+    """
+    if isinstance(parameters, dict):
+        return {name: redact_value(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return type(parameters)(redact_parameters(item) if isinstance(item, (dict, list, tuple))
+                                else redact_value(item) for item in parameters)
+    return redact_value(parameters)
+
+
+class RequestQueryStats:
+    """The statements executed while handling one request"""
+
+    def __init__(self, collector):
+        self.collector = collector  # The QueryStats that records these
+        self.count = 0
+        self.total_time = 0.0  # Seconds
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        if duration >= self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement
+
+    def server_timing(self):
+        """The value of a Server-Timing header with these statistics, durations are in milliseconds"""
+        timing = f'db;dur={self.total_time * 1000:.2f};desc="{self.count} queries"'
+        if self.count:
+            timing += f', db-slowest;dur={self.slowest_time * 1000:.2f}'
+        return timing
+
+
+class QueryStats:
+    """Collects the statistics of the statements of each request in
+    g.query_stats, and logs slow statements whether in a request or not
+    """
+
+    def __init__(self, app=None):
+        self.headers_enabled = False
+        self.slow_query_threshold = None  # Seconds, None for no slow query log
+        self.log_parameters = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.headers_enabled = app.config.get('QUERY_STATS_HEADERS', True)
+        threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS', 500)
+        self.slow_query_threshold = threshold_ms / 1000 if threshold_ms > 0 else None
+        self.log_parameters = app.config.get('SLOW_QUERY_LOG_PARAMETERS', False)
+
+        app.before_request(self.start_request)
+        app.after_request(self.add_server_timing)
+        # Every engine, including those of read replicas, is instrumented
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def start_request(self):
+        g.query_stats = RequestQueryStats(self)
+
+    def add_server_timing(self, response):
+        stats = g.get('query_stats')
+        if self.headers_enabled and stats is not None:
+            response.headers.add('Server-Timing', stats.server_timing())
+        return response
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start_times = conn.info.get('query_start_times')
+        if not start_times:
+            return
+        duration = time.perf_counter() - start_times.pop()
+
+        if has_request_context():
+            stats = g.get('query_stats')
+            if stats is not None and stats.collector is self:
+                stats.record(statement, duration)
+
+        if self.slow_query_threshold is not None and duration >= self.slow_query_threshold:
+            logged_parameters = parameters if self.log_parameters else redact_parameters(parameters)
+            logging.warning(f'Slow query took {duration * 1000:.1f} ms: {statement} '
+                            f'with parameters {logged_parameters}')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def max_queries(budget):
+    """Context manager for tests, fails if the code within it executes more
+    than budget statements. Yields the list of statements executed.
+    """
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count_statement)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count_statement)
+    if len(statements) > budget:
+        raise QueryBudgetExceeded(f'{len(statements)} queries executed, the budget is {budget}:\n'
+                                  + '\n'.join(statements))
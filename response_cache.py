@@ -0,0 +1,229 @@
+"""Cache of the responses of read endpoints, invalidated by writes.
+
+Cached responses are tagged with the entities they were built from, e.g.
+'restaurants' or 'restaurant:7', and a write invalidates exactly the tags
+it affects. The in-process LRUCacheBackend is the default; a shared backend
+such as one on Redis can be plugged in by implementing CacheBackend and
+naming the class in the RESPONSE_CACHE_BACKEND setting.
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import wraps
+from importlib import import_module
+import threading
+import time
+
+from flask import Response, _request_ctx_stack, current_app, g, request
+
+
+# The generations of tags are counted in this many slots, see LRUCacheBackend.generations()
+GENERATION_SLOTS = 4096
+
+
+class CacheBackend(ABC):
+    """Interface of a cache backend.
+
+    Values are stored with a ttl in seconds and a list of tags. A shared
+    backend must make invalidate_tags() visible to every worker process.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, key):
+        """Return the value stored under key, or None"""
+
+    @abstractmethod
+    def set(self, key, value, tags, ttl=None, generations=None):
+        """Store a value under key, tagged with tags, for ttl seconds. Given
+        the generations of the tags from before the value was computed, the
+        value is not stored if any of them has been invalidated since.
+        """
+
+    @abstractmethod
+    def generations(self, tags):
+        """Return a token that changes whenever any of the tags is invalidated or the cache cleared"""
+
+    @abstractmethod
+    def invalidate_tags(self, tags):
+        """Drop every value tagged with any of the tags, and start a new generation of each"""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every value, start a new generation of every tag, and reset the counters"""
+
+    @abstractmethod
+    def stats(self):
+        """Return the counters of the backend as a dictionary"""
+
+
+class LRUCacheBackend(CacheBackend):
+    """An in-process backend, bounded in size, least recently used values are evicted first"""
+
+    def __init__(self, max_entries, ttl):
+        super().__init__(max_entries, ttl)
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tag_keys = {}  # tag -> set of keys
+        self._generations = [0] * GENERATION_SLOTS
+        self._clears = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value, tags = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, tags, ttl=None, generations=None):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generations is not None and generations != self._current_generations(tags):
+                return  # Computed from data that a write has changed since
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, value, tags)
+            for tag in tags:
+                self._tag_keys.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def generations(self, tags):
+        with self._lock:
+            return self._current_generations(tags)
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[hash(tag) % GENERATION_SLOTS] += 1
+                for key in self._tag_keys.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tag_keys.clear()
+            self._clears += 1
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries), 'evictions': self.evictions,
+                'invalidations': self.invalidations
+                }
+
+    def _current_generations(self, tags):
+        # Tags share a bounded number of counters, one that shares another's
+        # invalidation at worst skips storing a value
+        return (self._clears,) + tuple(self._generations[hash(tag) % GENERATION_SLOTS] for tag in tags)
+
+    def _remove(self, key):
+        expires_at, value, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+
+def load_backend(dotted_path, max_entries, ttl):
+    """Instantiate the backend class named by a dotted path, e.g. 'response_cache.LRUCacheBackend'"""
+    module_name, class_name = dotted_path.rsplit('.', 1)
+    backend_class = getattr(import_module(module_name), class_name)
+    return backend_class(max_entries, ttl)
+
+
+class ResponseCache:
+    """Caches successful responses of view functions, see cached()"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        self.backend = load_backend(app.config.get('RESPONSE_CACHE_BACKEND', 'response_cache.LRUCacheBackend'),
+                                    app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 10000),
+                                    app.config.get('RESPONSE_CACHE_TTL', 60))
+
+    def cached(self, *tag_templates):
+        """Decorator for a view that caches its 200 responses to GET requests.
+
+        The tag templates are formatted with the view's keyword arguments,
+        e.g. 'restaurant:{rest_id}'. Since a response depends on what the
+        caller is authorized to see, the cache key includes the scopes of
+        the access token, so this must be applied after requires_auth.
+
+        Code that runs before the view may set g.response_cache_ttl to
+        shorten the ttl of its response, or g.response_cache_bypass to
+        neither look up nor store it.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                if not self.enabled or request.method != 'GET' or g.get('response_cache_bypass'):
+                    return f(*args, **kwargs)
+
+                scopes = getattr(_request_ctx_stack.top, 'current_scopes', None) or ()
+                key = f'{request.full_path}|{" ".join(sorted(scopes))}'
+                entry = self.backend.get(key)
+                if entry is not None:
+                    body, mimetype, headers = entry
+                    response = Response(body, status=200, mimetype=mimetype, headers=headers)
+                    return response.make_conditional(request)  # A 304 if the client has it
+
+                # Ids in the url such as '007' are tagged as '7', like the writes tag them
+                tag_args = {name: str(int(value)) if str(value).isdigit() else value
+                            for name, value in kwargs.items()}
+                tags = [template.format(**tag_args) for template in tag_templates]
+                # Taken before the view reads anything, so that a write committed
+                # while it runs keeps its possibly stale response out of the cache
+                generations = self.backend.generations(tags)
+
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    headers = [(name, value) for name, value in response.headers
+                               if name.lower() not in ('content-type', 'content-length')]
+                    self.backend.set(key, (response.get_data(), response.mimetype, headers), tags,
+                                     g.get('response_cache_ttl'), generations)
+                return response
+            return decorated
+        return decorator
+
+    def invalidate(self, *tags):
+        """Drop the cached responses that carry any of the tags"""
+        if self.backend is not None:
+            self.backend.invalidate_tags(tags)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        return self.backend.stats() if self.backend is not None else {}
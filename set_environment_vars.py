@@ -17,6 +17,8 @@ def set_environment_vars():
         os.environ['ESPRESSO_DB_PASSWORD'] = os.environ['ESPRESSO_TEST_DB_PASSWORD']
         os.environ['ESPRESSO_DB_HOST'] = os.environ['ESPRESSO_TEST_DB_HOST']
         os.environ['ESPRESSO_DB_DATABASE_NAME'] = os.environ['ESPRESSO_TEST_DB_DATABASE_NAME']
+        # A test that fails while holding locks should fail there, not cancel the statements of later tests
+        os.environ['ESPRESSO_DB_STATEMENT_TIMEOUT_MS'] = '0'
     except KeyError as ex:
         print("\nTesting requires these environment variables: " \
               "ESPRESSO_TEST_DB_USER  ESPRESSO_TEST_DB_PASSWORD  "
@@ -0,0 +1,180 @@
+import json
+import threading
+import time
+
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from auth0_tokens import JwksCache, VerifiedTokenCache
+
+
+def make_jwks(*kids):
+    """Build a JWKS document with one dummy RSA key per kid"""
+    return {'keys': [{'kty': 'RSA', 'kid': kid, 'use': 'sig', 'n': 'n-' + kid, 'e': 'AQAB'}
+                     for kid in kids]}
+
+
+class StubJwksServer:
+    """A local http server that serves a JWKS document and counts the requests"""
+
+    def __init__(self):
+        self.jwks = make_jwks('key-1')
+        self.cache_control = 'max-age=120'
+        self.status = 200
+        self.requests = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                body = json.dumps(stub.jwks).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                if stub.cache_control:
+                    self.send_header('Cache-Control', stub.cache_control)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/.well-known/jwks.json'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JwksCacheTestCases(unittest.TestCase):
+    """Test cases for the process-wide JWKS cache, using a local stub JWKS server"""
+
+    def setUp(self):
+        self.stub = StubJwksServer()
+        self.cache = JwksCache(self.stub.url, default_ttl=600, refresh_ahead=10,
+                               min_refetch_interval=30, fetch_timeout=2)
+
+    def tearDown(self):
+        self.stub.close()
+
+    def test_keys_are_cached(self):
+        """Test that repeated lookups fetch the JWKS only once"""
+        for _ in range(10):
+            self.assertEqual(self.cache.get_key('key-1')['n'], 'n-key-1')
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.hits, 9)
+
+    def test_cache_control_max_age_is_honored(self):
+        """Test that the keys expire after the Cache-Control max-age"""
+        self.stub.cache_control = 'public, max-age=300'
+        now = time.monotonic()
+        with mock.patch('auth0_tokens.time.monotonic', return_value=now):
+            self.cache.get_key('key-1')
+        self.assertAlmostEqual(self.cache._expires_at, now + 300, delta=1)
+
+        self.stub.jwks = make_jwks('key-2')
+        with mock.patch('auth0_tokens.time.monotonic', return_value=now + 301):
+            self.assertEqual(self.cache.get_key('key-2')['kid'], 'key-2')
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_default_ttl_without_cache_control(self):
+        """Test that the default ttl is used when there is no max-age"""
+        self.stub.cache_control = None
+        now = time.monotonic()
+        with mock.patch('auth0_tokens.time.monotonic', return_value=now):
+            self.cache.get_key('key-1')
+        self.assertAlmostEqual(self.cache._expires_at, now + 600, delta=1)
+
+    def test_unknown_kid_refetches_once(self):
+        """Test that an unknown kid causes one refetch to pick up rotated keys"""
+        self.cache.get_key('key-1')
+        self.stub.jwks = make_jwks('key-1', 'key-2')
+
+        now = time.monotonic()
+        with mock.patch('auth0_tokens.time.monotonic', return_value=now + 60):
+            self.assertEqual(self.cache.get_key('key-2')['kid'], 'key-2')
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        """Test that a burst of unknown kids does not stampede the JWKS endpoint"""
+        self.cache.get_key('key-1')
+        for i in range(20):
+            self.assertIsNone(self.cache.get_key(f'bogus-{i}'))
+        self.assertEqual(self.stub.requests, 1)
+
+    def test_stale_keys_served_when_fetch_fails(self):
+        """Test that expired keys continue to be served if the refetch fails"""
+        self.cache.get_key('key-1')
+        self.stub.status = 500
+
+        now = time.monotonic()
+        with mock.patch('auth0_tokens.time.monotonic', return_value=now + 1000):
+            self.assertEqual(self.cache.get_key('key-1')['kid'], 'key-1')
+        self.assertEqual(self.stub.requests, 2)
+        self.assertEqual(self.cache.fetch_errors, 1)
+
+    def test_background_refresh_before_expiry(self):
+        """Test that keys close to expiry are refreshed by a background thread"""
+        self.cache.get_key('key-1')
+        self.stub.jwks = make_jwks('key-1', 'key-2')
+
+        # Within refresh_ahead of expiry but past the refetch rate limit
+        with mock.patch('auth0_tokens.time.monotonic', return_value=self.cache._expires_at - 5):
+            self.assertEqual(self.cache.get_key('key-1')['kid'], 'key-1')
+            self.cache._refresh_thread.join(timeout=5)
+
+        self.assertEqual(self.stub.requests, 2)
+        self.assertIn('key-2', self.cache._keys)
+
+
+class VerifiedTokenCacheTestCases(unittest.TestCase):
+    """Test cases for the cache of verified access token claims"""
+
+    def setUp(self):
+        self.cache = VerifiedTokenCache(max_size=2)
+        self.exp = int(time.time()) + 3600
+
+    def test_cached_claims_and_scopes(self):
+        """Test that a verified token's claims and scope set are returned"""
+        claims = {'sub': 'someone', 'exp': self.exp, 'scope': 'read:restaurants read:reviews'}
+        scopes = self.cache.put('token-a', claims)
+        self.assertEqual(scopes, {'read:restaurants', 'read:reviews'})
+
+        cached_claims, cached_scopes = self.cache.get('token-a')
+        self.assertEqual(cached_claims, claims)
+        self.assertTrue('read:reviews' in cached_scopes)
+        self.assertIsNone(self.cache.get('token-b'))
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_entry_expires_at_token_exp(self):
+        """Test that a cached token is dropped once it has expired"""
+        self.cache.put('token-a', {'exp': self.exp})
+        with mock.patch('auth0_tokens.time.time', return_value=self.exp + 1):
+            self.assertIsNone(self.cache.get('token-a'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_token_without_exp_not_cached(self):
+        """Test that a token lacking an exp claim is never cached"""
+        self.cache.put('token-a', {'scope': 'read:restaurants'})
+        self.assertIsNone(self.cache.get('token-a'))
+
+    def test_least_recently_used_evicted(self):
+        """Test that the cache is bounded and evicts the least recently used token"""
+        self.cache.put('token-a', {'exp': self.exp})
+        self.cache.put('token-b', {'exp': self.exp})
+        self.cache.get('token-a')
+        self.cache.put('token-c', {'exp': self.exp})
+        self.assertIsNotNone(self.cache.get('token-a'))
+        self.assertIsNone(self.cache.get('token-b'))
+        self.assertIsNotNone(self.cache.get('token-c'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import gzip
+import json
+import unittest
+import zlib
+
+from flask import Flask, Response, jsonify, request
+
+from compression import Compression, brotli
+
+ROWS = [{'id': i, 'name': f'Restaurant {i}', 'city': 'Springfield'} for i in range(100)]
+
+
+class CompressionTestCases(unittest.TestCase):
+    """Test cases for the compression of responses"""
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.config['COMPRESSION_MIN_SIZE'] = 200
+        self.compression = Compression(app)
+
+        @app.route('/rows')
+        def rows():
+            response = jsonify(ROWS)
+            response.set_etag('v1-abc')
+            return response.make_conditional(request)
+
+        @app.route('/small')
+        def small():
+            return jsonify({'id': 1})
+
+        @app.route('/stream')
+        def stream():
+            def chunks():
+                for row in ROWS:
+                    yield json.dumps(row) + '\n'
+            return Response(chunks(), mimetype='application/x-ndjson')
+
+        self.client = app.test_client()
+
+    def test_gzip(self):
+        """Test that a large response is gzipped, with the encoding in its ETag"""
+        res = self.client.get('/rows', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(res.headers['ETag'], '"v1-abc-gzip"')
+        self.assertEqual(json.loads(gzip.decompress(res.data)), ROWS)
+        self.assertEqual(int(res.headers['Content-Length']), len(res.data))
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        """Test that brotli is used when the client accepts it"""
+        res = self.client.get('/rows', headers={'Accept-Encoding': 'gzip, deflate, br'})
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(res.data)), ROWS)
+
+    def test_not_accepted_or_small(self):
+        """Test that responses are not compressed if not accepted or below the minimum size"""
+        res = self.client.get('/rows')
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.headers['ETag'], '"v1-abc"')
+        self.assertEqual(json.loads(res.data), ROWS)
+        res = self.client.get('/small', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(json.loads(res.data), {'id': 1})
+
+    def test_conditional_request(self):
+        """Test that the ETag of a compressed response gets a 304 with the same ETag"""
+        res = self.client.get('/rows', headers={'Accept-Encoding': 'gzip', 'If-None-Match': '"v1-abc-gzip"'})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], '"v1-abc-gzip"')
+        res = self.client.get('/rows', headers={'If-None-Match': '"v1-abc"'})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], '"v1-abc"')
+        # The client has the gzipped response but would not get it now
+        res = self.client.get('/rows', headers={'If-None-Match': '"v1-abc-gzip"'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['ETag'], '"v1-abc"')
+
+    def test_stream_compressed_incrementally(self):
+        """Test that every chunk of a streamed response is compressed and flushed as it is sent"""
+        res = self.client.get('/stream', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', res.headers)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = iter(res.response)
+        # The first chunk decompresses to the first row without the rest of the stream
+        self.assertEqual(json.loads(decompressor.decompress(next(chunks))), ROWS[0])
+        rest = b''.join(decompressor.decompress(chunk) for chunk in chunks)
+        self.assertEqual([json.loads(line) for line in rest.splitlines()], ROWS[1:])
+        self.assertTrue(decompressor.eof)
+        res.close()
+
+    def test_disabled(self):
+        """Test that nothing is compressed when compression is disabled"""
+        self.compression.enabled = False
+        res = self.client.get('/rows', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', res.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
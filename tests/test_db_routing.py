@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+
+import unittest
+
+from flask import Flask, jsonify
+
+from db_routing import STICKY_COOKIE, ReplicaRouter, RoutingSQLAlchemy
+
+
+class ReplicaRoutingTestCases(unittest.TestCase):
+    """Test cases for routing the reads of read-only views to replicas,
+    with SQLite files standing in for the primary and two replicas
+    """
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.db_dir)
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.db_url('primary')
+        app.config['SQLALCHEMY_BINDS'] = {'replica_0': self.db_url('replica_0'),
+                                          'replica_1': self.db_url('replica_1')}
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db = RoutingSQLAlchemy(app)
+        router = ReplicaRouter(app, db)
+
+        # Each database has one row naming it, so responses tell where they were read
+        with app.app_context():
+            for bind in (None, 'replica_0', 'replica_1'):
+                engine = db.get_engine(bind=bind)
+                engine.execute('CREATE TABLE source (name VARCHAR(20))')
+                engine.execute('INSERT INTO source VALUES (?)', (bind or 'primary',))
+
+        @app.route('/read')
+        @router.read_only
+        def read():
+            return jsonify(db.session.execute('SELECT name FROM source').scalar())
+
+        @app.route('/write', methods=['POST'])
+        def write():
+            return jsonify(db.session.execute('SELECT name FROM source').scalar())
+
+        self.app = app
+        self.db = db
+        self.router = router
+        self.test_client = app.test_client()
+
+    def db_url(self, name):
+        return 'sqlite:///' + os.path.join(self.db_dir, name + '.db')
+
+    def read_sources(self, count):
+        return [self.test_client.get('/read').get_json() for _ in range(count)]
+
+    def test_reads_spread_over_replicas(self):
+        """Test that read-only views read from the replicas, round robin"""
+        self.assertEqual(sorted(self.read_sources(4)), ['replica_0', 'replica_0', 'replica_1', 'replica_1'])
+
+    def test_writes_use_primary(self):
+        """Test that views which are not read-only use the primary"""
+        self.assertEqual(self.test_client.post('/write').get_json(), 'primary')
+
+    def test_reads_after_write_use_primary(self):
+        """Test that a client reads its own writes from the primary until the sticky cookie expires"""
+        resp = self.test_client.post('/write')
+        self.assertIn(STICKY_COOKIE, resp.headers['Set-Cookie'])
+        self.assertEqual(self.read_sources(2), ['primary', 'primary'])
+
+        self.test_client.cookie_jar.clear()
+        self.assertNotIn('primary', self.read_sources(2))
+
+    def test_unhealthy_replica_left_out(self):
+        """Test that a failing replica is left out and its read is retried on the primary"""
+        replica_path = os.path.join(self.db_dir, 'replica_1.db')
+        os.remove(replica_path)
+        os.mkdir(replica_path)  # SQLite cannot open a directory as a database
+        with self.app.app_context():
+            self.db.get_engine(bind='replica_1').dispose()
+
+        sources = self.read_sources(4)
+        self.assertNotIn('replica_1', sources)
+        self.assertEqual(sources.count('primary'), 1)
+
+    def test_replica_statement_error_raised(self):
+        """Test that a statement failing on a replica that is up is not retried on the primary"""
+        with self.app.app_context():
+            self.db.get_engine(bind='replica_1').execute('DROP TABLE source')
+
+        responses = [self.test_client.get('/read') for _ in range(4)]
+        self.assertEqual(sorted(resp.status_code for resp in responses), [200, 200, 500, 500])
+        self.assertNotIn('replica_1', self.router._unhealthy_until)
+
+
+if __name__ == "__main__":
+    unittest.main()
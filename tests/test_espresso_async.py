@@ -0,0 +1,107 @@
+import json
+
+import unittest
+
+from set_environment_vars import set_environment_vars
+from get_auth0_token import auth_header_all_permissions
+from get_auth0_token import auth_header_cru_restaurants
+
+
+class EspressoAsyncTestCases(unittest.TestCase):
+    """Test cases for the async read endpoints of the ASGI variant of the app"""
+
+    def setUp(self):
+        """Set up the environment variables for testing, instantiate the
+        ASGI app, which starts its database connection pool, and the Flask
+        app it passes the other requests on to"""
+        set_environment_vars()
+
+        # The env vars must be set before the apps are imported, see test_restaurants.py
+        from starlette.testclient import TestClient
+
+        from espresso import db
+        from espresso import without_statement_timeout
+        from espresso import response_cache
+        from espresso import app
+        from espresso_async import app as async_app
+
+        self.flask_client = app.test_client()
+        self.client = TestClient(async_app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+
+        with without_statement_timeout():
+            db.drop_all()
+            db.create_all()
+        response_cache.clear()  # Cached responses would outlive the dropped tables
+
+    def add_restaurants_and_reviews(self):
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import Review
+
+        for i in range(3):
+            db.session.add(Restaurant(name=f'Restaurant {i}', city='Chicago', creator='test-user@gmail.com'))
+        db.session.commit()
+        db.session.add(Review(author='taster', rating=4, comment='Good', restaurant_id=1))
+        db.session.add(Review(author='taster', rating=2, comment='Meh', restaurant_id=2))
+        db.session.commit()
+
+    def assert_same_as_flask(self, url, headers):
+        """The async endpoint returns exactly the response of the Flask endpoint"""
+        resp = self.client.get(url, headers=headers)
+        flask_resp = self.flask_client.get(url, headers=headers)
+        self.assertEqual(resp.status_code, flask_resp.status_code)
+        self.assertEqual(json.loads(resp.content), json.loads(flask_resp.data))
+        self.assertEqual(resp.headers.get('ETag'), flask_resp.headers.get('ETag'))
+        return resp
+
+    def test_get_restaurants(self):
+        """Test that the async restaurant endpoints respond as the Flask ones do"""
+        self.add_restaurants_and_reviews()
+
+        resp = self.assert_same_as_flask('/api/v2/restaurants?limit=2', auth_header_cru_restaurants)
+        self.assertEqual(len(resp.json()['restaurants']), 2)
+        self.assert_same_as_flask('/api/v2/restaurants?sort=top_rated&fields=name', auth_header_cru_restaurants)
+        self.assert_same_as_flask('/api/v2/restaurants?ids=1,3,99', auth_header_cru_restaurants)
+        self.assert_same_as_flask('/api/v2/restaurants?embed=reviews', auth_header_all_permissions)
+        self.assert_same_as_flask('/api/v2/restaurants?ids=2,1&embed=reviews', auth_header_all_permissions)
+        self.assert_same_as_flask('/api/v2/restaurants?stream=json&embed=reviews', auth_header_all_permissions)
+        self.assert_same_as_flask('/api/v2/restaurants/2', auth_header_cru_restaurants)
+        self.assert_same_as_flask('/api/v2/restaurants/99', auth_header_cru_restaurants)
+
+    def test_get_reviews(self):
+        """Test that the async review endpoints respond as the Flask ones do"""
+        self.add_restaurants_and_reviews()
+
+        resp = self.assert_same_as_flask('/api/v2/reviews?min_rating=3', auth_header_all_permissions)
+        self.assertEqual([rev['rating'] for rev in resp.json()['reviews']], [4])
+        self.assert_same_as_flask('/api/v2/restaurants/2/reviews', auth_header_all_permissions)
+        self.assert_same_as_flask('/api/v2/reviews?min_rating=x', auth_header_all_permissions)
+
+    def test_get_restaurant_not_modified(self):
+        """Test that a conditional request gets 304 Not Modified until the restaurant changes"""
+        self.add_restaurants_and_reviews()
+
+        etag = self.client.get('/api/v2/restaurants/1', headers=auth_header_cru_restaurants).headers['ETag']
+        headers = dict(auth_header_cru_restaurants, **{'If-None-Match': etag})
+        resp = self.client.get('/api/v2/restaurants/1', headers=headers)
+        self.assertEqual(resp.status_code, 304)
+
+        # Writes are passed on to the Flask app
+        resp = self.client.put('/api/v2/restaurants/1', headers=auth_header_cru_restaurants,
+                               json={'name': 'Restaurant Renamed'})
+        self.assertEqual(resp.status_code, 200)
+        resp = self.client.get('/api/v2/restaurants/1', headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['restaurant']['name'], 'Restaurant Renamed')
+
+    def test_auth_required(self):
+        """Test that the async endpoints check the token and its scopes"""
+        resp = self.client.get('/api/v2/restaurants')
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.json()['success'], False)
+
+        # The restaurants token has no review scopes
+        resp = self.client.get('/api/v2/reviews', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 403)
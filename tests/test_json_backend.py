@@ -0,0 +1,78 @@
+import datetime
+import json
+import unittest
+import uuid
+
+from flask import Flask
+from flask.json import JSONEncoder
+from werkzeug.http import http_date as werkzeug_http_date
+
+from json_backend import JSONBackend, OrjsonEncoder, http_date, orjson
+
+
+@unittest.skipIf(orjson is None, 'orjson is not installed')
+class OrjsonEncoderTestCases(unittest.TestCase):
+    """Test cases for the orjson encoder, which must produce the same JSON as Flask's"""
+
+    def encode_both(self, obj, **kwargs):
+        return OrjsonEncoder(**kwargs).encode(obj), JSONEncoder(**kwargs).encode(obj)
+
+    def test_same_json_as_flask(self):
+        """Test that every type a response may hold is serialized as Flask serializes it"""
+        obj = {'name': 'Restaurant Français', 'rating': 4, 'avg_rating': 3.5, 'reviews': [], 'email': None,
+               'success': True, 'date': datetime.date(2020, 12, 16),
+               'deleted_at': datetime.datetime(2020, 12, 16, 13, 5, 9, tzinfo=datetime.timezone.utc),
+               'uuid': uuid.UUID(int=1), 'big': 2 ** 70, 1: 'key'}
+        fast, flask = self.encode_both(obj, sort_keys=False)
+        self.assertEqual(json.loads(fast), json.loads(flask))
+
+    def test_dates(self):
+        """Test that dates are HTTP dates, formatted exactly as werkzeug formats them"""
+        day = datetime.date(1999, 1, 1)
+        for _ in range(800):
+            self.assertEqual(http_date(day), werkzeug_http_date(day.timetuple()))
+            day += datetime.timedelta(days=13)
+        fast, flask = self.encode_both([datetime.date(2020, 12, 16)])
+        self.assertEqual(fast, '["Wed, 16 Dec 2020 00:00:00 GMT"]')
+        self.assertEqual(fast, flask)
+
+    def test_sort_keys_and_indent(self):
+        """Test that keys are sorted when asked and 2 space indents are kept"""
+        obj = {'b': 1, 'a': {'d': 2, 'c': 3}}
+        fast, flask = self.encode_both(obj, sort_keys=True, separators=(',', ':'))
+        self.assertEqual(fast, flask)
+        fast, flask = self.encode_both(obj, sort_keys=True, indent=2, separators=(',', ': '))
+        self.assertEqual(fast, flask)
+        # orjson cannot indent by 4, so the standard library serializes it
+        fast, flask = self.encode_both(obj, indent=4)
+        self.assertEqual(fast, flask)
+
+
+class JSONBackendTestCases(unittest.TestCase):
+    """Test cases for the choice of the JSON encoder of the app"""
+
+    def make_app(self, backend):
+        app = Flask(__name__)
+        app.config['JSON_BACKEND'] = backend
+        return app
+
+    def test_json_keeps_flask_encoder(self):
+        """Test that the json backend leaves Flask's encoder in place"""
+        app = self.make_app('json')
+        self.assertEqual(JSONBackend(app).name, 'json')
+        self.assertIs(app.json_encoder, JSONEncoder)
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_used_by_jsonify(self):
+        """Test that jsonify serializes with orjson once it is the backend"""
+        app = self.make_app('orjson')
+        self.assertEqual(JSONBackend(app).name, 'orjson')
+        with app.test_request_context():
+            from flask import jsonify
+            resp = jsonify({'date': datetime.date(2020, 12, 16), 'name': 'Café'})
+        self.assertEqual(json.loads(resp.data), {'date': 'Wed, 16 Dec 2020 00:00:00 GMT', 'name': 'Café'})
+
+    def test_invalid_backend(self):
+        """Test that an unknown backend is refused"""
+        with self.assertRaises(ValueError):
+            JSONBackend(self.make_app('simplejson'))
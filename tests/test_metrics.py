@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import tempfile
+
+import unittest
+
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy import exc as sqlalchemy_exc
+
+from metrics import InstrumentedQueuePool, Metrics, MetricsRegistry, archive_snapshot, registry
+
+
+class MetricsRegistryTestCases(unittest.TestCase):
+    """Test cases for the registry of counters and histograms and its text format"""
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.describe('test_requests_total', 'counter', 'Requests')
+        self.registry.describe('test_latency_seconds', 'histogram', 'Latency', buckets=(0.1, 1.0))
+
+    def test_counter(self):
+        """Test that a counter adds up per set of labels"""
+        self.registry.inc('test_requests_total', {'route': '/a'})
+        self.registry.inc('test_requests_total', {'route': '/a'}, 2)
+        self.registry.inc('test_requests_total', {'route': '/b'})
+        text = self.registry.render()
+        self.assertIn('# TYPE test_requests_total counter', text)
+        self.assertIn('test_requests_total{route="/a"} 3', text)
+        self.assertIn('test_requests_total{route="/b"} 1', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that histogram buckets count the observations up to their bound"""
+        for value in (0.05, 0.5, 5.0):
+            self.registry.observe('test_latency_seconds', value)
+        lines = self.registry.render().splitlines()
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('test_latency_seconds_sum 5.55', lines)
+        self.assertIn('test_latency_seconds_count 3', lines)
+
+    def test_label_values_escaped(self):
+        """Test that quotes in label values are escaped"""
+        self.registry.inc('test_requests_total', {'route': 'say "hi"'})
+        self.assertIn('test_requests_total{route="say \\"hi\\""} 1', self.registry.render())
+
+    def test_snapshots_of_processes_added_up(self):
+        """Test that /metrics adds up the snapshots written by other worker processes"""
+        multiproc_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, multiproc_dir)
+        self.registry.multiproc_dir = multiproc_dir
+
+        other = {'counters': [['test_requests_total', [['route', '/a']], 5]],
+                 'histograms': [['test_latency_seconds', [], [1, 0, 0.05, 1]]]}
+        with open(os.path.join(multiproc_dir, 'metrics_999999.json'), 'w') as snapshot_file:
+            json.dump(other, snapshot_file)
+
+        self.registry.inc('test_requests_total', {'route': '/a'})
+        self.registry.observe('test_latency_seconds', 0.5)
+        self.registry.write_snapshot(force=True)
+        self.assertTrue(os.path.exists(os.path.join(multiproc_dir, f'metrics_{os.getpid()}.json')))
+
+        lines = self.registry.render().splitlines()
+        self.assertIn('test_requests_total{route="/a"} 6', lines)
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_count 2', lines)
+
+    def test_snapshot_of_exited_process_archived(self):
+        """Test that the counters of an exited worker process stay in the totals once its snapshot is archived,
+        and that a new process with the same pid adds its own"""
+        multiproc_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, multiproc_dir)
+        self.registry.multiproc_dir = multiproc_dir
+        path = os.path.join(multiproc_dir, 'metrics_999999.json')
+
+        for snapshot_id, count, total in (('first', 5, 5), ('second', 2, 7)):
+            other = {'id': snapshot_id, 'pid': 999999, 'counters': [['test_requests_total', [['route', '/a']], count]],
+                     'gauges': [], 'histograms': []}
+            with open(path, 'w') as snapshot_file:
+                json.dump(other, snapshot_file)
+            self.assertIn(f'test_requests_total{{route="/a"}} {total}', self.registry.render().splitlines())
+            archive_snapshot(multiproc_dir, 999999)
+            self.assertFalse(os.path.exists(path))
+            self.assertIn(f'test_requests_total{{route="/a"}} {total}', self.registry.render().splitlines())
+
+        # A reader that still sees the snapshot of a folded worker skips it
+        with open(path, 'w') as snapshot_file:
+            json.dump(other, snapshot_file)
+        self.assertIn('test_requests_total{route="/a"} 7', self.registry.render().splitlines())
+
+    def test_gauges_of_processes_kept_apart(self):
+        """Test that the gauges of the worker processes are labeled with their pid rather than added up"""
+        multiproc_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, multiproc_dir)
+        self.registry.multiproc_dir = multiproc_dir
+        self.registry.describe('test_checked_out', 'gauge', 'Checked out')
+
+        other = {'pid': 999999, 'counters': [], 'gauges': [['test_checked_out', [], 4]], 'histograms': []}
+        with open(os.path.join(multiproc_dir, 'metrics_999999.json'), 'w') as snapshot_file:
+            json.dump(other, snapshot_file)
+        self.registry.add_collector(lambda: [('test_checked_out', {}, 1)])
+
+        lines = self.registry.render().splitlines()
+        self.assertIn('test_checked_out{pid="999999"} 4', lines)
+        self.assertIn(f'test_checked_out{{pid="{os.getpid()}"}} 1', lines)
+
+    def test_cache_hit_ratio(self):
+        """Test that cache hit ratios are computed from collected hits and misses"""
+        self.registry.add_collector(lambda: [('espresso_cache_hits_total', {'cache': 'test'}, 3),
+                                             ('espresso_cache_misses_total', {'cache': 'test'}, 1)])
+        self.assertIn('espresso_cache_hit_ratio{cache="test"} 0.75', self.registry.render())
+
+
+class InstrumentedQueuePoolTestCases(unittest.TestCase):
+    """Test cases for the metrics of the database connection pool"""
+
+    def test_saturation_and_timeout_counted(self):
+        """Test that a checkout taking the last connection, and one timing out, are counted"""
+        db_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, db_dir)
+        engine = create_engine('sqlite:///' + os.path.join(db_dir, 'pool.db'), poolclass=InstrumentedQueuePool,
+                               pool_size=1, max_overflow=1, pool_timeout=0.1)
+        counters, histograms = registry.collect()
+        saturated = counters.get(('espresso_db_pool_saturated_total', ()), 0)
+        timeouts = counters.get(('espresso_db_pool_timeouts_total', ()), 0)
+
+        connections = [engine.connect(), engine.connect()]
+        self.assertEqual(engine.pool.checkedout(), engine.pool.capacity())
+        with self.assertRaises(sqlalchemy_exc.TimeoutError):
+            engine.connect()
+        for conn in connections:
+            conn.close()
+
+        counters, histograms = registry.collect()
+        self.assertEqual(counters[('espresso_db_pool_saturated_total', ())], saturated + 1)
+        self.assertEqual(counters[('espresso_db_pool_timeouts_total', ())], timeouts + 1)
+
+
+class MetricsEndpointTestCases(unittest.TestCase):
+    """Test cases for the metrics of requests and the /metrics endpoint"""
+
+    def test_requests_counted_by_route(self):
+        """Test that requests are counted by route rather than url"""
+        app = Flask(__name__)
+        Metrics(app)
+
+        @app.route('/things/<thing_id>')
+        def thing(thing_id):
+            return thing_id
+
+        client = app.test_client()
+        client.get('/things/1')
+        client.get('/things/2')
+        resp = client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith('text/plain; version=0.0.4'))
+        text = resp.data.decode()
+        self.assertIn('espresso_http_requests_total{method="GET",route="/things/<thing_id>",status="200"} 2', text)
+        self.assertIn('espresso_http_request_duration_seconds_count{method="GET",route="/things/<thing_id>"} 2',
+                      text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+
+from flask import Flask, g
+from sqlalchemy import create_engine
+
+from query_stats import QueryBudgetExceeded, QueryStats, max_queries, redact_parameters
+
+
+class QueryStatsTestCases(unittest.TestCase):
+    """Test cases for the per-request statistics of SQL statements, using an in-memory SQLite database"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine('sqlite://')
+        cls.app = Flask(__name__)
+        cls.app.config['SLOW_QUERY_THRESHOLD_MS'] = 1000
+        cls.query_stats = QueryStats(cls.app)
+
+        @cls.app.route('/queries/<int:count>')
+        def run_queries(count):
+            with cls.engine.connect() as conn:
+                for _ in range(count):
+                    conn.execute('SELECT 1')
+            return str(g.query_stats.count)
+
+    def test_statements_counted_per_request(self):
+        """Test that each request counts only its own statements"""
+        client = self.app.test_client()
+        self.assertEqual(client.get('/queries/3').data, b'3')
+        self.assertEqual(client.get('/queries/1').data, b'1')
+
+    def test_server_timing_header(self):
+        """Test that the statistics are returned in a Server-Timing header"""
+        resp = self.app.test_client().get('/queries/2')
+        self.assertTrue(resp.headers['Server-Timing'].startswith('db;dur='))
+        self.assertIn('desc="2 queries"', resp.headers['Server-Timing'])
+        self.assertIn('db-slowest;dur=', resp.headers['Server-Timing'])
+
+    def test_slow_query_logged_redacted(self):
+        """Test that a slow statement is logged without its parameter values"""
+        with mock.patch.object(self.query_stats, 'slow_query_threshold', 0.0), \
+                mock.patch('query_stats.logging.warning') as warning:
+            with self.engine.connect() as conn:
+                conn.execute('SELECT ? AS secret', ('hunter2',))
+        message = warning.call_args[0][0]
+        self.assertIn('SELECT ? AS secret', message)
+        self.assertIn('<str>', message)
+        self.assertNotIn('hunter2', message)
+
+    def test_redact_parameters(self):
+        """Test redaction of named, positional and executemany parameters"""
+        self.assertEqual(redact_parameters({'name': 'Uno', 'id': 7, 'city': None}),
+                         {'name': '<str>', 'id': '<int>', 'city': None})
+        self.assertEqual(redact_parameters(('Uno', 7)), ('<str>', '<int>'))
+        self.assertEqual(redact_parameters([{'id': 1}, {'id': 2}]), [{'id': '<int>'}, {'id': '<int>'}])
+
+    def test_max_queries(self):
+        """Test that exceeding a query budget fails"""
+        with max_queries(2) as statements:
+            with self.engine.connect() as conn:
+                conn.execute('SELECT 1')
+        self.assertEqual(len(statements), 1)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            with max_queries(1):
+                with self.engine.connect() as conn:
+                    conn.execute('SELECT 1')
+                    conn.execute('SELECT 2')
+
+
+if __name__ == "__main__":
+    unittest.main()
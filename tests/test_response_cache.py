@@ -0,0 +1,100 @@
+import unittest
+from unittest import mock
+
+from flask import Flask, jsonify
+
+from response_cache import LRUCacheBackend, ResponseCache, load_backend
+
+
+class LRUCacheBackendTestCases(unittest.TestCase):
+    """Test cases for the in-process backend of the response cache"""
+
+    def setUp(self):
+        self.backend = LRUCacheBackend(max_entries=2, ttl=60)
+
+    def test_get_and_set(self):
+        """Test that a stored value is returned and the hit ratio counted"""
+        self.backend.set('key-a', 'value-a', ['restaurants'])
+        self.assertEqual(self.backend.get('key-a'), 'value-a')
+        self.assertIsNone(self.backend.get('key-b'))
+        self.assertEqual(self.backend.stats()['hit_ratio'], 0.5)
+
+    def test_invalidate_tags(self):
+        """Test that invalidating a tag drops only the values carrying it"""
+        self.backend.set('key-a', 'value-a', ['restaurants', 'restaurant:1'])
+        self.backend.set('key-b', 'value-b', ['restaurant:2'])
+        self.backend.invalidate_tags(['restaurant:1'])
+        self.assertIsNone(self.backend.get('key-a'))
+        self.assertEqual(self.backend.get('key-b'), 'value-b')
+
+    def test_ttl_expiry(self):
+        """Test that a value is dropped once its ttl has passed"""
+        self.backend.set('key-a', 'value-a', [], ttl=10)
+        with mock.patch('response_cache.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(self.backend.get('key-a'))
+
+    def test_least_recently_used_evicted(self):
+        """Test that the backend is bounded and evicts the least recently used value"""
+        self.backend.set('key-a', 'value-a', [])
+        self.backend.set('key-b', 'value-b', [])
+        self.backend.get('key-a')
+        self.backend.set('key-c', 'value-c', [])
+        self.assertIsNone(self.backend.get('key-b'))
+        self.assertEqual(self.backend.get('key-a'), 'value-a')
+        self.assertEqual(self.backend.stats()['evictions'], 1)
+
+    def test_set_after_invalidation_skipped(self):
+        """Test that a value computed before its tag was invalidated is not stored"""
+        generations = self.backend.generations(['restaurant:1'])
+        self.backend.invalidate_tags(['restaurant:1'])
+        self.backend.set('key-a', 'value-a', ['restaurant:1'], generations=generations)
+        self.assertIsNone(self.backend.get('key-a'))
+
+        generations = self.backend.generations(['restaurant:1'])
+        self.backend.invalidate_tags(['restaurant:2'])
+        self.backend.set('key-a', 'value-a', ['restaurant:1'], generations=generations)
+        self.assertEqual(self.backend.get('key-a'), 'value-a')
+
+    def test_load_backend(self):
+        """Test loading a backend class by its dotted path"""
+        backend = load_backend('response_cache.LRUCacheBackend', 5, 30)
+        self.assertIsInstance(backend, LRUCacheBackend)
+        self.assertEqual(backend.max_entries, 5)
+
+
+class ResponseCacheTestCases(unittest.TestCase):
+    """Test cases for the caching of the responses of views"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.cache = ResponseCache(self.app)
+        self.calls = 0
+        self.write_while_reading = False
+
+        @self.app.route('/things/<thing_id>')
+        @self.cache.cached('thing:{thing_id}')
+        def thing(thing_id):
+            self.calls += 1
+            if self.write_while_reading:
+                # A write commits, and invalidates, after the view has read the thing
+                self.write_while_reading = False
+                self.cache.invalidate(f'thing:{thing_id}')
+            return jsonify({'calls': self.calls})
+
+        self.client = self.app.test_client()
+
+    def test_response_cached(self):
+        """Test that a second request is served from the cache"""
+        self.client.get('/things/1')
+        self.assertEqual(self.client.get('/things/1').get_json(), {'calls': 1})
+
+    def test_response_computed_during_invalidation_not_cached(self):
+        """Test that a response read before a write's invalidation is not stored after it"""
+        self.write_while_reading = True
+        self.assertEqual(self.client.get('/things/1').get_json(), {'calls': 1})
+        self.assertEqual(self.client.get('/things/1').get_json(), {'calls': 2})
+        self.assertEqual(self.client.get('/things/1').get_json(), {'calls': 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
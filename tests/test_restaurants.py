@@ -1,6 +1,7 @@
 import json
 
 import unittest
+from unittest import mock
 
 from set_environment_vars import set_environment_vars
 from get_auth0_token import auth_header_cru_restaurants
@@ -20,8 +21,10 @@ class RestaurantsTestCases(unittest.TestCase):
         # still have their normal values when instantiating the app.
         from espresso import app
         from espresso import db
+        from espresso import without_statement_timeout
         from espresso import RESTAURANTS_API_BASE
         from espresso import DEF_MAX_STR_LEN
+        from espresso import response_cache
 
         self.app = app
         self.test_client = app.test_client()
@@ -30,8 +33,17 @@ class RestaurantsTestCases(unittest.TestCase):
         self.API_BASE = RESTAURANTS_API_BASE
         self.DEFAULT_MAX_STRING = DEF_MAX_STR_LEN
 
-        db.drop_all()
-        db.create_all()
+        with without_statement_timeout():
+            db.drop_all()
+            db.create_all()
+        response_cache.clear()  # Cached responses would outlive the dropped tables
+
+    def tearDown(self):
+        """End the session, whose reads after the last request would otherwise
+        hold locks that the drop_all of the next test waits on"""
+        from espresso import db
+
+        db.session.remove()
 
     def test_get_no_restaurants(self):
         """Test getting list of restaurants when there are none"""
@@ -63,6 +75,289 @@ class RestaurantsTestCases(unittest.TestCase):
         self.assertEqual(resp_dict['restaurants'][0]['name'], name_1)
         self.assertEqual(resp_dict['restaurants'][1]['name'], name_2)
 
+    def test_get_restaurants_paginated(self):
+        """Test getting the list of restaurants a page at a time using the cursor"""
+        from espresso import db
+        from espresso import Restaurant
+
+        for i in range(5):
+            db.session.add(Restaurant(name=f'Restaurant {i}', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '?limit=2', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual([rest['id'] for rest in resp_dict['restaurants']], [1, 2])
+        self.assertIsNotNone(resp_dict['next_cursor'])
+
+        resp = self.test_client.get(self.API_BASE + '?limit=2&cursor=' + resp_dict['next_cursor'],
+                                    headers=auth_header_cru_restaurants)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual([rest['id'] for rest in resp_dict['restaurants']], [3, 4])
+
+        resp = self.test_client.get(self.API_BASE + '?limit=2&cursor=' + resp_dict['next_cursor'],
+                                    headers=auth_header_cru_restaurants)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual([rest['id'] for rest in resp_dict['restaurants']], [5])
+        self.assertIsNone(resp_dict['next_cursor'])
+
+    def test_get_all_restaurants_unpaginated(self):
+        """Test getting the entire list of restaurants with the all flag"""
+        from espresso import db
+        from espresso import Restaurant
+
+        for i in range(5):
+            db.session.add(Restaurant(name=f'Restaurant {i}', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '?all=true&limit=2', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(len(resp_dict['restaurants']), 5)
+        self.assertIsNone(resp_dict['next_cursor'])
+
+    def test_get_restaurants_streamed(self):
+        """Test streaming the entire list of restaurants as json and as ndjson"""
+        from espresso import db
+        from espresso import Restaurant
+
+        for i in range(5):
+            db.session.add(Restaurant(name=f'Restaurant {i}', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '?stream=json', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['success'], True)
+        self.assertEqual([rest['name'] for rest in resp_dict['restaurants']],
+                         [f'Restaurant {i}' for i in range(5)])
+
+        resp = self.test_client.get(self.API_BASE + '?stream=ndjson', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        lines = resp.data.decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines],
+                         [f'Restaurant {i}' for i in range(5)])
+
+    def test_get_restaurants_sparse_fields(self):
+        """Test getting the list of restaurants with only some of the fields"""
+        from espresso import db
+        from espresso import Restaurant
+
+        db.session.add(Restaurant(name='Restaurant Italiano', city='Chicago', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '?fields=name,city', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurants'], [{'name': 'Restaurant Italiano', 'city': 'Chicago'}])
+
+        resp = self.test_client.get(self.API_BASE + '/1?fields=id,name', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurant'], {'id': 1, 'name': 'Restaurant Italiano'})
+
+    def test_get_restaurants_by_ids(self):
+        """Test looking up a batch of restaurants by id, some of which do not exist"""
+        from espresso import db
+        from espresso import Restaurant
+
+        for name in ('Restaurant Uno', 'Restaurant Due', 'Restaurant Tre'):
+            db.session.add(Restaurant(name=name, creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '?ids=3,1,7&fields=name', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurants'], {'1': {'name': 'Restaurant Uno'}, '3': {'name': 'Restaurant Tre'}})
+        self.assertEqual(resp_dict['not_found'], [7])
+
+    def test_get_restaurants_by_too_many_ids(self):
+        """Test a batch lookup of more restaurants than allowed"""
+        from espresso import MAX_BATCH_IDS
+
+        ids = ','.join(str(rest_id) for rest_id in range(1, MAX_BATCH_IDS + 2))
+        resp = self.test_client.get(self.API_BASE + '?ids=' + ids, headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_get_restaurants_embed_reviews(self):
+        """Test embedding the first reviews of each restaurant in the list"""
+        import datetime
+        from espresso import db
+        from espresso import Restaurant, Review
+
+        for name in ('Restaurant Uno', 'Restaurant Due'):
+            db.session.add(Restaurant(name=name, creator='test-user@gmail.com'))
+        db.session.commit()
+        for rating in range(1, 6):
+            db.session.add(Review(author='test-user@gmail.com', date=datetime.date(2020, 5, rating), rating=rating,
+                                  comment='Fine', restaurant_id=1))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '?embed=reviews&reviews_limit=2',
+                                    headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual([rev['rating'] for rev in resp_dict['restaurants'][0]['reviews']], [1, 2])
+        self.assertEqual(resp_dict['restaurants'][1]['reviews'], [])
+
+        resp = self.test_client.get(self.API_BASE + '/1?embed=reviews', headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(json.loads(resp.data)['restaurant']['reviews']), 5)
+
+        resp = self.test_client.get(self.API_BASE + '?ids=2,1&embed=reviews&reviews_limit=3',
+                                    headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual([rev['rating'] for rev in resp_dict['restaurants']['1']['reviews']], [1, 2, 3])
+        self.assertEqual(resp_dict['restaurants']['2']['reviews'], [])
+
+        # A streamed list does not embed reviews
+        resp = self.test_client.get(self.API_BASE + '?stream=ndjson&embed=reviews',
+                                    headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_update_invalidates_cached_responses(self):
+        """Test that an update through the API invalidates the cached responses of the restaurant and the list"""
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import response_cache
+
+        db.session.add(Restaurant(name='Restaurant Mexicano', city='Fresno', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        for _ in range(2):
+            resp = self.test_client.get(self.API_BASE + '/1', headers=auth_header_cru_restaurants)
+            self.assertEqual(json.loads(resp.data)['restaurant']['city'], 'Fresno')
+            resp = self.test_client.get(self.API_BASE, headers=auth_header_cru_restaurants)
+            self.assertEqual(json.loads(resp.data)['restaurants'][0]['city'], 'Fresno')
+        self.assertEqual(response_cache.stats()['hits'], 2)
+
+        headers = {'Content-Type': 'application/json'}
+        headers.update(auth_header_cru_restaurants)
+        resp = self.test_client.patch(self.API_BASE + '/1', headers=headers, data=json.dumps({'city': 'Oakland'}))
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.test_client.get(self.API_BASE + '/1', headers=auth_header_cru_restaurants)
+        self.assertEqual(json.loads(resp.data)['restaurant']['city'], 'Oakland')
+        resp = self.test_client.get(self.API_BASE, headers=auth_header_cru_restaurants)
+        self.assertEqual(json.loads(resp.data)['restaurants'][0]['city'], 'Oakland')
+        self.assertEqual(response_cache.stats()['hits'], 2)
+
+    def test_get_restaurants_embed_reviews_query_count(self):
+        """Test that embedding reviews takes the same number of queries however large the page is"""
+        import datetime
+        from sqlalchemy import event
+        from espresso import db
+        from espresso import Restaurant, Review
+        from espresso import response_cache
+
+        for i in range(20):
+            db.session.add(Restaurant(name=f'Restaurant {i}', creator='test-user@gmail.com'))
+        db.session.commit()
+        for i in range(60):
+            db.session.add(Review(author='test-user@gmail.com', date=datetime.date(2020, 5, 1), rating=1 + i % 5,
+                                  comment='Fine', restaurant_id=1 + i % 20))
+        db.session.commit()
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        query_counts = []
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            for limit in (2, 5, 20):
+                response_cache.clear()
+                statements.clear()
+                resp = self.test_client.get(self.API_BASE + f'?embed=reviews&reviews_limit=2&limit={limit}',
+                                            headers=auth_header_all_permissions)
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(len(json.loads(resp.data)['restaurants']), limit)
+                query_counts.append(len(statements))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        self.assertEqual(len(set(query_counts)), 1)
+
+    def test_get_restaurants_invalid_field(self):
+        """Test getting the list of restaurants with a field that does not exist"""
+        resp = self.test_client.get(self.API_BASE + '?fields=name,rating', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 400)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['success'], False)
+
+    def test_get_restaurants_bad_cursor(self):
+        """Test getting the list of restaurants with an invalid cursor"""
+        resp = self.test_client.get(self.API_BASE + '?cursor=bogus', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 400)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['success'], False)
+
+    def add_search_restaurants(self):
+        """Add restaurants to search, a name match, a street match and a city match"""
+        from espresso import db
+        from espresso import Restaurant
+
+        db.session.add(Restaurant(name='Pizza Palace', street='1 Main St', city='Springfield',
+                                  creator='test-user@gmail.com'))
+        db.session.add(Restaurant(name='Corner Cafe', street='2 Pizza Row', city='Shelbyville',
+                                  creator='test-user@gmail.com'))
+        db.session.add(Restaurant(name='Taco Town', street='3 Elm St', city='Springfield',
+                                  creator='test-user@gmail.com'))
+        db.session.commit()
+
+    def test_search_restaurants(self):
+        """Test searching restaurants by a word, a prefix and several words, the best matches first"""
+        self.add_search_restaurants()
+
+        for query, names in (('pizza', ['Pizza Palace', 'Corner Cafe']), ('piz', ['Pizza Palace', 'Corner Cafe']),
+                             ('elm taco', ['Taco Town']), ('burger', [])):
+            resp = self.test_client.get(self.API_BASE + f'/search?q={query}&fields=name',
+                                        headers=auth_header_cru_restaurants)
+            self.assertEqual(resp.status_code, 200)
+            resp_dict = json.loads(resp.data)
+            self.assertEqual(resp_dict['success'], True)
+            self.assertEqual(resp_dict['restaurants'], [{'name': name} for name in names])
+
+    def test_search_restaurants_misspelled_and_updated(self):
+        """Test that misspelled words match, and that updated restaurants are found by their new words"""
+        from espresso import db
+        from espresso import Restaurant
+
+        self.add_search_restaurants()
+        resp = self.test_client.get(self.API_BASE + '/search?q=piza', headers=auth_header_cru_restaurants)
+        self.assertEqual(json.loads(resp.data)['restaurants'][0]['name'], 'Pizza Palace')
+
+        Restaurant.query.get(3).city = 'Ogdenville'
+        db.session.commit()
+        resp = self.test_client.get(self.API_BASE + '/search?q=ogdenville', headers=auth_header_cru_restaurants)
+        self.assertEqual([rest['name'] for rest in json.loads(resp.data)['restaurants']], ['Taco Town'])
+
+    def test_search_restaurants_paginated(self):
+        """Test getting search results a page at a time using the cursor"""
+        self.add_search_restaurants()
+
+        names = []
+        cursor = ''
+        for _ in range(2):
+            resp = self.test_client.get(self.API_BASE + f'/search?q=pizza&limit=1{cursor}',
+                                        headers=auth_header_cru_restaurants)
+            self.assertEqual(resp.status_code, 200)
+            resp_dict = json.loads(resp.data)
+            names += [rest['name'] for rest in resp_dict['restaurants']]
+            cursor = f'&cursor={resp_dict["next_cursor"]}'
+        self.assertEqual(names, ['Pizza Palace', 'Corner Cafe'])
+        self.assertIsNone(resp_dict['next_cursor'])
+
+    def test_search_restaurants_invalid_query(self):
+        """Test searching restaurants without words to search for"""
+        for query in ('', '?q=', '?q=%20!!'):
+            resp = self.test_client.get(self.API_BASE + '/search' + query, headers=auth_header_cru_restaurants)
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(json.loads(resp.data)['success'], False)
+
     def test_get_restaurant_by_id(self):
         """Test getting a specific restaurant by its id number"""
         from espresso import db
@@ -78,6 +373,124 @@ class RestaurantsTestCases(unittest.TestCase):
         resp_dict = json.loads(resp.data)
         self.assertEqual(resp_dict['restaurant']['name'], name)
 
+    def test_get_restaurant_conditional(self):
+        """Test that a restaurant that has not changed since the client's ETag is not resent"""
+        from espresso import db
+        from espresso import Restaurant
+
+        db.session.add(Restaurant(name='Restaurant Greco', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '/1', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+
+        headers = {'If-None-Match': etag}
+        headers.update(auth_header_cru_restaurants)
+        resp = self.test_client.get(self.API_BASE + '/1', headers=headers)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b'')
+
+        # After an update the restaurant has a new ETag
+        put_headers = {'Content-Type': 'application/json'}
+        put_headers.update(auth_header_cru_restaurants)
+        self.test_client.put(self.API_BASE + '/1', headers=put_headers, data=json.dumps({'city': 'Athens'}))
+        resp = self.test_client.get(self.API_BASE + '/1', headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_get_restaurants_conditional(self):
+        """Test that the list of restaurants has an ETag that changes when a restaurant is added"""
+        from espresso import db
+        from espresso import Restaurant
+
+        db.session.add(Restaurant(name='Restaurant Greco', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE, headers=auth_header_cru_restaurants)
+        headers = {'If-None-Match': resp.headers['ETag']}
+        headers.update(auth_header_cru_restaurants)
+        resp = self.test_client.get(self.API_BASE, headers=headers)
+        self.assertEqual(resp.status_code, 304)
+
+        db.session.add(Restaurant(name='Restaurant Roma', creator='test-user@gmail.com'))
+        db.session.commit()
+        resp = self.test_client.get(self.API_BASE, headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(json.loads(resp.data)['restaurants']), 2)
+
+    def test_get_restaurants_page_conditional(self):
+        """Test that the ETag of a page of restaurants changes with the restaurants on it, and not others"""
+        from espresso import db
+        from espresso import Restaurant
+
+        for name in ('Restaurant Uno', 'Restaurant Due', 'Restaurant Tre'):
+            db.session.add(Restaurant(name=name, creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '?limit=2', headers=auth_header_cru_restaurants)
+        headers = {'If-None-Match': resp.headers['ETag']}
+        headers.update(auth_header_cru_restaurants)
+
+        put_headers = {'Content-Type': 'application/json'}
+        put_headers.update(auth_header_cru_restaurants)
+        self.test_client.put(self.API_BASE + '/3', headers=put_headers, data=json.dumps({'city': 'Roma'}))
+        resp = self.test_client.get(self.API_BASE + '?limit=2', headers=headers)
+        self.assertEqual(resp.status_code, 304)
+
+        self.test_client.put(self.API_BASE + '/2', headers=put_headers, data=json.dumps({'city': 'Roma'}))
+        resp = self.test_client.get(self.API_BASE + '?limit=2', headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)['restaurants'][1]['city'], 'Roma')
+
+    def test_get_restaurants_failed_replica(self):
+        """Test that the list of restaurants is read from the primary when the read replica fails"""
+        import os
+        import tempfile
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import replica_router
+
+        db.session.add(Restaurant(name='Restaurant Uno', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        # SQLite cannot open a directory as a database, so the replica fails to connect
+        replica_dir = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, replica_dir)
+        self.addCleanup(replica_router._unhealthy_until.clear)
+        self.addCleanup(setattr, replica_router, 'bind_keys', replica_router.bind_keys)
+        self.addCleanup(self.app.config.__setitem__, 'SQLALCHEMY_BINDS', self.app.config.get('SQLALCHEMY_BINDS'))
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica_0': 'sqlite:///' + replica_dir}
+        replica_router.bind_keys = ['replica_0']
+
+        resp = self.test_client.get(self.API_BASE, headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([rest['name'] for rest in json.loads(resp.data)['restaurants']], ['Restaurant Uno'])
+        self.assertIn('replica_0', replica_router._unhealthy_until)
+
+    def test_get_restaurant_query_budgets(self):
+        """Test that reading restaurants stays within its budget of queries"""
+        from espresso import db
+        from espresso import Restaurant
+        from query_stats import max_queries
+
+        db.session.add(Restaurant(name='Restaurant Uno', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        with max_queries(1):
+            resp = self.test_client.get(self.API_BASE + '/1', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('db;dur=', resp.headers['Server-Timing'])
+
+        # The ETag of the list comes from the page itself, not another query
+        with max_queries(1):
+            resp = self.test_client.get(self.API_BASE, headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+
+        with max_queries(1):
+            resp = self.test_client.get(self.API_BASE + '?ids=1,2', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+
     def test_get_restaurant_by_id_none(self):
         """Test getting a restaurant by a non-existent id number"""
         from espresso import db
@@ -226,6 +639,87 @@ class RestaurantsTestCases(unittest.TestCase):
         # The too-long name should not be in the message
         self.assertFalse(name in resp_dict['message'])
 
+    def test_bulk_create_restaurants(self):
+        """Test creating several restaurants in one request with per-item results"""
+        headers = {'Content-Type': 'application/json'}
+        headers.update(auth_header_cru_restaurants)
+        items = [{'name': 'Restaurant Uno', 'creator': 'nobody@gmail.com', 'city': 'Chicago'},
+                 {'city': 'Chicago', 'creator': 'nobody@gmail.com'},  # No name
+                 {'name': 'Restaurant Tre', 'creator': 'nobody@gmail.com'}]
+        resp = self.test_client.post(self.API_BASE + '/bulk', headers=headers, data=json.dumps(items))
+
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['success'], False)
+        self.assertEqual([result['success'] for result in resp_dict['results']], [True, False, True])
+        self.assertEqual([result['id'] for result in resp_dict['results']], [1, None, 2])
+
+        resp = self.test_client.get(self.API_BASE, headers=auth_header_cru_restaurants)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual([rest['name'] for rest in resp_dict['restaurants']], ['Restaurant Uno', 'Restaurant Tre'])
+
+    def test_bulk_upsert_restaurants_ndjson(self):
+        """Test upserting restaurants sent as NDJSON, matched on name, street and city"""
+        from espresso import db
+        from espresso import Restaurant
+
+        db.session.add(Restaurant(name='Restaurant Uno', city='Chicago', phone_num='312-555-0100',
+                                  creator='test-user@gmail.com'))
+        db.session.commit()
+
+        headers = {'Content-Type': 'application/x-ndjson'}
+        headers.update(auth_header_cru_restaurants)
+        lines = [json.dumps({'name': 'Restaurant Uno', 'city': 'Chicago', 'creator': 'nobody@gmail.com',
+                             'website': 'www.uno.com'}),
+                 json.dumps({'name': 'Restaurant Due', 'creator': 'nobody@gmail.com'})]
+        resp = self.test_client.post(self.API_BASE + '/bulk?upsert=true', headers=headers,
+                                     data='\n'.join(lines) + '\n')
+
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['success'], True)
+        self.assertEqual([result['id'] for result in resp_dict['results']], [1, 2])
+
+        resp = self.test_client.get(self.API_BASE + '/1', headers=auth_header_cru_restaurants)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurant']['website'], 'www.uno.com')
+        self.assertEqual(resp_dict['restaurant']['creator'], 'test-user@gmail.com')
+        # Fields the upsert did not supply keep their values
+        self.assertEqual(resp_dict['restaurant']['phone_num'], '312-555-0100')
+
+    def test_bulk_create_too_many(self):
+        """Test that a bulk create of too many restaurants writes none of a JSON array, and the first of NDJSON"""
+        def restaurant_names():
+            # Read through the API, whose request ends its session, rather than leave a transaction open here
+            resp = self.test_client.get(self.API_BASE, headers=auth_header_cru_restaurants)
+            return [rest['name'] for rest in json.loads(resp.data)['restaurants']]
+
+        items = [{'name': f'Restaurant {i}', 'creator': 'nobody@gmail.com'} for i in range(3)]
+        headers = {'Content-Type': 'application/json'}
+        headers.update(auth_header_cru_restaurants)
+        with mock.patch('espresso.BULK_MAX_ITEMS', 2):
+            resp = self.test_client.post(self.API_BASE + '/bulk', headers=headers, data=json.dumps(items))
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(restaurant_names(), [])
+
+        headers['Content-Type'] = 'application/x-ndjson'
+        with mock.patch('espresso.BULK_MAX_ITEMS', 2):
+            resp = self.test_client.post(self.API_BASE + '/bulk', headers=headers,
+                                         data=''.join(json.dumps(item) + '\n' for item in items))
+        self.assertEqual(resp.status_code, 207)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['success'], False)
+        self.assertEqual([result['index'] for result in resp_dict['results']], [0, 1])
+        self.assertEqual(restaurant_names(), ['Restaurant 0', 'Restaurant 1'])
+
+    def test_bulk_create_not_array(self):
+        """Test a bulk create whose content is not an array"""
+        headers = {'Content-Type': 'application/json'}
+        headers.update(auth_header_cru_restaurants)
+        info = {'name': 'Restaurant Uno', 'creator': 'nobody@gmail.com'}
+        resp = self.test_client.post(self.API_BASE + '/bulk', headers=headers, data=json.dumps(info))
+        self.assertEqual(resp.status_code, 400)
+
     def test_update_restaurant(self):
         """Test update of an existing restaurant's website and email address"""
         from espresso import db
@@ -290,6 +784,107 @@ class RestaurantsTestCases(unittest.TestCase):
         resp = self.test_client.put(self.API_BASE + '/1', headers=headers, data=json.dumps(info))
         self.assertEqual(resp.status_code, 400)
 
+    def test_update_restaurant_not_found(self):
+        """Test update of a restaurant that does not exist"""
+        headers = {'Content-Type': 'application/json'}
+        headers.update(auth_header_cru_restaurants)
+        info = {'name': 'Restaurant Fantasma'}
+        resp = self.test_client.put(self.API_BASE + '/1', headers=headers, data=json.dumps(info))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_update_restaurant_increments_version(self):
+        """Test that an update changes only the fields supplied and increments the version"""
+        from espresso import db
+        from espresso import Restaurant
+
+        db.session.add(Restaurant(name='Restaurant Mexicano', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        headers = {'Content-Type': 'application/json'}
+        headers.update(auth_header_cru_restaurants)
+        info = {'city': 'Oakland', 'creator': 'someone-else@gmail.com'}
+        resp = self.test_client.put(self.API_BASE + '/1', headers=headers, data=json.dumps(info))
+
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurant']['city'], 'Oakland')
+        self.assertEqual(resp_dict['restaurant']['name'], 'Restaurant Mexicano')
+        self.assertEqual(resp_dict['restaurant']['creator'], 'test-user@gmail.com')
+        self.assertEqual(resp_dict['restaurant']['version'], 2)
+
+    def test_update_restaurant_nothing_to_set(self):
+        """Test that an update without fields returns the restaurant unchanged, version included"""
+        from espresso import db
+        from espresso import Restaurant
+
+        db.session.add(Restaurant(name='Restaurant Mexicano', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        headers = {'Content-Type': 'application/json'}
+        headers.update(auth_header_cru_restaurants)
+        resp = self.test_client.put(self.API_BASE + '/1', headers=headers, data=json.dumps({}))
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurant']['name'], 'Restaurant Mexicano')
+        self.assertEqual(resp_dict['restaurant']['version'], 1)
+
+        resp = self.test_client.put(self.API_BASE + '/2', headers=headers, data=json.dumps({}))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_patch_restaurant_if_match(self):
+        """Test that a patch with a stale If-Match fails with 412 instead of overwriting"""
+        from espresso import db
+        from espresso import Restaurant
+
+        db.session.add(Restaurant(name='Restaurant Mexicano', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '/1', headers=auth_header_cru_restaurants)
+        etag = resp.headers['ETag']
+
+        headers = {'Content-Type': 'application/json', 'If-Match': etag}
+        headers.update(auth_header_cru_restaurants)
+        resp = self.test_client.patch(self.API_BASE + '/1', headers=headers, data=json.dumps({'city': 'Oakland'}))
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurant']['city'], 'Oakland')
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+        # The same ETag is now stale
+        resp = self.test_client.patch(self.API_BASE + '/1', headers=headers, data=json.dumps({'city': 'Fresno'}))
+        self.assertEqual(resp.status_code, 412)
+
+        resp = self.test_client.get(self.API_BASE + '/1', headers=auth_header_cru_restaurants)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurant']['city'], 'Oakland')
+
+    def test_patch_restaurant_if_match_other_url(self):
+        """Test that If-Match only accepts the ETag of the restaurant itself, not of another url"""
+        from espresso import db
+        from espresso import Restaurant
+
+        db.session.add(Restaurant(name='Restaurant Mexicano', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '/1?fields=name', headers=auth_header_cru_restaurants)
+        self.assertEqual(resp.status_code, 200)
+        headers = {'Content-Type': 'application/json', 'If-Match': resp.headers['ETag']}
+        headers.update(auth_header_cru_restaurants)
+        resp = self.test_client.patch(self.API_BASE + '/1', headers=headers, data=json.dumps({'city': 'Oakland'}))
+        self.assertEqual(resp.status_code, 412)
+
+        # The ETag of the 412 response is the current one
+        headers['If-Match'] = resp.headers['ETag']
+        resp = self.test_client.patch(self.API_BASE + '/1', headers=headers, data=json.dumps({'city': 'Oakland'}))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_patch_restaurant_not_found(self):
+        """Test a patch of a restaurant that does not exist"""
+        headers = {'Content-Type': 'application/json', 'If-Match': '"v1-0123456789ab"'}
+        headers.update(auth_header_cru_restaurants)
+        resp = self.test_client.patch(self.API_BASE + '/1', headers=headers, data=json.dumps({'city': 'Oakland'}))
+        self.assertEqual(resp.status_code, 404)
+
     def test_update_restaurant_unauthorized(self):
         """Test put request that lacks authorization header"""
         from espresso import db
@@ -324,6 +919,43 @@ class RestaurantsTestCases(unittest.TestCase):
         resp_dict = json.loads(resp.data)
         self.assertEqual(resp_dict['success'], False)
 
+    def test_delete_restaurant_with_reviews(self):
+        """Test that deleting a restaurant deletes its reviews too"""
+        import datetime
+        from espresso import db
+        from espresso import Restaurant, Review
+
+        db.session.add(Restaurant(name='Restaurant Greco', creator='test-user@gmail.com'))
+        db.session.commit()
+        for _ in range(3):
+            db.session.add(Review(author='test-user@gmail.com', date=datetime.date(2020, 5, 1), rating=4,
+                                  comment='Fine', restaurant_id=1))
+        db.session.commit()
+
+        resp = self.test_client.delete(self.API_BASE + '/1', headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Review.query.count(), 0)
+
+    def test_delete_restaurant_async(self):
+        """Test that an asynchronous delete hides the restaurant until it is purged"""
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import purge_deleted_restaurants
+
+        db.session.add(Restaurant(name='Restaurant Greco', creator='test-user@gmail.com'))
+        db.session.commit()
+
+        resp = self.test_client.delete(self.API_BASE + '/1?async=true', headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 202)
+
+        resp = self.test_client.get(self.API_BASE + '/1', headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 404)
+        resp = self.test_client.get(self.API_BASE, headers=auth_header_all_permissions)
+        self.assertEqual(len(json.loads(resp.data)['restaurants']), 0)
+
+        self.assertEqual(purge_deleted_restaurants(), 1)
+        self.assertEqual(Restaurant.query.count(), 0)
+
     def test_delete_restaurant_by_id_none(self):
         """Test deleting a restaurant by a non-existent id number"""
         # Since this is a freshly created table, there are no restaurants
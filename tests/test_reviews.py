@@ -4,6 +4,7 @@ import unittest
 
 from set_environment_vars import set_environment_vars
 from get_auth0_token import auth_header_crud_reviews
+from get_auth0_token import auth_header_all_permissions
 
 
 class ReviewsTestCases(unittest.TestCase):
@@ -19,9 +20,11 @@ class ReviewsTestCases(unittest.TestCase):
         # still have their normal values when instantiating the app.
         from espresso import app
         from espresso import db
+        from espresso import without_statement_timeout
         from espresso import REVIEWS_API_BASE
         from espresso import DEF_MAX_STR_LEN
         from espresso import MAX_COMMENT_LEN
+        from espresso import response_cache
 
         self.app = app
         self.test_client = app.test_client()
@@ -31,8 +34,17 @@ class ReviewsTestCases(unittest.TestCase):
         self.DEF_MAX_STR_LEN = DEF_MAX_STR_LEN
         self.MAX_COMMENT_LEN = MAX_COMMENT_LEN
 
-        db.drop_all()
-        db.create_all()
+        with without_statement_timeout():
+            db.drop_all()
+            db.create_all()
+        response_cache.clear()  # Cached responses would outlive the dropped tables
+
+    def tearDown(self):
+        """End the session, whose reads after the last request would otherwise
+        hold locks that the drop_all of the next test waits on"""
+        from espresso import db
+
+        db.session.remove()
 
     def test_get_no_reviews(self):
         """Test getting list of all reviews when there are none"""
@@ -70,6 +82,146 @@ class ReviewsTestCases(unittest.TestCase):
         self.assertEqual(resp_dict['reviews'][0]['author'], author_1)
         self.assertEqual(resp_dict['reviews'][1]['author'], author_2)
 
+    def test_get_reviews_paginated(self):
+        """Test getting the list of reviews a page at a time using the cursor"""
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import Review
+
+        db.session.add(Restaurant(name='Restaurant Reveille', creator='test-user@gmail.com'))
+        db.session.commit()
+        for i in range(3):
+            db.session.add(Review(author=f'Author {i}', date='2020-12-16', rating=4, restaurant_id=1))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '?limit=2', headers=auth_header_crud_reviews)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(len(resp_dict['reviews']), 2)
+
+        resp = self.test_client.get(self.API_BASE + '?limit=2&cursor=' + resp_dict['next_cursor'],
+                                    headers=auth_header_crud_reviews)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(len(resp_dict['reviews']), 1)
+        self.assertEqual(resp_dict['reviews'][0]['author'], 'Author 2')
+        self.assertIsNone(resp_dict['next_cursor'])
+
+    def test_get_reviews_of_restaurant(self):
+        """Test getting the reviews of one restaurant, optionally filtered"""
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import Review
+
+        db.session.add(Restaurant(name='Restaurant Reveille', creator='test-user@gmail.com'))
+        db.session.add(Restaurant(name='Restaurant Nocturne', creator='test-user@gmail.com'))
+        db.session.commit()
+        db.session.add(Review(author='Dina', date='2020-12-16', rating=3, restaurant_id=1))
+        db.session.add(Review(author='Terri', date='2020-12-20', rating=5, restaurant_id=2))
+        db.session.add(Review(author='Terri', date='2020-12-31', rating=5, restaurant_id=1))
+        db.session.commit()
+
+        resp = self.test_client.get('/api/v2/restaurants/1/reviews', headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual([rev['id'] for rev in resp_dict['reviews']], [1, 3])
+
+        resp = self.test_client.get('/api/v2/restaurants/1/reviews?min_rating=4',
+                                    headers=auth_header_all_permissions)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual([rev['id'] for rev in resp_dict['reviews']], [3])
+
+        resp = self.test_client.get('/api/v2/restaurants/3/reviews', headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_get_reviews_filtered(self):
+        """Test filtering the list of all reviews by author and date range"""
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import Review
+
+        db.session.add(Restaurant(name='Restaurant Reveille', creator='test-user@gmail.com'))
+        db.session.commit()
+        db.session.add(Review(author='Dina', date='2020-12-16', rating=3, restaurant_id=1))
+        db.session.add(Review(author='Terri', date='2020-12-20', rating=4, restaurant_id=1))
+        db.session.add(Review(author='Terri', date='2021-01-05', rating=5, restaurant_id=1))
+        db.session.commit()
+
+        resp = self.test_client.get(self.API_BASE + '?author=Terri&date_from=2020-12-01&date_to=2020-12-31',
+                                    headers=auth_header_crud_reviews)
+        self.assertEqual(resp.status_code, 200)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual([rev['id'] for rev in resp_dict['reviews']], [2])
+
+        resp = self.test_client.get(self.API_BASE + '?date_from=yesterday', headers=auth_header_crud_reviews)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_get_reviews_of_deleted_restaurant(self):
+        """Test that the reviews of a restaurant deleted asynchronously are hidden until it is purged"""
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import Review
+
+        db.session.add(Restaurant(name='Restaurant Reveille', creator='test-user@gmail.com'))
+        db.session.add(Restaurant(name='Restaurant Nocturne', creator='test-user@gmail.com'))
+        db.session.commit()
+        db.session.add(Review(author='Dina', date='2020-12-16', rating=3, restaurant_id=1))
+        db.session.add(Review(author='Terri', date='2020-12-20', rating=5, restaurant_id=2))
+        db.session.commit()
+
+        resp = self.test_client.delete('/api/v2/restaurants/2?async=true', headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 202)
+
+        resp = self.test_client.get(self.API_BASE, headers=auth_header_crud_reviews)
+        self.assertEqual([rev['id'] for rev in json.loads(resp.data)['reviews']], [1])
+        resp = self.test_client.get(self.API_BASE + '?stream=ndjson', headers=auth_header_crud_reviews)
+        self.assertEqual([json.loads(line)['id'] for line in resp.data.splitlines()], [1])
+
+    def test_restaurant_rating_aggregates(self):
+        """Test that a restaurant's rating aggregates follow its reviews"""
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import Review
+
+        db.session.add(Restaurant(name='Restaurant Reveille', creator='test-user@gmail.com'))
+        db.session.commit()
+        db.session.add(Review(author='Dina', date='2020-12-16', rating=3, restaurant_id=1))
+        db.session.add(Review(author='Terri', date='2020-12-31', rating=5, restaurant_id=1))
+        db.session.add(Review(author='Carl', date='2020-12-31', rating=5, restaurant_id=1))
+        db.session.commit()
+        db.session.delete(Review.query.get(3))
+        db.session.commit()
+
+        resp = self.test_client.get('/api/v2/restaurants/1', headers=auth_header_all_permissions)
+        self.assertEqual(resp.status_code, 200)
+        rest_item = json.loads(resp.data)['restaurant']
+        self.assertEqual(rest_item['rating_count'], 2)
+        self.assertEqual(rest_item['avg_rating'], 4.0)
+        self.assertEqual(rest_item['rating_3_count'], 1)
+        self.assertEqual(rest_item['rating_5_count'], 1)
+
+    def test_restaurants_top_rated(self):
+        """Test listing restaurants with the top rated first"""
+        from espresso import db
+        from espresso import Restaurant
+        from espresso import Review
+
+        for name in ('Restaurant Low', 'Restaurant High', 'Restaurant Middle'):
+            db.session.add(Restaurant(name=name, creator='test-user@gmail.com'))
+        db.session.commit()
+        for restaurant_id, rating in ((1, 2), (2, 5), (3, 4)):
+            db.session.add(Review(author='Dina', date='2020-12-16', rating=rating, restaurant_id=restaurant_id))
+        db.session.commit()
+
+        resp = self.test_client.get('/api/v2/restaurants?sort=top_rated&fields=name&limit=2',
+                                    headers=auth_header_all_permissions)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurants'], [{'name': 'Restaurant High'}, {'name': 'Restaurant Middle'}])
+
+        resp = self.test_client.get('/api/v2/restaurants?sort=top_rated&fields=name&limit=2&cursor='
+                                    + resp_dict['next_cursor'], headers=auth_header_all_permissions)
+        resp_dict = json.loads(resp.data)
+        self.assertEqual(resp_dict['restaurants'], [{'name': 'Restaurant Low'}])
+
 
 if __name__ == "__main__":
     unittest.main()